@@ -0,0 +1,205 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from datetime import datetime
+
+from pydantic import ValidationError
+
+from api.endpoint import QueryInput, _log_query_result, _sse
+from config import Config
+from database.document_registry import get_document_registry
+from rag.async_llm import AsyncOllamaClient, GenerationLimiter, GenerationQueueFull
+from rag.chain import cache_answer, prepare_rag_context
+from rag.output_parser import parse_llm_output, StreamingCitationParser
+from utils.metrics import collect_timings, registry, span
+from utils.singleflight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+class AsyncQueryHandler:
+    """
+    ASGI handler for POST /api/query with the same request and response format as the Flask view.
+    The request never holds a thread while waiting on Ollama: the question is embedded and the
+    answer generated through httpx.AsyncClient, behind a GenerationLimiter. Registry matching and
+    retrieval (Chroma, BM25, answer cache) are short and run on a bounded thread pool inside a
+    Flask app context, reusing prepare_rag_context unchanged. Identical in-flight question
+    embeddings and generations (same prompt) are shared between requests, so only the first
+    of a duplicate burst takes a generation slot.
+    """
+
+    def __init__(self, flask_app, ollama=None, limiter=None, executor=None):
+        self.flask_app = flask_app
+        self.ollama = ollama or AsyncOllamaClient(
+            Config.OLLAMA_BASE_URL, Config.OLLAMA_MODEL, Config.EMBEDDING_MODEL,
+            max_connections=Config.OLLAMA_POOL_SIZE,
+            connect_timeout=Config.OLLAMA_CONNECT_TIMEOUT, read_timeout=Config.OLLAMA_READ_TIMEOUT,
+            keep_alive=Config.OLLAMA_KEEP_ALIVE,
+            max_retries=Config.EMBEDDING_MAX_RETRIES, backoff=Config.EMBEDDING_RETRY_BACKOFF,
+        )
+        self.limiter = limiter or GenerationLimiter(
+            Config.LLM_MAX_CONCURRENT_GENERATIONS, Config.LLM_MAX_QUEUED_GENERATIONS, Config.LLM_QUEUE_TIMEOUT
+        )
+        self.executor = executor or ThreadPoolExecutor(Config.ASYNC_RETRIEVAL_THREADS, thread_name_prefix="retrieval")
+        self._embedding_flight = AsyncSingleFlight("embedding")
+        self._generation_flight = AsyncSingleFlight("generation")
+        registry.register_collector(self._gauges)
+
+    def _gauges(self):
+        return [("rag_llm_generations", "LLM generation slots on the async query path", {"state": name}, value)
+                for name, value in self.limiter.stats().items()]
+
+    async def _run_sync(self, fn, *args, **kwargs):
+        """Run a blocking call on the retrieval pool, keeping contextvars (active timings) intact."""
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    def _prepare(self, question, target_files, query_embedding):
+        with self.flask_app.app_context():
+            return prepare_rag_context(question, target_files, query_embedding=query_embedding)
+
+    async def __call__(self, scope, receive, send):
+        start_time = datetime.utcnow()
+        body = await _read_body(receive)
+        try:
+            data = json.loads(body or b"null")
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await _send_json(send, 400, False, "Request body must be a JSON object")
+            return
+        try:
+            validated = QueryInput(**data)
+        except ValidationError as e:
+            await _send_json(send, 400, False, "; ".join(err.get("msg") for err in e.errors()))
+            return
+
+        question = validated.question
+        timings = {}
+        try:
+            with collect_timings(timings):
+                with span("match_files"):
+                    target_files = await self._run_sync(get_document_registry().match, question)
+                if not target_files:
+                    await _send_json(send, 400, False, "Question did not mention any existing PDF filename")
+                    return
+                with span("embed_question"):
+                    query_embedding = await self._embedding_flight.do(question, self.ollama.embed, question)
+                prepared = await self._run_sync(self._prepare, question, target_files, query_embedding)
+
+                if validated.stream:
+                    tokens = self._answer_tokens(prepared)
+                    try:
+                        # Wait for the first token (or a rejected generation slot) before responding,
+                        # so an overloaded server can still answer 503.
+                        first = await anext(tokens, None)
+                    except BaseException:
+                        await tokens.aclose()
+                        raise
+                    await self._stream(receive, send, question, target_files, prepared, start_time, timings,
+                                       first, tokens)
+                    return
+                answer = "".join([token async for token in self._answer_tokens(prepared)])
+                with span("parse_output"):
+                    parsed = parse_llm_output(answer)
+        except GenerationQueueFull as e:
+            await _send_json(send, 503, False, f"Too many queries waiting for the LLM, retry later ({e})")
+            return
+        except Exception:
+            logger.exception("Async query failed")
+            await _send_json(send, 500, False, "Query failed")
+            return
+        _log_query_result(question, target_files, prepared["context"], parsed, start_time, timings)
+        await _send_json(send, 200, True, "Query successful", {"filename": target_files, "answer": parsed["answer"]})
+
+    async def _generate_stream(self, prompt):
+        async with self.limiter.slot():
+            async with aclosing(self.ollama.stream(prompt)) as tokens:
+                async for token in tokens:
+                    yield token
+
+    async def _answer_tokens(self, prepared):
+        """The cached answer in one piece, or the tokens of the (possibly shared) generation."""
+        if prepared["cached_answer"] is not None:
+            yield prepared["cached_answer"]
+            return
+        parts = []
+        with span("generate"):
+            shared = self._generation_flight.stream(prepared["prompt"], self._generate_stream, prepared["prompt"])
+            async with aclosing(shared) as tokens:
+                async for token in tokens:
+                    parts.append(token)
+                    yield token
+        # Reached only when the stream ended with Ollama's "done": a cut-off or abandoned stream raises instead.
+        cache_answer(prepared, "".join(parts))
+
+    async def _stream(self, receive, send, question, target_files, prepared, start_time, timings, first, tokens):
+        """Server-sent events, as _stream_query in the Flask view; stops generating if the client goes away."""
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch_disconnect())
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        parser = StreamingCitationParser()
+
+        async def emit(token):
+            await _send_chunk(send, _sse("token", {"text": token}))
+            for citation in parser.feed(token):
+                await _send_chunk(send, _sse("citation", {"citation": citation}))
+
+        try:
+            async with aclosing(tokens):
+                if first is not None:
+                    await emit(first)
+                async for token in tokens:
+                    if disconnected.is_set():
+                        return
+                    await emit(token)
+            parsed = parser.finish()
+            await _send_chunk(send, _sse("done", {"filename": target_files, "answer": parsed["answer"],
+                                                  "citations": parsed["citations"]}))
+        except Exception as e:
+            await _send_chunk(send, _sse("error", {"msg": str(e)}))
+            return
+        finally:
+            watcher.cancel()
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        _log_query_result(question, target_files, prepared["context"], parsed, start_time, timings,
+                          endpoint="query_stream")
+
+    async def aclose(self):
+        await self.ollama.aclose()
+        self.executor.shutdown(wait=False)
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+async def _send_json(send, status, success, msg, data=None):
+    body = json.dumps({"success": success, "msg": msg, "data": data}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+async def _send_chunk(send, text):
+    await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
@@ -1,19 +1,33 @@
-from flask import Blueprint, request, jsonify, current_app
-from flasgger import swag_from
-from typing import Any, Dict
-from utils.pdf_processor import extract_text_from_pdf, chunk_text_with_metadata
-from utils.embedding import get_embeddings
-from database.chroma_client import get_chroma_client, add_embedding
-from rag.output_parser import parse_llm_output
-from rag.chain import run_rag_chain
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from api.swagger import swag_from
+from typing import Any, Dict, List
+from database.chroma_client import get_chroma_client, delete_document, delete_summaries
+from database.document_registry import get_document_registry
+from database.lexical_index import get_lexical_index
+from rag.output_parser import parse_llm_output, StreamingCitationParser
+from rag.chain import run_rag_chain, prepare_rag_context, answer_tokens, retrieve_many
+from rag.answer_cache import invalidate_cached_answers
+from ingest.jobs import get_ingest_queue
 from pydantic import  BaseModel, ValidationError, field_validator
-from database.mongo_client import get_mongo_client, log_query, get_logs
+from database.mongo_client import get_mongo_client, iter_logs, encode_log_cursor, aggregate_log_stats
+from database.log_sink import get_log_sink
+from utils.embedding import get_query_embeddings
+from utils.metrics import REQUEST_DURATION, collect_timings, span
+from config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-import os
-import tempfile
+import json
+import queue
 
 class QueryInput(BaseModel) :
   question: str
+  stream: bool = False
+
+class BatchQueryInput(BaseModel) :
+  questions: List[str]
+
+# Answers for /api/query/batch, shared by all batch requests so together they stay within the cap.
+_batch_executor = ThreadPoolExecutor(max_workers=Config.BATCH_MAX_CONCURRENT_GENERATIONS, thread_name_prefix="batch-generate")
 
 
 api = Blueprint('api', __name__)
@@ -31,12 +45,13 @@ api = Blueprint('api', __name__)
         }
     ],
     'responses': {
-        200: {'description': 'Documents uploaded successfully'} ,
-        400: {'description': 'Invalid request'}
+        202: {'description': 'Documents accepted; poll the returned job for ingestion progress'} ,
+        400: {'description': 'Invalid request'},
+        503: {'description': 'Ingest queue is full, retry later'}
     }
 })
 def upload_papers():
-    """Upload one or more PDF files and store their embeddings."""
+    """Upload one or more PDF files; extraction, embedding and storage run as a background job."""
     if 'files' not in request.files:
         return jsonify({"success": "false", "error": "No files part in the request"}), 400
 
@@ -44,49 +59,69 @@ def upload_papers():
     if not files:
         return jsonify({"success": "false", "error": "No files uploaded"}), 400
 
-    client = get_chroma_client()
-    collection_name = "papers"
-    doc_ids = []
-    temp_dir = tempfile.gettempdir()
-
-    for file in files:
-        filename = file.filename
-        filepath = os.path.join(temp_dir, filename)
-        file.save(filepath)
-
-        text = extract_text_from_pdf(filepath)
-        chunked = chunk_text_with_metadata(text, filename)
-        embeddings = get_embeddings([c["text"] for c in chunked])
+    try:
+        job = get_ingest_queue().submit(files)
+    except queue.Full:
+        return jsonify({"success": "false", "error": "Ingest queue is full, retry later"}), 503
 
-        for embedding, chunk in zip(embeddings, chunked):
-            metadata = chunk["metadata"]
-            doc_id = add_embedding(client, collection_name, embedding, metadata, document=chunk["text"])
-            doc_ids.append(doc_id)
+    return jsonify({
+        "success": "true",
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"{request.script_root}/api/papers/jobs/{job['id']}"
+    }), 202
 
-        os.remove(filepath)
+@api.route('/papers/jobs/<job_id>', methods=['GET'])
+@swag_from({
+    'parameters': [
+        {'in': 'path', 'name': 'job_id', 'type': 'string', 'required': True, 'description': 'Job id returned by POST /api/papers'}
+    ],
+    'responses': {
+        200: {'description': 'Job status and per-file progress (pages parsed, chunks embedded, chunks stored)'},
+        404: {'description': 'Job not found'}
+    }
+})
+def get_ingest_job(job_id):
+    """Report the status and progress of an ingestion job."""
+    job = get_ingest_queue().get(job_id)
+    if job is None:
+        return api_response(False, f"Job '{job_id}' not found", None, 404)
+    for entry in job["files"]:
+        entry.pop("path", None)
+    return api_response(True, "Job status", job, 200)
 
-    return jsonify({"success": "true", "document_ids": doc_ids}), 200
+@api.route('/papers/<path:filename>', methods=['DELETE'])
+@swag_from({
+    'parameters': [
+        {'in': 'path', 'name': 'filename', 'type': 'string', 'required': True, 'description': 'Name of the uploaded PDF'}
+    ],
+    'responses': {
+        200: {'description': 'Document deleted'},
+        404: {'description': 'Document not found'}
+    }
+})
+def delete_paper(filename):
+    """Delete an uploaded PDF and all of its chunks."""
+    registry = get_document_registry()
+    if filename not in registry.filenames():
+        return api_response(False, f"Document '{filename}' not found", None, 404)
+    delete_document(get_chroma_client(), "papers", filename)
+    if current_app.config.get("SUMMARY_INDEX_ENABLED"):
+        delete_summaries(get_chroma_client(), current_app.config["SUMMARY_COLLECTION"], filename)
+    removed = registry.remove(filename)
+    if current_app.config.get("HYBRID_SEARCH_ENABLED"):
+        with get_lexical_index().writing() as index:
+            index.remove_document(filename)
+    invalidate_cached_answers(filename)
+    return api_response(True, "Document deleted", {"filename": filename, "chunks_deleted": removed}, 200)
 
 class QueryInputWithPDF(QueryInput):
     @field_validator('question')
     def must_mention_existing_pdf(cls, v):
-        client = get_chroma_client()
-        try:
-            collection = client.get_collection("papers")
-            metadatas = collection.get(include=["metadatas"])["metadatas"]
-            filenames = {meta.get("filename") or meta.get("document_name") for meta in metadatas if meta}
-        except Exception:
-            filenames = set()
-
-        q_lower = v.lower()
-        for full in filenames:
-            if not full:
-                continue
-            name_lower = full.lower()
-            base = name_lower[:-4] if name_lower.endswith('.pdf') else name_lower
-            if base in q_lower or name_lower in q_lower:
-                return v
-        raise ValueError(f"No referenced file found among: {', '.join(filenames)}")
+        registry = get_document_registry()
+        if registry.match(v):
+            return v
+        raise ValueError(f"No referenced file found among: {', '.join(registry.filenames())}")
 
 def api_response(success: bool, msg: str, data: Any = None, status_code: int = 200):
     payload: Dict[str, Any] = {
@@ -110,11 +145,17 @@ def api_response(success: bool, msg: str, data: Any = None, status_code: int = 2
                     'question': {
                         'type': 'string',
                         'example': 'what are the main findings in the uploaded papers?'
+                    },
+                    'stream': {
+                        'type': 'boolean',
+                        'default': False,
+                        'description': 'Stream the answer as server-sent events (token, citation, done)'
                     }
                 }
             }
         }
     ],
+    'produces': ['application/json', 'text/event-stream'],
     'responses': {
         200: {'description': 'Query completed successfully'},
         400: {'description': 'Validation failed or question not found in uploaded files'}
@@ -131,50 +172,151 @@ def query_papers():
         return api_response(False, "; ".join(messages), None, 400)
 
     question = validated.question
-    # Ensure the question mentions at least one existing PDF filename
+    timings = {}
+    with collect_timings(timings):
+        # Ensure the question mentions at least one existing PDF filename
+        with span("match_files"):
+            target_files = get_document_registry().match(question)
+        if not target_files:
+            return api_response(False, "Question did not mention any existing PDF filename", None, 400)
+        if validated.stream:
+            return Response(stream_with_context(_stream_query(question, target_files, start_time, timings)),
+                            mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+        # Execute RAG chain
+        rag_result = run_rag_chain(question, target_files)
+        # Extract answer and full context
+        with span("parse_output"):
+            parsed = parse_llm_output(rag_result["llm_output"])
+    _log_query_result(question, target_files, rag_result.get("context", ""), parsed, start_time, timings)
+
+    return api_response(True, "Query successful", {"filename": target_files, "answer": parsed["answer"]}, 200)
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_query(question, target_files, start_time, timings):
+    """Yield the answer as server-sent events and log the query once the stream completes."""
+    try:
+        with collect_timings(timings):
+            prepared = prepare_rag_context(question, target_files)
+            parser = StreamingCitationParser()
+            for token in answer_tokens(prepared):
+                yield _sse("token", {"text": token})
+                for citation in parser.feed(token):
+                    yield _sse("citation", {"citation": citation})
+    except Exception as e:
+        yield _sse("error", {"msg": str(e)})
+        return
+    parsed = parser.finish()
+    yield _sse("done", {"filename": target_files, "answer": parsed["answer"], "citations": parsed["citations"]})
+    _log_query_result(question, target_files, prepared["context"], parsed, start_time, timings, endpoint="query_stream")
+
+@api.route('/query/batch', methods=['POST'])
+@swag_from({
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'in': 'body',
+            'name': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'questions': {
+                        'type': 'array',
+                        'items': {'type': 'string'},
+                        'example': ['What dataset does paper_a.pdf use?', 'Summarize the results of paper_b.pdf']
+                    }
+                }
+            }
+        }
+    ],
+    'produces': ['application/x-ndjson'],
+    'responses': {
+        200: {'description': 'One line per question as it finishes ({"index", "question", "success", "msg", "data"}), then a {"done": true} summary line'},
+        400: {'description': 'Validation failed or too many questions'}
+    }
+})
+def query_papers_batch():
+    """Answer many questions: filenames matched in one pass, questions embedded and retrieved in batches, answers generated in parallel."""
+    start_time = datetime.utcnow()
+    data = request.get_json(silent=True) or {}
+    try:
+        validated = BatchQueryInput(**data)
+    except ValidationError as e:
+        messages = [err.get("msg") for err in e.errors()]
+        return api_response(False, "; ".join(messages), None, 400)
+    questions = validated.questions
+    max_questions = current_app.config.get("BATCH_MAX_QUESTIONS", 500)
+    if not questions or len(questions) > max_questions:
+        return api_response(False, f"questions must hold between 1 and {max_questions} questions", None, 400)
+
+    timings = {}
+    with collect_timings(timings):
+        with span("match_files"):
+            target_files = get_document_registry().match_many(questions)
+    return Response(stream_with_context(_stream_batch(current_app._get_current_object(), questions, target_files, start_time, timings)),
+                    mimetype='application/x-ndjson')
+
+def _stream_batch(app, questions, target_files, start_time, timings):
+    """Yield one NDJSON result line per question as it completes, then a summary line."""
+    def line(index, success, msg, data=None):
+        return json.dumps({"index": index, "question": questions[index], "success": success, "msg": msg, "data": data}) + "\n"
+
+    pending = [i for i, files in enumerate(target_files) if files]
+    errors = len(questions) - len(pending)
+    for i, files in enumerate(target_files):
+        if not files:
+            yield line(i, False, "Question did not mention any existing PDF filename")
+
+    futures = {}
     try:
-        collection = get_chroma_client().get_collection("papers")
-        metadatas = collection.get(include=["metadatas"])["metadatas"]
-        filenames = {meta.get("filename") or meta.get("document_name") for meta in metadatas if meta}
-    except Exception:
-        filenames = set()
-    q_lower = question.lower()
-    match_found = False
-    for full in filenames:
-        if not full:
-            continue
-        name_lower = full.lower()
-        base = name_lower[:-4] if name_lower.endswith('.pdf') else name_lower
-        if base in q_lower or name_lower in q_lower:
-            match_found = True
-            break
-    if not match_found:
-        return api_response(False, "Question did not mention any existing PDF filename", None, 400)
-    client = get_chroma_client()
+        if pending:
+            with collect_timings(timings):
+                with span("embed_question"):
+                    embeddings = get_query_embeddings([questions[i] for i in pending])
+                with span("retrieve"):
+                    retrieved = retrieve_many(embeddings, [target_files[i] for i in pending])
+            futures = {
+                _batch_executor.submit(_answer_batch_question, app, questions[i], target_files[i], embedding, hits, timings): i
+                for i, embedding, hits in zip(pending, embeddings, retrieved)
+            }
+    except Exception as e:
+        errors = len(questions)
+        for i in pending:
+            yield line(i, False, f"Query failed: {e}")
     try:
-        collection = client.get_collection("papers")
-        metadatas = collection.get(include=["metadatas"])["metadatas"]
-        stored = [meta.get("filename") or meta.get("document_name") for meta in metadatas if meta]
-    except Exception:
-        stored = []
-
-    q_lower = question.lower()
-    matches = []
-    for full in stored:
-        if not full:
-            continue
-        name_lower = full.lower()
-        base = name_lower[:-4] if name_lower.endswith('.pdf') else name_lower
-        if name_lower in q_lower or base in q_lower:
-            matches.append(full)
-
-    target_files = list(dict.fromkeys(matches))
-    # Execute RAG chain
-    rag_result = run_rag_chain(question, target_files)
-    # Extract answer and full context
-    parsed = parse_llm_output(rag_result["llm_output"])
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                parsed, context, question_timings = future.result()
+            except Exception as e:
+                errors += 1
+                yield line(i, False, f"Query failed: {e}")
+                continue
+            _log_query_result(questions[i], target_files[i], context, parsed, start_time, question_timings, endpoint="query_batch")
+            yield line(i, True, "Query successful", {"filename": target_files[i], "answer": parsed["answer"]})
+    finally:
+        # The client went away: drop the questions that have not started yet.
+        for future in futures:
+            future.cancel()
+    yield json.dumps({"done": True, "questions": len(questions), "errors": errors,
+                      "duration_seconds": (datetime.utcnow() - start_time).total_seconds()}) + "\n"
+
+def _answer_batch_question(app, question, target_files, query_embedding, retrieved, batch_timings):
+    """Prompt and answer one batch question; its timings start from the batch's shared stages."""
+    timings = {"stages": dict(batch_timings.get("stages", {}))}
+    with app.app_context(), collect_timings(timings):
+        prepared = prepare_rag_context(question, target_files, query_embedding=query_embedding, retrieved=retrieved)
+        answer = "".join(answer_tokens(prepared))
+        with span("parse_output"):
+            parsed = parse_llm_output(answer)
+    return parsed, prepared["context"], timings
+
+def _log_query_result(question, target_files, raw_context, parsed, start_time, timings=None, endpoint="query"):
+    """Queue the query, answer and retrieved chunk labels for the Mongo query log."""
     # For logging, capture only chunk labels (e.g. [Document: x, Chunk: y])
-    raw_context = rag_result.get("context", "")
     chunk_labels = []
     if raw_context:
         entries = raw_context.split("\n\n")
@@ -183,29 +325,72 @@ def query_papers():
             if label:
                 chunk_labels.append(label)
     duration = (datetime.utcnow() - start_time).total_seconds()
+    REQUEST_DURATION.observe(duration, endpoint=endpoint)
+    timings = timings or {}
 
-    try:
-        mongo_client = get_mongo_client()
-        db = mongo_client[current_app.config.get('MONGO_DB_NAME', 'academic_rag')]
-        log_query(db, current_app.config.get('LOGS_COLLECTION', 'query_logs'), {
-            'timestamp': datetime.utcnow(),
-            'question': question,
-            # only store labels of retrieved chunks
-            'retrieved_chunks': chunk_labels,
-            'answer': parsed.get('answer'),
-            'citations': parsed.get('citations', []),
-            'metadata': None,
-            'performance': {'duration_seconds': duration}
-        })
-    except Exception:
-        # silence logging errors
-        pass
+    # Queued for the background flusher; the response never waits on Mongo.
+    get_log_sink().submit({
+        'timestamp': datetime.utcnow(),
+        'question': question,
+        'documents': target_files,
+        # only store labels of retrieved chunks
+        'retrieved_chunks': chunk_labels,
+        'answer': parsed.get('answer'),
+        'citations': parsed.get('citations', []),
+        'metadata': None,
+        'performance': {
+            'duration_seconds': duration,
+            # seconds per pipeline stage, e.g. match_files, embed_question, retrieve, build_prompt, generate
+            'stages': timings.get('stages', {}),
+            # prompt/generated token counts and tokens_per_second from Ollama, absent for cached answers
+            'tokens': timings.get('tokens'),
+            # single-flight groups (query, embedding, generation) this request joined instead of running
+            'coalesced': timings.get('coalesced', []),
+            # chunk and token counts before/after context packing, including tokens_saved
+            'context': timings.get('context'),
+            # "chunks" (retrieval) or "summaries" (broad question answered from the summary index)
+            'route': timings.get('route'),
+        }
+    })
 
-    return api_response(True, "Query successful", {"filename": target_files, "answer": parsed["answer"]}, 200)
+LOG_FIELDS = {'timestamp', 'question', 'documents', 'retrieved_chunks', 'answer', 'citations', 'metadata', 'performance'}
+LOG_BUCKETS = {'minute', 'hour', 'day', 'week', 'month'}
+
+def _log_time_filter():
+    """Build the timestamp filter from start_time/end_time; raises ValueError on bad input."""
+    start = request.args.get('start_time')
+    end = request.args.get('end_time')
+    filter_query = {}
+    if start:
+        filter_query.setdefault('timestamp', {})['$gte'] = datetime.fromisoformat(start)
+    if end:
+        filter_query.setdefault('timestamp', {})['$lte'] = datetime.fromisoformat(end)
+    return filter_query
+
+def _serialize_log(entry):
+    if '_id' in entry:
+        entry['_id'] = str(entry['_id'])
+    if 'timestamp' in entry and isinstance(entry['timestamp'], datetime):
+        entry['timestamp'] = entry['timestamp'].isoformat()
+    return entry
+
+def _logs_db():
+    return get_mongo_client()[current_app.config.get('MONGO_DB_NAME', 'academic_rag')]
+
+def _log_store_error(error):
+    """The response for a MongoDB error on a log route, or None if `error` is not one."""
+    from pymongo.errors import OperationFailure, PyMongoError  # imported on first use, like pymongo itself
+    if isinstance(error, OperationFailure) and error.code in (168, 15952):
+        # Unrecognized expression / unknown group operator: $dateTrunc and $percentile need a newer server.
+        return api_response(False, 'Log statistics need MongoDB 7.0 or later', None, 501)
+    if isinstance(error, PyMongoError):
+        current_app.logger.warning("Query log store unavailable: %s", error)
+        return api_response(False, 'Query log store unavailable, retry later', None, 503)
+    return None
 
 @api.route('/logs', methods=['GET'])
 @swag_from({
-    'description': 'Retrieves query logs. Both start_time and end_time are optional UTC ISO-8601 timestamps.',
+    'description': 'Retrieves query logs, newest first, one page at a time. Both start_time and end_time are optional UTC ISO-8601 timestamps.',
     'parameters': [
         {
             'in': 'query', 'name': 'start_time', 'required': False, 'description': '*Optional* Starting time filter UTC ISO-8601 timestamp'
@@ -213,38 +398,124 @@ def query_papers():
         {
             'in': 'query', 'name': 'end_time',
             'required': False, 'description': "*Optional* End time filter UTC ISO-8601 timestamp" 
+        },
+        {
+            'in': 'query', 'name': 'limit', 'type': 'integer', 'required': False,
+            'description': '*Optional* Page size (default LOGS_PAGE_SIZE, max LOGS_MAX_PAGE_SIZE)'
+        },
+        {
+            'in': 'query', 'name': 'cursor', 'required': False,
+            'description': '*Optional* next_cursor from the previous page'
+        },
+        {
+            'in': 'query', 'name': 'fields', 'required': False,
+            'description': '*Optional* Comma-separated fields to return, e.g. question,timestamp,performance'
+        },
+        {
+            'in': 'query', 'name': 'format', 'required': False, 'enum': ['json', 'ndjson'],
+            'description': '*Optional* ndjson streams one log per line, followed by a {"next_cursor": ...} line'
         }
     ],
     'responses': {
         200: {'description': 'Query logs retrieved'},
-        400: {'description': 'Invalid date format or bad request'}
+        400: {'description': 'Invalid date format or bad request'},
+        503: {'description': 'MongoDB unavailable'}
     }
 })
 def get_query_logs():
-    start = request.args.get('start_time')
-    end = request.args.get('end_time')
-    filter_query = {}
     try:
-        if start:
-            filter_query.setdefault('timestamp', {})['$gte'] = datetime.fromisoformat(start)
-        if end:
-            filter_query.setdefault('timestamp', {})['$lte'] = datetime.fromisoformat(end)
+        filter_query = _log_time_filter()
     except ValueError:
         return api_response(False, 'Invalid date format, use ISO format', None, 400)
 
-    client = get_mongo_client()
-    db = client[current_app.config.get('MONGO_DB_NAME', 'academic_rag')]
-    logs = get_logs(db, current_app.config.get('LOGS_COLLECTION', 'query_logs'), filter_query)
+    max_limit = current_app.config.get('LOGS_MAX_PAGE_SIZE', 1000)
+    try:
+        limit = int(request.args.get('limit', current_app.config.get('LOGS_PAGE_SIZE', 100)))
+    except ValueError:
+        return api_response(False, 'limit must be an integer', None, 400)
+    limit = max(1, min(limit, max_limit))
+
+    projection = None
+    fields = request.args.get('fields')
+    if fields:
+        requested = {f.strip() for f in fields.split(',') if f.strip()}
+        unknown = requested - LOG_FIELDS
+        if unknown:
+            return api_response(False, f"Unknown fields: {', '.join(sorted(unknown))}", None, 400)
+        projection = {f: 1 for f in requested}
 
-    safe_logs = []
-    for entry in logs:
-        if '_id' in entry:
-            entry['_id'] = str(entry['_id'])
-        if 'timestamp' in entry and isinstance(entry['timestamp'], datetime):
-            entry['timestamp'] = entry['timestamp'].isoformat()
-        safe_logs.append(entry)
+    try:
+        logs = iter_logs(_logs_db(), current_app.config.get('LOGS_COLLECTION', 'query_logs'),
+                         filter_query, projection=projection, limit=limit, cursor=request.args.get('cursor'))
+    except ValueError:
+        return api_response(False, 'Invalid cursor', None, 400)
+
+    ndjson = request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+    if ndjson:
+        def generate():
+            count, next_cursor = 0, None
+            try:
+                for entry in logs:
+                    count += 1
+                    next_cursor = encode_log_cursor(entry)
+                    yield json.dumps(_serialize_log(entry)) + "\n"
+            except Exception as e:
+                if _log_store_error(e) is None:
+                    raise
+                # The 200 status is already sent: end the stream with an error line instead of a cursor.
+                yield json.dumps({"success": False, "msg": "Query log store unavailable, retry later"}) + "\n"
+                return
+            yield json.dumps({"next_cursor": next_cursor if count == limit else None}) + "\n"
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-    return api_response(True, "Query logs retrieved", safe_logs, 200)
+    safe_logs = []
+    next_cursor = None
+    try:
+        for entry in logs:
+            next_cursor = encode_log_cursor(entry)
+            safe_logs.append(_serialize_log(entry))
+    except Exception as e:
+        response = _log_store_error(e)
+        if response is None:
+            raise
+        return response
+    if len(safe_logs) < limit:
+        next_cursor = None
 
+    return api_response(True, "Query logs retrieved", {"logs": safe_logs, "next_cursor": next_cursor}, 200)
 
+@api.route('/logs/stats', methods=['GET'])
+@swag_from({
+    'description': 'Query counts and latency percentiles (p50/p95/p99) per document per time bucket, aggregated in MongoDB.',
+    'parameters': [
+        {'in': 'query', 'name': 'start_time', 'required': False, 'description': '*Optional* Starting time filter UTC ISO-8601 timestamp'},
+        {'in': 'query', 'name': 'end_time', 'required': False, 'description': '*Optional* End time filter UTC ISO-8601 timestamp'},
+        {'in': 'query', 'name': 'bucket', 'required': False, 'enum': sorted(LOG_BUCKETS), 'description': '*Optional* Time bucket (default hour)'}
+    ],
+    'responses': {
+        200: {'description': 'Aggregated log statistics'},
+        400: {'description': 'Invalid date format or bucket'},
+        501: {'description': 'MongoDB is older than 7.0 ($percentile)'},
+        503: {'description': 'MongoDB unavailable'}
+    }
+})
+def get_query_log_stats():
+    try:
+        filter_query = _log_time_filter()
+    except ValueError:
+        return api_response(False, 'Invalid date format, use ISO format', None, 400)
+    bucket = request.args.get('bucket', 'hour')
+    if bucket not in LOG_BUCKETS:
+        return api_response(False, f"bucket must be one of: {', '.join(sorted(LOG_BUCKETS))}", None, 400)
 
+    try:
+        stats = aggregate_log_stats(_logs_db(), current_app.config.get('LOGS_COLLECTION', 'query_logs'), filter_query, bucket)
+    except Exception as e:
+        response = _log_store_error(e)
+        if response is None:
+            raise
+        return response
+    for row in stats:
+        if isinstance(row.get('bucket'), datetime):
+            row['bucket'] = row['bucket'].isoformat()
+    return api_response(True, "Query log stats retrieved", stats, 200)
@@ -0,0 +1,15 @@
+from flask import Blueprint, jsonify
+from startup import start_warmup
+
+health = Blueprint('health', __name__)
+
+@health.route('/health', methods=['GET'])
+def liveness():
+    """Liveness: the worker process is up and serving requests."""
+    return jsonify({"status": "ok"}), 200
+
+@health.route('/ready', methods=['GET'])
+def readiness():
+    """Readiness: 200 once this worker's warm-up has loaded the models, 503 with per-step progress until then."""
+    status = start_warmup().status()
+    return jsonify(status), 200 if status["ready"] else 503
@@ -0,0 +1,27 @@
+from flask import Blueprint, Response
+from database.document_registry import get_document_registry
+from database.log_sink import get_log_sink
+from ingest.jobs import get_ingest_queue
+from rag.answer_cache import get_answer_cache
+from utils.metrics import registry
+
+metrics = Blueprint('metrics', __name__)
+
+@registry.register_collector
+def _component_gauges():
+    """Counters kept by the caches, log sink and ingest queue, read at scrape time."""
+    samples = []
+    cache = get_answer_cache()
+    if cache is not None:
+        for name, value in cache.stats().items():
+            samples.append(("rag_answer_cache", "Answer cache counters and size", {"counter": name}, value))
+    for name, value in get_log_sink().stats().items():
+        samples.append(("rag_query_log_sink", "Query log sink counters and queue depth", {"counter": name}, value))
+    samples.append(("rag_ingest_queue_depth", "Ingest jobs waiting for a worker", None, get_ingest_queue().depth()))
+    samples.append(("rag_documents", "Documents known to the document registry", None, len(get_document_registry().filenames())))
+    return samples
+
+@metrics.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of this process's stage histograms, token counters and component gauges."""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -1,6 +1,3 @@
-from flasgger import Swagger
-
-
 swagger_config = {
     "headers": [],
     "specs": [
@@ -21,6 +18,20 @@ swagger_config = {
    
 }
 
+def swag_from(specs):
+    """
+    Attach an OpenAPI spec dict to a view, as flasgger.swag_from does for dict specs (it sets
+    `specs_dict`, which flasgger reads when it builds /apispec_1.json), without importing
+    flasgger when the views are defined.
+    """
+    def decorator(function):
+        function.specs_dict = specs
+        return function
+    return decorator
+
 def init_swagger(app):
-  
+    """Serve the docs with flasgger; skipped (and flasgger never imported) when SWAGGER_ENABLED is off."""
+    if not app.config.get("SWAGGER_ENABLED", True):
+        return
+    from flasgger import Swagger
     Swagger(app, config=swagger_config)
@@ -0,0 +1,54 @@
+"""
+ASGI entry point: POST /api/query is served natively async (api.async_query), every
+other route by the Flask app through asgiref's WSGI adapter.
+
+    python asgi.py                     # uvicorn on 0.0.0.0:5000
+    uvicorn asgi:app --port 5000
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from api.async_query import AsyncQueryHandler
+from config import Config
+from main import app as flask_app
+
+_wsgi_executor = ThreadPoolExecutor(Config.WSGI_THREADS, thread_name_prefix="wsgi")
+
+class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI call on one shared thread by default (thread_sensitive=True),
+    # which would serialize uploads, log queries etc.; the Flask views are thread-safe.
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__["run_wsgi_app"].func,
+                                 thread_sensitive=False, executor=_wsgi_executor)
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+wsgi_app = ThreadedWsgiToAsgi(flask_app)
+query_handler = AsyncQueryHandler(flask_app)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await query_handler.aclose()
+            _wsgi_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+    elif scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/api/query":
+        await query_handler(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=5000)
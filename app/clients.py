@@ -0,0 +1,115 @@
+import atexit
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+class ClientRegistry:
+    """
+    Application-scoped Chroma (or local vector index, VECTOR_BACKEND=local), MongoDB and Ollama HTTP clients.
+    Each client is created on first use and then reused for every request in
+    this process, all configured from Config. Clients can be injected
+    (e.g. in-process stand-ins for benchmarks) by passing them to the constructor.
+    """
+
+    def __init__(self, config=Config, chroma=None, mongo=None, http=None):
+        self.config = config
+        self._chroma = chroma
+        self._mongo = mongo
+        self._http = http
+        self._lock = threading.Lock()
+
+    @property
+    def chroma(self):
+        if self._chroma is None:
+            with self._lock:
+                if self._chroma is None and self.config.VECTOR_BACKEND == "local":
+                    from database.local_index import LocalVectorClient
+                    self._chroma = LocalVectorClient(
+                        self.config.LOCAL_INDEX_PATH,
+                        nprobe=self.config.LOCAL_INDEX_NPROBE,
+                        rerank=self.config.LOCAL_INDEX_RERANK,
+                        ivf_min_rows=self.config.LOCAL_INDEX_IVF_MIN_ROWS,
+                        max_segments=self.config.LOCAL_INDEX_MAX_SEGMENTS,
+                    )
+                elif self._chroma is None:
+                    from chromadb import HttpClient
+                    self._chroma = HttpClient(host=self.config.CHROMA_HOST, port=self.config.CHROMA_PORT)
+        return self._chroma
+
+    @property
+    def mongo(self):
+        if self._mongo is None:
+            with self._lock:
+                if self._mongo is None:
+                    from pymongo import MongoClient
+                    self._mongo = MongoClient(
+                        self.config.MONGO_URI,
+                        maxPoolSize=self.config.MONGO_MAX_POOL_SIZE,
+                        connectTimeoutMS=self.config.MONGO_CONNECT_TIMEOUT_MS,
+                        serverSelectionTimeoutMS=self.config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                        socketTimeoutMS=self.config.MONGO_SOCKET_TIMEOUT_MS,
+                    )
+        return self._mongo
+
+    @property
+    def http(self):
+        """Keep-alive session for Ollama, sized for OLLAMA_POOL_SIZE concurrent requests."""
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.config.OLLAMA_POOL_SIZE,
+                                          pool_maxsize=self.config.OLLAMA_POOL_SIZE)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._http = session
+        return self._http
+
+    @property
+    def ollama_timeout(self):
+        """(connect, read) timeout for Ollama requests."""
+        return (self.config.OLLAMA_CONNECT_TIMEOUT, self.config.OLLAMA_READ_TIMEOUT)
+
+    def close(self):
+        """Close every client that was created."""
+        with self._lock:
+            if self._mongo is not None:
+                self._mongo.close()
+                self._mongo = None
+            if self._http is not None:
+                self._http.close()
+                self._http = None
+            # Chroma's HttpClient holds no resources that need explicit release.
+            self._chroma = None
+
+_registry = None
+_registry_pid = None
+_registry_lock = threading.Lock()
+
+def get_clients():
+    """Return this process's client registry (a forked worker gets its own)."""
+    global _registry, _registry_pid
+    if _registry is None or _registry_pid != os.getpid():
+        with _registry_lock:
+            if _registry is None or _registry_pid != os.getpid():
+                _registry = ClientRegistry()
+                _registry_pid = os.getpid()
+    return _registry
+
+def set_clients(registry):
+    """Replace this process's client registry (closing the previous one)."""
+    global _registry, _registry_pid
+    with _registry_lock:
+        if _registry is not None and _registry_pid == os.getpid():
+            _registry.close()
+        _registry = registry
+        _registry_pid = os.getpid()
+
+@atexit.register
+def _close_clients():
+    if _registry is not None and _registry_pid == os.getpid():
+        _registry.close()
@@ -1,48 +1,416 @@
-import uuid
-import chromadb
-from chromadb import HttpClient
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from clients import get_clients
+from config import Config
 
-def get_chroma_client(host="chromadb", port=8000):
-    """Initialize and return a ChromaDB client."""
-    client = HttpClient(host=host, port=port)
+logger = logging.getLogger(__name__)
+
+def get_chroma_client(host=None, port=None):
+    """
+    Return the shared ChromaDB client configured from Config.
+    Passing host/port creates a separate client for that server instead.
+    """
+    if host is None and port is None:
+        return get_clients().chroma
+    from chromadb import HttpClient  # chromadb takes about a second to import; only load it when needed
+    client = HttpClient(host=host or Config.CHROMA_HOST, port=port or Config.CHROMA_PORT)
     return client
 
-def add_embedding(client, collection_name, embedding, metadata, document=None, doc_id=None):
-    """Add an embedding with metadata and document text to a collection."""
-    collection = client.get_or_create_collection(collection_name)
-    
-    # Generate a unique ID if not provided
-    if doc_id is None:
-        doc_id = str(uuid.uuid4())
-    
-    collection.add(
-        embeddings=[embedding], 
-        metadatas=[metadata], 
-        documents=[document],  # include document text for retrieval
-        ids=[doc_id]
-    )
-    return doc_id
-
-def query_embeddings(client, collection_name, query_embedding, top_k=5):
-    """Query for similar embeddings in a collection."""
+class ShardRouter:
+    """
+    Spreads the documents of a logical collection ("papers") over `num_shards` Chroma
+    collections named "<name>_<shard>"; with a single shard the logical collection is used as is.
+    A new document is placed by "hash" (of its filename) or by "tenant" (hash of the filename
+    part before `tenant_separator`, so one tenant's papers share a shard). Placements are kept
+    in a routing table (`routes` returns a MongoDB collection) so documents stay where they were
+    stored when the shard count changes; lookups are cached in memory. While the routing table
+    cannot be read, documents are placed by strategy and the table is retried after `retry_after` seconds.
+    """
+
+    def __init__(self, collection_name, num_shards=1, strategy="hash", tenant_separator="__", routes=None,
+                 retry_after=30.0):
+        if strategy not in ("hash", "tenant"):
+            raise ValueError(f"Unknown shard strategy {strategy!r}")
+        self.collection_name = collection_name
+        self.num_shards = max(1, num_shards)
+        self.strategy = strategy
+        self.tenant_separator = tenant_separator
+        self._routes = routes if self.num_shards > 1 else None
+        self._table = None
+        self.retry_after = retry_after
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def collection(self, shard):
+        """Name of the Chroma collection holding `shard`."""
+        return self.collection_name if self._routes is None else f"{self.collection_name}_{shard}"
+
+    def _place(self, filename):
+        key = filename or ""
+        if self.strategy == "tenant" and self.tenant_separator in key:
+            key = key.split(self.tenant_separator, 1)[0]
+        return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) % self.num_shards
+
+    def _load_table(self):
+        if self._table is None:
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_after:
+                return {}  # don't wait on an unavailable MongoDB in every request
+            try:
+                entries = self._routes().find({"collection": self.collection_name}, {"filename": 1, "shard": 1})
+                self._table = {entry["filename"]: entry["shard"] for entry in entries}
+            except Exception:
+                logger.warning("Shard routing table unavailable, placing %s documents by %s for %.0fs",
+                               self.collection_name, self.strategy, self.retry_after, exc_info=True)
+                self._failed_at = time.monotonic()
+                return {}
+        return self._table
+
+    def shard_of(self, filename):
+        """Shard that holds (or would hold) `filename`."""
+        if self._routes is None:
+            return 0
+        with self._lock:
+            shard = self._load_table().get(filename)
+        return self._place(filename) if shard is None else shard
+
+    def assign(self, filename):
+        """Shard to store `filename` in, recording a new placement in the routing table."""
+        if self._routes is None:
+            return 0
+        with self._lock:
+            table = self._load_table()
+            shard = table.get(filename)
+            if shard is None:
+                shard = self._place(filename)
+                self._routes().update_one(
+                    {"_id": f"{self.collection_name}:{filename}"},
+                    {"$set": {"collection": self.collection_name, "filename": filename, "shard": shard}},
+                    upsert=True,
+                )
+                if self._table is not None:
+                    self._table[filename] = shard
+            return shard
+
+    def forget(self, filename):
+        """Drop the placement of a deleted document."""
+        if self._routes is None:
+            return
+        with self._lock:
+            self._routes().delete_one({"_id": f"{self.collection_name}:{filename}"})
+            if self._table is not None:
+                self._table.pop(filename, None)
+
+    def shards(self):
+        """Every shard that may hold documents: the configured ones and any still in the routing table."""
+        if self._routes is None:
+            return [0]
+        with self._lock:
+            return sorted(set(range(self.num_shards)) | set(self._load_table().values()))
+
+    def shards_for(self, filenames):
+        return sorted({self.shard_of(filename) for filename in filenames})
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+def get_shard_router(collection_name="papers"):
+    """Return the process-wide shard router of a logical collection, configured from Config."""
+    router = _routers.get(collection_name)
+    if router is None:
+        with _routers_lock:
+            router = _routers.get(collection_name)
+            if router is None:
+                router = _routers[collection_name] = ShardRouter(
+                    collection_name,
+                    num_shards=Config.CHROMA_SHARDS,
+                    strategy=Config.CHROMA_SHARD_STRATEGY,
+                    tenant_separator=Config.CHROMA_SHARD_TENANT_SEPARATOR,
+                    routes=lambda: get_clients().mongo[Config.MONGO_DB_NAME][Config.SHARD_ROUTES_COLLECTION],
+                )
+    return router
+
+def _where_documents(where):
+    """The document_name values a `where` filter is limited to, or None if it may match any document."""
+    value = (where or {}).get("document_name")
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        if isinstance(value.get("$eq"), str):
+            return [value["$eq"]]
+        if isinstance(value.get("$in"), list):
+            return value["$in"]
+    return None
+
+def _existing_collection(client, name):
+    """The collection `name`, or None if it was never created; read paths use this so they don't create empty shards."""
+    try:
+        return client.get_collection(name)
+    except Exception as e:
+        # Chroma raises NotFoundError (older versions: ValueError or InvalidCollectionException), as does the local index.
+        if isinstance(e, ValueError) or type(e).__name__ in ("NotFoundError", "InvalidCollectionException"):
+            return None
+        raise
+
+def make_chunk_id(document_name, chunk_id):
+    """Deterministic id for a chunk, so re-uploading a paper overwrites rather than duplicates."""
+    return hashlib.sha1(f"{document_name}:{chunk_id}".encode("utf-8")).hexdigest()
+
+def add_embeddings(client, collection_name, embeddings, metadatas, documents, ids=None, batch_size=256):
+    """
+    Upsert many embeddings into a collection, `batch_size` records per request.
+    Records go to the shard of their document; each shard's collection is resolved
+    once. Returns (ids, batch_stats) where batch_stats holds the size and duration of each write.
+    """
+    if not (len(embeddings) == len(metadatas) == len(documents)):
+        raise ValueError("embeddings, metadatas and documents must have the same length")
+    if ids is None:
+        ids = [make_chunk_id(meta.get("document_name"), meta.get("chunk_id")) for meta in metadatas]
+
+    router = get_shard_router(collection_name)
+    shard_of = {}
+    by_shard = {}
+    for i, meta in enumerate(metadatas):
+        name = meta.get("document_name")
+        if name not in shard_of:
+            shard_of[name] = router.assign(name)
+        by_shard.setdefault(shard_of[name], []).append(i)
+
+    batch_stats = []
+    for shard, indices in by_shard.items():
+        shard_name = router.collection(shard)
+        collection = client.get_or_create_collection(shard_name)
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            started = time.perf_counter()
+            collection.upsert(
+                ids=[ids[i] for i in batch],
+                embeddings=[embeddings[i] for i in batch],
+                metadatas=[metadatas[i] for i in batch],
+                documents=[documents[i] for i in batch],
+            )
+            elapsed = time.perf_counter() - started
+            batch_stats.append({"size": len(batch), "duration_seconds": round(elapsed, 4)})
+            logger.info("Upserted %d records into %s in %.3fs", len(batch), shard_name, elapsed)
+    return ids, batch_stats
+
+def delete_stale_chunks(client, collection_name, document_name, keep_ids, page_size=5000):
+    """
+    Delete the chunks of `document_name` whose ids are not in `keep_ids`, e.g. the trailing
+    chunks of an earlier, longer upload of the same file. Returns how many were deleted.
+    """
+    router = get_shard_router(collection_name)
+    collection = _existing_collection(client, router.collection(router.shard_of(document_name)))
+    if collection is None:
+        return 0
+    stale = []
+    offset = 0
+    while True:
+        page = collection.get(where={"document_name": document_name}, include=[], limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        stale.extend(chunk_id for chunk_id in ids if chunk_id not in keep_ids)
+        if len(ids) < page_size:
+            break
+        offset += page_size
+    for start in range(0, len(stale), page_size):
+        collection.delete(ids=stale[start:start + page_size])
+    return len(stale)
+
+def delete_document(client, collection_name, document_name):
+    """Delete every chunk that belongs to `document_name` (from its shard only)."""
+    router = get_shard_router(collection_name)
+    collection = _existing_collection(client, router.collection(router.shard_of(document_name)))
+    if collection is not None:
+        collection.delete(where={"document_name": document_name})
+    router.forget(document_name)
+
+def get_document_chunks(client, collection_name, document_name, page_size=5000):
+    """Every stored chunk of `document_name` (read from its shard), in chunk order: (documents, metadatas)."""
+    router = get_shard_router(collection_name)
+    collection = _existing_collection(client, router.collection(router.shard_of(document_name)))
+    if collection is None:
+        return [], []
+    chunks = []
+    offset = 0
+    while True:
+        page = collection.get(where={"document_name": document_name}, include=["documents", "metadatas"],
+                              limit=page_size, offset=offset)
+        metadatas = page.get("metadatas") or []
+        chunks.extend(zip(page.get("documents") or [], metadatas))
+        if len(metadatas) < page_size:
+            break
+        offset += page_size
+    chunks.sort(key=lambda chunk: chunk[1].get("chunk_id") if isinstance(chunk[1].get("chunk_id"), int) else 0)
+    return [doc for doc, _ in chunks], [meta for _, meta in chunks]
+
+def replace_summaries(client, collection_name, document_name, embeddings, metadatas, documents):
+    """
+    Replace the stored summaries of `document_name` in the (unsharded) summary collection.
+    Each metadata holds "kind" ("document" or "section") and its "position" in the paper.
+    """
     collection = client.get_or_create_collection(collection_name)
-    results = collection.query(
-        query_embeddings=[query_embedding], 
-        n_results=top_k
-    )
-    return results
+    collection.delete(where={"document_name": document_name})
+    if documents:
+        collection.upsert(
+            ids=[make_chunk_id(document_name, f"summary:{meta['kind']}:{meta['position']}") for meta in metadatas],
+            embeddings=embeddings, metadatas=metadatas, documents=documents,
+        )
+
+def delete_summaries(client, collection_name, document_name):
+    """Delete the stored summaries of `document_name`."""
+    collection = _existing_collection(client, collection_name)
+    if collection is not None:
+        collection.delete(where={"document_name": document_name})
+
+def get_summaries(client, collection_name, document_names):
+    """The stored summaries of the given documents: (documents, metadatas), in no particular order."""
+    where = {"document_name": document_names[0]} if len(document_names) == 1 else {"document_name": {"$in": list(document_names)}}
+    collection = _existing_collection(client, collection_name)
+    if collection is None:
+        return [], []
+    results = collection.get(where=where, include=["documents", "metadatas"])
+    return results.get("documents") or [], results.get("metadatas") or []
+
+def iter_metadatas(client, collection_name, page_size=5000):
+    """Yield the metadata of every stored chunk, shard by shard; shards that were never created are skipped."""
+    router = get_shard_router(collection_name)
+    for shard in router.shards():
+        try:
+            collection = client.get_collection(router.collection(shard))
+        except Exception:
+            continue
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            metadatas = page.get("metadatas") or []
+            yield from metadatas
+            if len(metadatas) < page_size:
+                break
+            offset += page_size
+
+def get_chunks_by_ids(client, collection_name, ids):
+    """Fetch stored chunks by id (looked up in every shard in parallel); returns {id: (document, metadata)}."""
+    if not ids:
+        return {}
+    router = get_shard_router(collection_name)
+
+    def get_shard(shard):
+        collection = _existing_collection(client, router.collection(shard))
+        if collection is None:
+            return {}
+        return collection.get(ids=list(ids), include=["documents", "metadatas"])
+
+    shards = router.shards()
+    found = {}
+    for results in (map if len(shards) == 1 else _shard_executor.map)(get_shard, shards):
+        found.update(
+            (chunk_id, (doc, meta))
+            for chunk_id, doc, meta in zip(results.get("ids") or [], results.get("documents") or [], results.get("metadatas") or [])
+        )
+    return found
 
-def get_relevant_chunks(client, collection_name, query_embedding, top_k=5):
+def query_embeddings(client, collection_name, query_embedding, top_k=5, where=None):
+    """Query for similar embeddings in a collection, optionally restricted by a metadata `where` filter."""
+    return _query_shards(client, collection_name, [query_embedding], top_k, where)
+
+def _query_shards(client, collection_name, query_embeddings, top_k, where=None):
+    """
+    Chroma query over the shards a `where` filter can match: only the owning shards when it
+    names documents, otherwise all of them in parallel, merged to the top_k per query by distance.
+    """
+    router = get_shard_router(collection_name)
+    names = _where_documents(where)
+    shards = router.shards() if names is None else router.shards_for(names)
+
+    def query_shard(shard):
+        collection = _existing_collection(client, router.collection(shard))
+        if collection is None:
+            return {key: [[] for _ in query_embeddings] for key in ("ids", "documents", "metadatas", "distances")}
+        kwargs = {"query_embeddings": query_embeddings, "n_results": top_k}
+        if where:
+            kwargs["where"] = where
+        return collection.query(**kwargs)
+
+    if len(shards) == 1:
+        return query_shard(shards[0])
+    merged = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+    shard_results = list(_shard_executor.map(query_shard, shards))
+    for i in range(len(query_embeddings)):
+        hits = []
+        for results in shard_results:
+            columns = [(results.get(key) or [[]] * len(query_embeddings))[i] for key in ("distances", "ids", "documents", "metadatas")]
+            hits.extend(zip(*columns))
+        hits.sort(key=lambda hit: hit[0])
+        hits = hits[:top_k]
+        for position, key in enumerate(("distances", "ids", "documents", "metadatas")):
+            merged[key].append([hit[position] for hit in hits])
+    return merged
+
+def get_relevant_chunks(client, collection_name, query_embedding, top_k=5, where=None):
     """Retrieve relevant context chunks (text) based on a query embedding."""
-    results = query_embeddings(client, collection_name, query_embedding, top_k)
+    results = query_embeddings(client, collection_name, query_embedding, top_k, where)
     return results['documents'][0] if results.get('documents') else []
 
-def get_relevant_chunks_and_metadata(client, collection_name, query_embedding, top_k=5):
+def get_relevant_chunks_and_metadata(client, collection_name, query_embedding, top_k=5, where=None):
     """Retrieve relevant context chunks and their metadata."""
-    results = query_embeddings(client, collection_name, query_embedding, top_k)
+    results = query_embeddings(client, collection_name, query_embedding, top_k, where)
     documents = results['documents'][0] if results.get('documents') else []
     metadatas = results['metadatas'][0] if results.get('metadatas') else []
     return documents, metadatas
 
+_query_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chroma-query")
+# Fan-out across shards gets its own pool: it also runs inside _query_executor tasks.
+_shard_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chroma-shard")
 
+def get_relevant_chunks_for_files(client, collection_name, query_embedding, filenames, top_k=5):
+    """
+    Retrieve the top_k chunks of each file in `filenames`, filtering on document_name
+    inside Chroma. Files are queried in parallel and the results merged by distance.
+    """
+    def query_file(filename):
+        results = query_embeddings(client, collection_name, query_embedding, top_k,
+                                   where={"document_name": filename})
+        documents = results['documents'][0] if results.get('documents') else []
+        metadatas = results['metadatas'][0] if results.get('metadatas') else []
+        distances = results['distances'][0] if results.get('distances') else [0.0] * len(documents)
+        return list(zip(distances, documents, metadatas))
 
+    if len(filenames) == 1:
+        hits = query_file(filenames[0])
+    else:
+        hits = [hit for file_hits in _query_executor.map(query_file, filenames) for hit in file_hits]
+        hits.sort(key=lambda hit: hit[0])
+    documents = [doc for _, doc, _ in hits]
+    metadatas = [meta for _, _, meta in hits]
+    return documents, metadatas
+
+def get_relevant_chunks_for_queries(client, collection_name, query_embeddings, target_files, top_k=5):
+    """
+    get_relevant_chunks_for_files for many questions at once. Questions are grouped by
+    file and each file gets one Chroma query (on its shard) carrying the embeddings of every
+    question that targets it (questions without target files share one query across all
+    shards); files are queried in parallel. Returns [(documents, metadatas)] in question order.
+    """
+    groups = {}
+    for i, filenames in enumerate(target_files):
+        for filename in (filenames or [None]):
+            groups.setdefault(filename, []).append(i)
+
+    def query_group(item):
+        filename, indices = item
+        where = {"document_name": filename} if filename is not None else None
+        results = _query_shards(client, collection_name, [query_embeddings[i] for i in indices], top_k, where)
+        per_query = zip(results.get('distances') or [], results.get('documents') or [], results.get('metadatas') or [])
+        return indices, [list(zip(distances, documents, metadatas)) for distances, documents, metadatas in per_query]
+
+    hits = [[] for _ in query_embeddings]
+    for indices, group_hits in _query_executor.map(query_group, groups.items()):
+        for i, file_hits in zip(indices, group_hits):
+            hits[i].extend(file_hits)
+    results = []
+    for question_hits in hits:
+        question_hits.sort(key=lambda hit: hit[0])
+        results.append(([doc for _, doc, _ in question_hits], [meta for _, _, meta in question_hits]))
+    return results
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from config import Config
+from database.chroma_client import get_chroma_client, iter_metadatas
+from utils.filename_matcher import AhoCorasick
+
+logger = logging.getLogger(__name__)
+
+class DocumentRegistry:
+    """
+    In-memory index of the distinct papers stored in Chroma and their chunk counts.
+    Loaded with a single metadata scan (over every shard), then kept current by upload/delete, so
+    matching a question against filenames costs O(len(question)) instead of a
+    full-collection scan per request. The registry is rebuilt when it is older than
+    `max_age` seconds, so papers deleted through another worker stop matching.
+    """
+
+    def __init__(self, client_factory, collection_name="papers", refresh_interval=5.0, max_age=60.0, page_size=5000):
+        self._client_factory = client_factory
+        self._collection_name = collection_name
+        self._refresh_interval = refresh_interval
+        self._max_age = max_age
+        self._page_size = page_size
+        self._counts = {}
+        self._matcher = None
+        self._loaded_at = None
+        self._changes = None        # set()/remove() calls made while a refresh is scanning
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.RLock()
+
+    def refresh(self):
+        """Rebuild the registry from the collection's metadata; on error the known papers are kept."""
+        with self._refresh_lock:
+            with self._lock:
+                self._changes = {}
+            counts = {}
+            try:
+                for meta in iter_metadatas(self._client_factory(), self._collection_name, self._page_size):
+                    name = meta and (meta.get("filename") or meta.get("document_name"))
+                    if name:
+                        counts[name] = counts.get(name, 0) + 1
+            except Exception:
+                logger.warning("Could not refresh the document registry; keeping %d known papers",
+                               len(self._counts), exc_info=True)
+                with self._lock:
+                    self._changes = None
+                    self._loaded_at = time.monotonic()  # retried after max_age, or on an unmatched question
+                return
+            with self._lock:
+                # Uploads and deletes that finished during the scan win over what it saw.
+                for name, count in self._changes.items():
+                    self._apply(counts, name, count)
+                self._changes = None
+                self._counts = counts
+                self._matcher = None
+                self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self._max_age:
+            with self._refresh_lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at >= self._max_age:
+                    self.refresh()
+
+    @staticmethod
+    def _apply(counts, filename, chunk_count):
+        if chunk_count:
+            counts[filename] = chunk_count
+        else:
+            counts.pop(filename, None)
+
+    def set(self, filename, chunk_count):
+        """Record `filename` as stored with `chunk_count` chunks (0 forgets it)."""
+        self._ensure_loaded()
+        with self._lock:
+            self._apply(self._counts, filename, chunk_count)
+            if self._changes is not None:
+                self._changes[filename] = chunk_count
+            self._matcher = None
+
+    def remove(self, filename):
+        """Forget `filename`; returns its previous chunk count (0 if unknown)."""
+        self._ensure_loaded()
+        with self._lock:
+            if self._changes is not None:
+                self._changes[filename] = 0
+            self._matcher = None
+            return self._counts.pop(filename, 0)
+
+    def filenames(self):
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._counts)
+
+    def chunk_counts(self):
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._counts)
+
+    def _get_matcher(self):
+        with self._lock:
+            if self._matcher is None:
+                patterns = {}
+                for name in self._counts:
+                    lower = name.lower()
+                    # The name without ".pdf" is a substring of the full name, so it covers both spellings.
+                    base = lower[:-4] if lower.endswith(".pdf") else lower
+                    patterns[base] = patterns.get(base, ()) + (name,)
+                self._matcher = AhoCorasick(patterns)
+            return self._matcher
+
+    def match(self, question):
+        """
+        Return the stored filenames mentioned in `question`, in order of mention.
+        An empty result triggers at most one rate-limited refresh, so papers
+        uploaded through another worker are still found.
+        """
+        self._ensure_loaded()
+        matches = self._match(question)
+        if not matches and time.monotonic() - self._loaded_at >= self._refresh_interval:
+            self.refresh()
+            matches = self._match(question)
+        return matches
+
+    def match_many(self, questions):
+        """
+        match() for a list of questions in one pass over one matcher: a list of filename
+        lists, in question order. At most one refresh for the whole batch.
+        """
+        self._ensure_loaded()
+        matcher = self._get_matcher()
+        matches = [self._match(question, matcher) for question in questions]
+        if not all(matches) and time.monotonic() - self._loaded_at >= self._refresh_interval:
+            self.refresh()
+            matcher = self._get_matcher()
+            matches = [found or self._match(question, matcher) for question, found in zip(questions, matches)]
+        return matches
+
+    def _match(self, question, matcher=None):
+        found = (matcher or self._get_matcher()).find_all(question.lower())
+        return list(dict.fromkeys(name for names in found for name in names))
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_document_registry():
+    """Return the process-wide document registry for the papers collection."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DocumentRegistry(get_chroma_client, "papers", max_age=Config.DOCUMENT_REGISTRY_MAX_AGE)
+    return _registry
@@ -0,0 +1,408 @@
+import fcntl
+import heapq
+import math
+import os
+import pickle
+import re
+import struct
+import threading
+from array import array
+from contextlib import contextmanager
+
+from config import Config
+
+_TERM_RE = re.compile(r"\w+")
+# Journal records are length-prefixed pickles.
+_RECORD_HEADER = struct.Struct("<I")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with".split()
+)
+
+def tokenize(text):
+    """Lowercased word terms, keeping numbers, acronyms and symbols such as "bleu-4" -> ["bleu", "4"]."""
+    return [t for t in _TERM_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse several ranked lists of ids with reciprocal rank fusion.
+    Returns ids ordered by sum(1 / (k + rank)) over the lists they appear in.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk texts.
+    Posting lists are pairs of typed arrays (doc numbers as uint32, term
+    frequencies as uint16), documents are appended incrementally and removed with
+    tombstones that are compacted away once they make up a third of the index.
+    The index persists as a snapshot (`path`) plus an append-only journal of the
+    changes made since: each writing() block appends one record per add, merge or
+    removal, so a write costs the size of the change, and readers in other processes
+    replay only the records they have not seen. Once the journal outgrows
+    `compact_ratio` of the snapshot (and `compact_min_bytes`), a background thread
+    folds it into a new snapshot. Writers in different processes serialize through a lock file.
+    """
+
+    def __init__(self, path=None, k1=1.2, b=0.75, compact_min_bytes=1 << 20, compact_ratio=0.5):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.compact_min_bytes = compact_min_bytes
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._generation = 0            # snapshot generation; its journal is "<path>.<generation>.journal"
+        self._snapshot_id = None        # (inode, mtime, size) of the loaded snapshot
+        self._journal_offset = 0        # bytes of the journal replayed (or written) so far
+        self._pending = None            # records of the writing() block in progress
+        self._compacting = False
+        self._reset()
+
+    def _reset(self):
+        self._chunk_ids = []            # doc number -> chunk id
+        self._doc_names = []            # doc number -> document_name
+        self._doc_len = array("I")
+        self._alive = bytearray()
+        self._postings = {}             # term -> (array("I") doc numbers, array("H") tfs)
+        self._by_chunk_id = {}          # chunk id -> doc number
+        self._live_count = 0
+        self._total_len = 0
+
+    def __len__(self):
+        return self._live_count
+
+    # -- updates -----------------------------------------------------------
+
+    def _record(self, record):
+        if self._pending is not None:
+            self._pending.append(record)
+
+    def add(self, chunk_ids, texts, document_names):
+        """Index chunks; a chunk id that is already present is replaced."""
+        chunk_ids, texts, document_names = list(chunk_ids), list(texts), list(document_names)
+        with self._lock:
+            self._record(("add", chunk_ids, texts, document_names))
+            self._add(chunk_ids, texts, document_names)
+
+    def _add(self, chunk_ids, texts, document_names):
+        with self._lock:
+            for chunk_id, text, name in zip(chunk_ids, texts, document_names):
+                if chunk_id in self._by_chunk_id:
+                    self._kill(self._by_chunk_id[chunk_id])
+                terms = tokenize(text)
+                num = len(self._chunk_ids)
+                self._chunk_ids.append(chunk_id)
+                self._doc_names.append(name)
+                self._doc_len.append(len(terms))
+                self._alive.append(1)
+                self._by_chunk_id[chunk_id] = num
+                self._live_count += 1
+                self._total_len += len(terms)
+                counts = {}
+                for term in terms:
+                    counts[term] = counts.get(term, 0) + 1
+                for term, tf in counts.items():
+                    posting = self._postings.get(term)
+                    if posting is None:
+                        posting = self._postings[term] = (array("I"), array("H"))
+                    posting[0].append(num)
+                    posting[1].append(min(tf, 65535))
+
+    def _kill(self, num):
+        if self._alive[num]:
+            self._alive[num] = 0
+            self._live_count -= 1
+            self._total_len -= self._doc_len[num]
+            self._by_chunk_id.pop(self._chunk_ids[num], None)
+
+    def remove_document(self, document_name):
+        """Remove every chunk of `document_name`; returns how many were removed."""
+        with self._lock:
+            self._record(("remove", document_name))
+            return self._remove_document(document_name)
+
+    def _remove_document(self, document_name):
+        with self._lock:
+            removed = 0
+            for num, name in enumerate(self._doc_names):
+                if name == document_name and self._alive[num]:
+                    self._kill(num)
+                    removed += 1
+            if len(self._chunk_ids) - self._live_count > len(self._chunk_ids) // 3:
+                self._compact()
+            return removed
+
+    def merge(self, other, replace_documents=True):
+        """Add every live chunk of `other`; by default first drops existing chunks of the same documents."""
+        with self._lock:
+            self._record(("merge", other._state(), replace_documents))
+            self._merge(other, replace_documents)
+
+    def _merge(self, other, replace_documents):
+        with self._lock:
+            if replace_documents:
+                for name in set(other._doc_names):
+                    self._remove_document(name)
+            live = [num for num in range(len(other._chunk_ids)) if other._alive[num]]
+            base = len(self._chunk_ids)
+            remap = {}
+            for num in live:
+                chunk_id = other._chunk_ids[num]
+                if chunk_id in self._by_chunk_id:
+                    self._kill(self._by_chunk_id[chunk_id])
+                remap[num] = base + len(remap)
+                self._chunk_ids.append(chunk_id)
+                self._doc_names.append(other._doc_names[num])
+                self._doc_len.append(other._doc_len[num])
+                self._alive.append(1)
+                self._by_chunk_id[chunk_id] = remap[num]
+                self._live_count += 1
+                self._total_len += other._doc_len[num]
+            for term, (nums, tfs) in other._postings.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = (array("I"), array("H"))
+                for num, tf in zip(nums, tfs):
+                    if num in remap:
+                        posting[0].append(remap[num])
+                        posting[1].append(tf)
+
+    def _compact(self):
+        """Drop tombstoned documents and renumber the rest."""
+        live = [num for num in range(len(self._chunk_ids)) if self._alive[num]]
+        remap = {old: new for new, old in enumerate(live)}
+        postings = {}
+        for term, (nums, tfs) in self._postings.items():
+            new_nums, new_tfs = array("I"), array("H")
+            for num, tf in zip(nums, tfs):
+                if num in remap:
+                    new_nums.append(remap[num])
+                    new_tfs.append(tf)
+            if new_nums:
+                postings[term] = (new_nums, new_tfs)
+        self._chunk_ids = [self._chunk_ids[num] for num in live]
+        self._doc_names = [self._doc_names[num] for num in live]
+        self._doc_len = array("I", (self._doc_len[num] for num in live))
+        self._alive = bytearray(b"\x01" * len(live))
+        self._by_chunk_id = {chunk_id: num for num, chunk_id in enumerate(self._chunk_ids)}
+        self._postings = postings
+
+    # -- search ------------------------------------------------------------
+
+    def search(self, query, top_k=5, document_names=None):
+        """Return [(chunk_id, bm25_score)] for the best `top_k` chunks, optionally limited to some documents."""
+        self.maybe_reload()
+        with self._lock:
+            if not self._live_count:
+                return []
+            allowed = set(document_names) if document_names else None
+            avg_len = self._total_len / self._live_count or 1.0
+            scores = {}
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                if posting is None:
+                    continue
+                nums, tfs = posting
+                idf = math.log(1 + (self._live_count - len(nums) + 0.5) / (len(nums) + 0.5))
+                for num, tf in zip(nums, tfs):
+                    if not self._alive[num] or (allowed is not None and self._doc_names[num] not in allowed):
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[num] / avg_len)
+                    scores[num] = scores.get(num, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [(self._chunk_ids[num], score) for num, score in best]
+
+    # -- persistence ---------------------------------------------------------
+
+    def _state(self):
+        return {
+            "chunk_ids": self._chunk_ids,
+            "doc_names": self._doc_names,
+            "doc_len": self._doc_len,
+            "alive": self._alive,
+            "postings": self._postings,
+        }
+
+    def _restore(self, state):
+        self._reset()
+        self._chunk_ids = state["chunk_ids"]
+        self._doc_names = state["doc_names"]
+        self._doc_len = state["doc_len"]
+        self._alive = state["alive"]
+        self._postings = state["postings"]
+        self._by_chunk_id = {cid: num for num, cid in enumerate(self._chunk_ids) if self._alive[num]}
+        self._live_count = len(self._by_chunk_id)
+        self._total_len = sum(self._doc_len[num] for num in self._by_chunk_id.values())
+
+    def _journal_path(self, generation=None):
+        return f"{self.path}.{self._generation if generation is None else generation}.journal"
+
+    def _snapshot_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def save(self):
+        """Write the whole index as a new snapshot of the current generation."""
+        if not self.path:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(dict(self._state(), generation=self._generation), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+            self._snapshot_id = self._snapshot_stat()
+
+    def load(self):
+        """Load the snapshot and replay its journal."""
+        with self._lock:
+            self._reset()
+            self._generation, self._snapshot_id, self._journal_offset = 0, None, 0
+            try:
+                with open(self.path, "rb") as f:
+                    stat = os.fstat(f.fileno())
+                    state = pickle.load(f)
+            except FileNotFoundError:
+                state = None
+            if state is not None:
+                self._restore(state)
+                self._generation = state.get("generation", 0)
+                self._snapshot_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._replay()
+
+    def _replay(self):
+        """Apply the journal records appended since the last replay; a torn last record is left for later."""
+        try:
+            with open(self._journal_path(), "rb") as f:
+                f.seek(self._journal_offset)
+                while True:
+                    header = f.read(_RECORD_HEADER.size)
+                    if len(header) < _RECORD_HEADER.size:
+                        break
+                    (size,) = _RECORD_HEADER.unpack(header)
+                    body = f.read(size)
+                    if len(body) < size:
+                        break
+                    self._apply(pickle.loads(body))
+                    self._journal_offset += len(header) + len(body)
+        except FileNotFoundError:
+            pass  # nothing written since the snapshot, or compacted meanwhile (the snapshot changed)
+
+    def _apply(self, record):
+        kind = record[0]
+        if kind == "add":
+            self._add(*record[1:])
+        elif kind == "remove":
+            self._remove_document(record[1])
+        elif kind == "merge":
+            other = LexicalIndex()
+            other._restore(record[1])
+            self._merge(other, record[2])
+
+    def maybe_reload(self):
+        """Catch up with changes saved by other processes: replay new journal records, or reload after a compaction."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._snapshot_stat() != self._snapshot_id:
+                self.load()
+                return
+            try:
+                size = os.stat(self._journal_path()).st_size
+            except FileNotFoundError:
+                return
+            if size > self._journal_offset:
+                self._replay()
+
+    def _append(self, records):
+        """Append records to the journal; the caller holds the write lock and is caught up."""
+        if not records:
+            return
+        data = b"".join(_RECORD_HEADER.pack(len(body)) + body
+                        for body in (pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL) for record in records))
+        with open(self._journal_path(), "ab") as f:
+            if f.tell() != self._journal_offset:
+                f.truncate(self._journal_offset)  # drop a torn record left by a writer that crashed
+            f.write(data)
+        self._journal_offset += len(data)
+
+    def _lock_file(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        return open(f"{self.path}.lock", "w")
+
+    @contextmanager
+    def writing(self):
+        """
+        Hold the cross-process write lock with an up-to-date index; the changes made in the
+        block are appended to the journal on exit (and dropped again if the block raises).
+        """
+        if not self.path:
+            yield self
+            return
+        with self._lock_file() as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with self._lock:
+                    self.maybe_reload()
+                    self._pending = []
+                    try:
+                        yield self
+                        self._append(self._pending)
+                    except BaseException:
+                        self._pending = None
+                        self.load()
+                        raise
+                    finally:
+                        self._pending = None
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self._maybe_compact_in_background()
+
+    def _maybe_compact_in_background(self):
+        with self._lock:
+            snapshot_size = self._snapshot_id[2] if self._snapshot_id else 0
+            if self._compacting or self._journal_offset <= max(self.compact_min_bytes, snapshot_size * self.compact_ratio):
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact_journal, name="lexical-compact", daemon=True).start()
+
+    def compact_journal(self):
+        """Fold the journal into a new snapshot generation and delete the old journal."""
+        try:
+            with self._lock_file() as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    with self._lock:
+                        self.maybe_reload()
+                        if not self._journal_offset:
+                            return
+                        old_journal = self._journal_path()
+                        self._generation += 1
+                        self._journal_offset = 0
+                        self.save()
+                        os.remove(old_journal)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            self._compacting = False
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_lexical_index():
+    """Return the process-wide BM25 index, loaded from LEXICAL_INDEX_PATH."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = LexicalIndex(Config.LEXICAL_INDEX_PATH,
+                                     compact_min_bytes=Config.LEXICAL_INDEX_COMPACT_BYTES)
+                index.load()
+                _index = index
+    return _index
@@ -0,0 +1,515 @@
+"""
+In-process vector store exposing the part of Chroma's client/collection API the app
+uses (get_or_create_collection, get_collection, upsert/add, get, query, delete, count),
+selected with VECTOR_BACKEND=local.
+
+A collection is a directory of immutable segments named by a manifest. Per segment:
+- vectors.npy        float32 rows, only read to re-rank the best candidates exactly;
+- codes.npy          int8 rows with one scale per row (scales.npy), scored in bulk with NumPy;
+- ivf_*.npy          k-means centroids and inverted lists (segments of IVF_MIN_ROWS and more),
+                     so an unfiltered query scores the nprobe nearest lists, not every row;
+- doc_*.npy          rows grouped by document_name, so a document filter scans only those rows;
+- ids/payload files  chunk ids (sorted, for lookups) and JSON [id, text, metadata] per row.
+Every array is opened with mmap_mode="r": a worker opens a collection in milliseconds and
+workers share the page cache. Writes add a segment or a new tombstone array and then swap
+the manifest, whose generation counter goes up with every commit; small segments are merged
+as they accumulate. Writers in different processes serialize through a lock file and re-read
+the manifest under it; readers reload when the manifest file changes (inode, size or mtime).
+Distances are squared L2, like Chroma's default space.
+"""
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MANIFEST = "manifest.json"
+_SCORE_BLOCK = 8192       # rows converted from int8 per matrix product
+_KMEANS_SAMPLE = 65536
+_KMEANS_ITERATIONS = 10
+
+def _file_id(stat):
+    """What identifies one version of the manifest file: os.replace gives every version a new inode."""
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+def _document_filter(where):
+    """The document_name values a Chroma `where` filter allows, or None when unfiltered."""
+    if not where:
+        return None
+    if set(where) != {"document_name"}:
+        raise ValueError(f"The local vector index only filters on document_name, got {where}")
+    value = where["document_name"]
+    if isinstance(value, dict):
+        if "$eq" in value:
+            return [value["$eq"]]
+        if "$in" in value:
+            return list(value["$in"])
+        raise ValueError(f"Unsupported document_name filter {value}")
+    return [value]
+
+def _quantize(vectors):
+    """Symmetric int8 codes with one float32 scale per row."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _nearest_centroid(vectors, centroids):
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    nearest = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _SCORE_BLOCK):
+        block = np.asarray(vectors[start:start + _SCORE_BLOCK], dtype=np.float32)
+        nearest[start:start + len(block)] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return nearest
+
+def _kmeans(vectors, nlist, seed=0):
+    """Lloyd's k-means on a sample of `vectors`."""
+    rng = np.random.default_rng(seed)
+    train = vectors
+    if len(vectors) > _KMEANS_SAMPLE:
+        train = vectors[np.sort(rng.choice(len(vectors), _KMEANS_SAMPLE, replace=False))]
+    centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assign = _nearest_centroid(train, centroids)
+        counts = np.bincount(assign, minlength=nlist)
+        nonempty = counts > 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        sums = np.add.reduceat(train[np.argsort(assign, kind="stable")], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+    return centroids
+
+def _group(keys, num_groups):
+    """CSR grouping of row numbers by key (keys < 0 are left out): (offsets, rows)."""
+    order = np.argsort(keys, kind="stable")
+    order = order[keys[order] >= 0]
+    counts = np.bincount(keys[keys >= 0], minlength=num_groups)
+    return np.concatenate(([0], np.cumsum(counts))).astype(np.int64), order.astype(np.int64)
+
+def _write_segment(directory, vectors, ids, documents, metadatas, ivf_min_rows):
+    """Write rows as a new segment directory; returns its name."""
+    name = f"seg-{uuid.uuid4().hex}"
+    tmp = os.path.join(directory, f"{name}.tmp")
+    os.makedirs(tmp)
+    save = lambda filename, array: np.save(os.path.join(tmp, filename), array)
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    codes, scales = _quantize(vectors)
+    save("vectors.npy", vectors)
+    save("codes.npy", codes)
+    save("scales.npy", scales)
+    save("norms.npy", (vectors ** 2).sum(axis=1))
+
+    id_array = np.array(ids, dtype=str)
+    id_order = np.argsort(id_array, kind="stable")
+    save("ids_sorted.npy", id_array[id_order])
+    save("ids_order.npy", id_order)
+
+    names = [(meta or {}).get("document_name") for meta in metadatas]
+    doc_names = sorted({n for n in names if n is not None})
+    doc_numbers = {n: i for i, n in enumerate(doc_names)}
+    doc_offsets, doc_rows = _group(np.array([doc_numbers.get(n, -1) for n in names], dtype=np.int64), len(doc_names))
+    save("doc_offsets.npy", doc_offsets)
+    save("doc_rows.npy", doc_rows)
+    with open(os.path.join(tmp, "docs.json"), "w") as f:
+        json.dump(doc_names, f)
+
+    offsets = [0]
+    with open(os.path.join(tmp, "payload.bin"), "wb") as f:
+        for record in zip(ids, documents, metadatas):
+            data = json.dumps(record).encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    save("payload_offsets.npy", np.array(offsets, dtype=np.int64))
+
+    if len(vectors) >= ivf_min_rows:
+        nlist = int(np.sqrt(len(vectors)))
+        centroids = _kmeans(vectors, nlist)
+        list_offsets, list_rows = _group(_nearest_centroid(vectors, centroids).astype(np.int64), nlist)
+        save("ivf_centroids.npy", centroids)
+        save("ivf_offsets.npy", list_offsets)
+        save("ivf_rows.npy", list_rows)
+
+    os.rename(tmp, os.path.join(directory, name))
+    return name
+
+class _Segment:
+    """A read-only, memory-mapped segment plus its (in-memory) tombstones."""
+
+    def __init__(self, path, deleted=None):
+        self.path = path
+        load = lambda filename: np.load(os.path.join(path, filename), mmap_mode="r")
+        self.vectors = load("vectors.npy")
+        self.codes = load("codes.npy")
+        self.scales = load("scales.npy")
+        self.norms = load("norms.npy")
+        self.ids_sorted = load("ids_sorted.npy")
+        self.ids_order = load("ids_order.npy")
+        self.doc_offsets = load("doc_offsets.npy")
+        self.doc_rows = load("doc_rows.npy")
+        self.payload_offsets = load("payload_offsets.npy")
+        with open(os.path.join(path, "docs.json")) as f:
+            self.doc_numbers = {name: i for i, name in enumerate(json.load(f))}
+        with open(os.path.join(path, "payload.bin"), "rb") as f:
+            self._payload = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.ivf = None
+        if os.path.exists(os.path.join(path, "ivf_centroids.npy")):
+            self.ivf = (np.load(os.path.join(path, "ivf_centroids.npy")), load("ivf_offsets.npy"), load("ivf_rows.npy"))
+        self.deleted = np.zeros(len(self.vectors), dtype=bool) if deleted is None else deleted
+        self.alive_count = int(len(self.deleted) - self.deleted.sum())
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def with_deleted(self, deleted):
+        """A copy of this segment (sharing the mapped arrays) with other tombstones."""
+        segment = object.__new__(_Segment)
+        segment.__dict__.update(self.__dict__)
+        segment.deleted = deleted
+        segment.alive_count = int(len(deleted) - deleted.sum())
+        return segment
+
+    def record(self, row):
+        """(id, text, metadata) of a row."""
+        return tuple(json.loads(self._payload[self.payload_offsets[row]:self.payload_offsets[row + 1]]))
+
+    def find(self, ids):
+        """Live row number of each id, -1 where absent or deleted."""
+        ids = np.asarray(ids, dtype=str)
+        if not len(self) or not len(ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.searchsorted(self.ids_sorted, ids).clip(0, len(self) - 1)
+        rows = np.where(self.ids_sorted[pos] == ids, self.ids_order[pos], -1)
+        rows[rows >= 0] = np.where(self.deleted[rows[rows >= 0]], -1, rows[rows >= 0])
+        return rows
+
+    def rows_of(self, document_names):
+        """Row numbers of the given documents (tombstones included)."""
+        numbers = [self.doc_numbers[n] for n in document_names if n in self.doc_numbers]
+        if not numbers:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.doc_rows[self.doc_offsets[i]:self.doc_offsets[i + 1]] for i in numbers])
+
+    def candidates(self, query, document_names, nprobe):
+        """Rows worth scoring for `query`: the filtered documents, the nearest IVF lists, or all rows (None)."""
+        if document_names is not None:
+            return self.rows_of(document_names)
+        if self.ivf is None:
+            return None
+        centroids, offsets, rows = self.ivf
+        distances = (centroids ** 2).sum(axis=1) - 2 * centroids @ query
+        probe = np.argpartition(distances, min(nprobe, len(centroids)) - 1)[:nprobe]
+        return np.concatenate([rows[offsets[i]:offsets[i + 1]] for i in probe])
+
+    def approximate(self, query, rows, limit):
+        """The `limit` best live rows by int8-approximated distance (query norm omitted): (rows, distances)."""
+        if rows is None:
+            scores = np.empty(len(self), dtype=np.float32)
+            for start in range(0, len(self), _SCORE_BLOCK):
+                end = min(start + _SCORE_BLOCK, len(self))
+                scores[start:end] = self.codes[start:end].astype(np.float32) @ query
+            rows = np.arange(len(self))
+            distances = self.norms - 2 * scores * self.scales
+        else:
+            rows = np.sort(rows)  # sequential reads from the mapped arrays
+            distances = np.empty(len(rows), dtype=np.float32)
+            for start in range(0, len(rows), _SCORE_BLOCK):
+                block = rows[start:start + _SCORE_BLOCK]
+                scores = self.codes[block].astype(np.float32) @ query
+                distances[start:start + len(block)] = self.norms[block] - 2 * scores * self.scales[block]
+        live = ~self.deleted[rows]
+        rows, distances = rows[live], distances[live]
+        if len(rows) > limit:
+            best = np.argpartition(distances, limit - 1)[:limit]
+            rows, distances = rows[best], distances[best]
+        return rows, distances
+
+class LocalCollection:
+    """One collection of the local vector index (see the module docstring)."""
+
+    def __init__(self, path, name, nprobe=16, rerank=4, ivf_min_rows=20000, max_segments=8):
+        self.path = path
+        self.name = name
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.ivf_min_rows = ivf_min_rows
+        self.max_segments = max_segments
+        self._lock = threading.RLock()
+        self._segments = []         # [(manifest entry, _Segment)]
+        self._dim = None
+        self._generation = 0
+        self._loaded_stat = None
+
+    # -- persistence ---------------------------------------------------------
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, _MANIFEST))
+
+    def load(self):
+        with self._lock:
+            for attempt in range(3):
+                try:
+                    with open(os.path.join(self.path, _MANIFEST)) as f:
+                        stat = _file_id(os.fstat(f.fileno()))
+                        manifest = json.load(f)
+                except FileNotFoundError:
+                    self._segments, self._dim, self._generation, self._loaded_stat = [], None, 0, None
+                    return
+                opened = {entry["name"]: (entry, segment) for entry, segment in self._segments}
+                try:
+                    segments = []
+                    for entry in manifest["segments"]:
+                        previous = opened.get(entry["name"])
+                        if previous and previous[0] == entry:
+                            segments.append(previous)
+                            continue
+                        segment = previous[1] if previous else _Segment(os.path.join(self.path, entry["name"]))
+                        deleted = np.load(os.path.join(self.path, entry["deleted"])) if entry["deleted"] else None
+                        segments.append((entry, segment.with_deleted(deleted) if deleted is not None else segment))
+                except FileNotFoundError:
+                    continue  # a writer replaced the manifest while we read it
+                self._segments, self._dim, self._loaded_stat = segments, manifest["dim"], stat
+                self._generation = manifest.get("generation", 0)
+                return
+            raise RuntimeError(f"Could not load the local vector index at {self.path}")
+
+    def maybe_reload(self):
+        """Reload from disk if another process changed the collection."""
+        try:
+            stat = _file_id(os.stat(os.path.join(self.path, _MANIFEST)))
+        except FileNotFoundError:
+            stat = None
+        if stat != self._loaded_stat:
+            self.load()
+
+    def _commit(self, segments):
+        """Point the manifest at `segments` and remove files no manifest refers to any more (under the write lock)."""
+        try:
+            with open(os.path.join(self.path, _MANIFEST)) as f:
+                on_disk = json.load(f).get("generation", 0)
+        except FileNotFoundError:
+            on_disk = 0
+        if on_disk != self._generation:
+            # Never write (or delete segments) from a stale view of another writer's commit.
+            raise RuntimeError(f"Local vector index {self.path} changed during a write (generation {on_disk}, "
+                               f"expected {self._generation})")
+        manifest = {"dim": self._dim, "generation": self._generation + 1, "segments": [entry for entry, _ in segments]}
+        tmp = os.path.join(self.path, f"{_MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, os.path.join(self.path, _MANIFEST))
+        self._segments = segments
+        self._generation = manifest["generation"]
+        self._loaded_stat = _file_id(os.stat(os.path.join(self.path, _MANIFEST)))
+        # Readers that still have old segments open keep their mappings after the unlink.
+        referenced = {entry["name"] for entry in manifest["segments"]} | {entry["deleted"] for entry in manifest["segments"]}
+        for filename in os.listdir(self.path):
+            if filename.startswith(("seg-", "deleted-")) and filename not in referenced:
+                target = os.path.join(self.path, filename)
+                shutil.rmtree(target, ignore_errors=True) if os.path.isdir(target) else os.remove(target)
+
+    @contextmanager
+    def _writing(self):
+        """Hold the cross-process write lock with an up-to-date view of the collection."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with self._lock:
+                    # Re-read the manifest rather than trusting its timestamp: two commits within
+                    # one mtime tick look unchanged. Segments that are already open are reused.
+                    self.load()
+                    yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # -- writes ----------------------------------------------------------------
+
+    def _tombstone(self, segments, rows_by_segment):
+        """Segments with the given rows marked deleted (a new tombstone file per changed segment)."""
+        updated = []
+        for (entry, segment), rows in zip(segments, rows_by_segment):
+            rows = rows[rows >= 0]
+            if not len(rows):
+                updated.append((entry, segment))
+                continue
+            deleted = segment.deleted.copy()
+            deleted[rows] = True
+            filename = f"deleted-{uuid.uuid4().hex}.npy"
+            np.save(os.path.join(self.path, filename), deleted)
+            updated.append(({"name": entry["name"], "deleted": filename}, segment.with_deleted(deleted)))
+        return updated
+
+    def _rewrite(self, parts):
+        """Write the live rows of `parts` as one segment."""
+        vectors, ids, documents, metadatas = [], [], [], []
+        for _, segment in parts:
+            rows = np.flatnonzero(~segment.deleted)
+            vectors.append(segment.vectors[rows])
+            for row in rows:
+                chunk_id, text, meta = segment.record(row)
+                ids.append(chunk_id)
+                documents.append(text)
+                metadatas.append(meta)
+        name = _write_segment(self.path, np.concatenate(vectors), ids, documents, metadatas, self.ivf_min_rows)
+        return {"name": name, "deleted": None}, _Segment(os.path.join(self.path, name))
+
+    def _compact(self, segments):
+        """Drop empty segments, rewrite ones that are a third tombstones, merge the smallest neighbours."""
+        segments = [part for part in segments if part[1].alive_count]
+        segments = [self._rewrite([part]) if len(part[1]) - part[1].alive_count > len(part[1]) // 3 else part
+                    for part in segments]
+        while len(segments) > self.max_segments:
+            sizes = [segment.alive_count for _, segment in segments]
+            i = min(range(len(segments) - 1), key=lambda i: sizes[i] + sizes[i + 1])
+            segments[i:i + 2] = [self._rewrite(segments[i:i + 2])]
+        return segments
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None):
+        ids = list(ids)
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate ids in upsert")
+        with self._writing():
+            if self._dim is not None and vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimensionality {self._dim}")
+            self._dim = int(vectors.shape[1])
+            segments = self._tombstone(self._segments, [segment.find(ids) for _, segment in self._segments])
+            name = _write_segment(self.path, vectors, ids, documents, metadatas, self.ivf_min_rows)
+            segments.append(({"name": name, "deleted": None}, _Segment(os.path.join(self.path, name))))
+            self._commit(self._compact(segments))
+
+    def add(self, ids, embeddings, metadatas=None, documents=None):
+        """Like Chroma, ids that already exist are left unchanged."""
+        ids = list(ids)
+        with self._lock:
+            self.maybe_reload()
+            present = set()
+            for _, segment in self._segments:
+                rows = segment.find(ids)
+                present.update(chunk_id for chunk_id, row in zip(ids, rows) if row >= 0)
+        keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in present]
+        pick = lambda values: [values[i] for i in keep] if values is not None else None
+        self.upsert(pick(ids), pick(list(embeddings)), pick(metadatas and list(metadatas)),
+                    pick(documents and list(documents)))
+
+    def delete(self, ids=None, where=None):
+        names = _document_filter(where)
+        with self._writing():
+            rows_by_segment = []
+            for _, segment in self._segments:
+                rows = segment.find(ids) if ids is not None else np.arange(len(segment))
+                if names is not None:
+                    rows = np.intersect1d(rows, segment.rows_of(names)) if ids is not None else segment.rows_of(names)
+                rows_by_segment.append(rows)
+            segments = self._tombstone(self._segments, rows_by_segment)
+            self._commit(self._compact(segments))
+
+    # -- reads -------------------------------------------------------------------
+
+    def count(self):
+        self.maybe_reload()
+        return sum(segment.alive_count for _, segment in self._segments)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        self.maybe_reload()
+        segments = self._segments
+        names = _document_filter(where)
+        offset, limit = offset or 0, limit if limit is not None else float("inf")
+        hits = []   # (segment, row)
+        if ids is not None:
+            found = {}
+            for _, segment in segments:
+                found.update((chunk_id, (segment, row)) for chunk_id, row in zip(ids, segment.find(ids)) if row >= 0)
+            hits = [found[chunk_id] for chunk_id in ids if chunk_id in found]
+        else:
+            for _, segment in segments:
+                if names is None and offset >= segment.alive_count:
+                    offset -= segment.alive_count
+                    continue
+                rows = np.arange(len(segment)) if names is None else np.sort(segment.rows_of(names))
+                hits.extend((segment, row) for row in rows[~segment.deleted[rows]])
+                if len(hits) >= offset + limit:
+                    break
+        hits = hits[offset:offset + limit] if limit != float("inf") else hits[offset:]
+        return self._results(hits, include)
+
+    def _results(self, hits, include, distances=None):
+        records = [segment.record(row) for segment, row in hits]
+        results = {"ids": [record[0] for record in records]}
+        results["documents"] = [record[1] for record in records] if "documents" in include else None
+        results["metadatas"] = [record[2] for record in records] if "metadatas" in include else None
+        if "embeddings" in include:
+            results["embeddings"] = [segment.vectors[row].tolist() for segment, row in hits]
+        if distances is not None:
+            results["distances"] = distances
+        return results
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        """Nearest rows for each query: int8 scoring of the candidates, then exact re-ranking of the best."""
+        self.maybe_reload()
+        segments = [segment for _, segment in self._segments]
+        names = _document_filter(where)
+        batched = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1):
+            candidates = []
+            for segment in segments:
+                rows = segment.candidates(query, names, self.nprobe)
+                rows, _ = segment.approximate(query, rows, n_results * self.rerank)
+                rows = np.sort(rows)
+                exact = ((segment.vectors[rows] - query) ** 2).sum(axis=1)
+                candidates.extend(zip([segment] * len(rows), rows, exact.tolist()))
+            candidates.sort(key=lambda hit: hit[2])
+            best = candidates[:n_results]
+            results = self._results([(segment, row) for segment, row, _ in best], ("documents", "metadatas"),
+                                    [distance for _, _, distance in best])
+            for key in batched:
+                batched[key].append(results[key])
+        return batched
+
+class LocalVectorClient:
+    """Chroma-client stand-in over collections stored under `path`."""
+
+    def __init__(self, path, **options):
+        self.path = path
+        self.options = options
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, name):
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._collections[name] = LocalCollection(os.path.join(self.path, name), name, **self.options)
+                collection.load()
+            return collection
+
+    def get_or_create_collection(self, name, **kwargs):
+        return self._collection(name)
+
+    def get_collection(self, name, **kwargs):
+        collection = self._collection(name)
+        if not collection.exists():
+            raise ValueError(f"Collection {name} does not exist.")
+        return collection
+
+    def list_collections(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if os.path.exists(os.path.join(self.path, name, _MANIFEST)))
+
+    def delete_collection(self, name):
+        with self._lock:
+            self._collections.pop(name, None)
+        shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
@@ -0,0 +1,188 @@
+import atexit
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+
+from clients import get_clients
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# MongoDB's duplicate key error: the entry (same client-generated _id) is already stored.
+_DUPLICATE_KEY = 11000
+
+def _unwritten(batch, error):
+    """
+    The entries of `batch` that a failed insert_many(ordered=False) did not store. A bulk write
+    error names the failed indices (duplicates are already stored); any other error may have
+    stored any of them, so all are returned and a later replay skips the duplicates.
+    """
+    write_errors = (getattr(error, "details", None) or {}).get("writeErrors")
+    if write_errors is None:
+        return list(batch)
+    failed = {e["index"] for e in write_errors if e.get("code") != _DUPLICATE_KEY}
+    return [entry for i, entry in enumerate(batch) if i in failed]
+
+class BufferedLogSink:
+    """
+    Non-blocking writer for query logs.
+    submit() only enqueues into a bounded in-process queue; a background thread
+    writes batches with insert_many when `batch_size` entries are waiting or
+    `flush_interval` seconds have passed. Entries that arrive while the queue is
+    full are dropped and counted. Batches that fail to write are appended to a
+    JSONL spill file and replayed once MongoDB accepts writes again. Entries get their
+    _id before the first attempt, so a replay never stores an entry twice.
+    """
+
+    def __init__(self, collection_getter, max_queue=10000, batch_size=100, flush_interval=1.0,
+                 spill_dir="/tmp/academic_rag/log_spill", replay_interval=30.0):
+        self._collection_getter = collection_getter
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self.replay_interval = replay_interval
+        self._spill_path = os.path.join(spill_dir, f"spill-{os.getpid()}.jsonl")
+        self._stats_lock = threading.Lock()
+        self._counters = {"submitted": 0, "written": 0, "dropped": 0, "spilled": 0, "replayed": 0, "write_errors": 0}
+        self._stop = threading.Event()
+        self._last_replay = 0.0
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._counters[key] += n
+
+    def submit(self, entry):
+        """Queue a log entry without blocking; returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("submitted")
+        return True
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._counters, queued=self._queue.qsize())
+
+    def _next_batch(self):
+        """Block for the first entry, then gather more until the batch is full or the interval elapses."""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+            if time.monotonic() - self._last_replay >= self.replay_interval:
+                self._last_replay = time.monotonic()
+                self._replay_spills()
+
+    def _write(self, batch):
+        from bson import ObjectId  # imported on first use, like pymongo itself
+        for entry in batch:
+            entry.setdefault("_id", ObjectId())
+        try:
+            self._collection_getter().insert_many(batch, ordered=False)
+            self._count("written", len(batch))
+        except Exception as e:
+            failed = _unwritten(batch, e)
+            self._count("written", len(batch) - len(failed))
+            self._count("write_errors")
+            if failed:
+                logger.warning("Query log write failed; spilling %d entries to %s", len(failed), self._spill_path,
+                               exc_info=True)
+                self._spill(failed)
+
+    def _spill(self, batch):
+        from bson import json_util  # imported on first use, like pymongo itself
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(self._spill_path, "a") as f:
+                for entry in batch:
+                    f.write(json_util.dumps(entry) + "\n")
+            self._count("spilled", len(batch))
+        except OSError:
+            logger.exception("Could not spill query logs; %d entries lost", len(batch))
+            self._count("dropped", len(batch))
+
+    def _replay_spills(self):
+        """Re-insert spilled entries from any process; a file is claimed by renaming it first."""
+        from bson import json_util
+        for path in glob.glob(os.path.join(self.spill_dir, "spill-*.jsonl")):
+            claimed = f"{path}.replay-{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed) as f:
+                entries = [json_util.loads(line) for line in f if line.strip()]
+            written, failed = 0, []
+            try:
+                collection = self._collection_getter()
+                while written < len(entries):
+                    batch = entries[written:written + self.batch_size]
+                    try:
+                        collection.insert_many(batch, ordered=False)
+                    except Exception as e:
+                        if getattr(e, "details", None) is None:
+                            raise
+                        failed.extend(_unwritten(batch, e))  # rejected entries; duplicates were stored earlier
+                    written += len(batch)
+            except Exception:
+                # Still unavailable: keep the entries not known to be stored for the next attempt.
+                failed.extend(entries[written:])
+            if failed:
+                with open(path, "a") as f:
+                    for entry in failed:
+                        f.write(json_util.dumps(entry) + "\n")
+            os.remove(claimed)
+            self._count("replayed", len(entries) - len(failed))
+            if written < len(entries):
+                return
+
+    def close(self, timeout=5.0):
+        """Flush queued entries (spilling what cannot be written) and stop the flusher."""
+        self._stop.set()
+        self._thread.join(timeout)
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_log_sink():
+    """Return the process-wide query log sink writing to Config.LOGS_COLLECTION."""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                def collection():
+                    return get_clients().mongo[Config.MONGO_DB_NAME][Config.LOGS_COLLECTION]
+
+                _sink = BufferedLogSink(
+                    collection,
+                    max_queue=Config.LOG_QUEUE_SIZE,
+                    batch_size=Config.LOG_BATCH_SIZE,
+                    flush_interval=Config.LOG_FLUSH_INTERVAL,
+                    spill_dir=Config.LOG_SPILL_DIR,
+                )
+                atexit.register(_sink.close)
+    return _sink
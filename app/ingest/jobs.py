@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from config import Config
+from ingest.pipeline import ingest_pdf
+
+logger = logging.getLogger(__name__)
+
+PENDING_STATES = ("queued", "running")
+
+# Distinguishes this process from an earlier one that happened to have the same pid.
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class IngestJobQueue:
+    """
+    Background ingestion of uploaded PDFs.
+    Jobs are persisted as JSON files in `jobs_dir` (so any worker can report their
+    status), queued in a bounded in-process queue and run by `max_concurrent_jobs`
+    worker threads. Unfinished jobs are re-queued on start, skipping files that
+    were already completed.
+    """
+
+    def __init__(self, jobs_dir, upload_dir, max_concurrent_jobs=2, max_queue_depth=32,
+                 handler=ingest_pdf, progress_interval=0.5):
+        self.jobs_dir = jobs_dir
+        self.upload_dir = upload_dir
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.handler = handler
+        self.progress_interval = progress_interval
+        self._queue = queue.Queue(maxsize=max_queue_depth)
+        self._lock = threading.Lock()
+        self._workers = []
+        os.makedirs(jobs_dir, exist_ok=True)
+        os.makedirs(upload_dir, exist_ok=True)
+
+    # -- persistence -----------------------------------------------------
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _lock_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.lock")
+
+    def _save(self, job):
+        job["updated_at"] = _now()
+        path = self._job_path(job["id"])
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, path)
+
+    def get(self, job_id):
+        """Return the stored state of a job, or None if it does not exist."""
+        if not job_id or os.path.basename(job_id) != job_id:
+            return None
+        try:
+            with open(self._job_path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _claim(self, job_id):
+        """
+        Take ownership of a job for this process. Returns False if this process or
+        another live process already owns it; locks left by dead processes (or by a
+        previous incarnation that reused our pid) are taken over.
+        """
+        lock_path = self._lock_path(job_id)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(lock_path) as f:
+                    pid, _, token = f.read().strip().partition(":")
+                    pid = int(pid or 0)
+            except (OSError, ValueError):
+                pid, token = 0, ""
+            if token == _PROCESS_TOKEN:
+                return False
+            if pid and pid != os.getpid() and _pid_alive(pid):
+                return False
+            fd = os.open(lock_path, os.O_WRONLY | os.O_TRUNC)
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{os.getpid()}:{_PROCESS_TOKEN}")
+        return True
+
+    def _release(self, job_id):
+        try:
+            os.remove(self._lock_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    # -- submission ------------------------------------------------------
+
+    def submit(self, uploads):
+        """
+        Save uploaded files and enqueue a job for them. `uploads` is a list of
+        werkzeug FileStorage objects. Raises queue.Full when the queue is at capacity.
+        """
+        if self._queue.full():
+            raise queue.Full
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.upload_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        files = []
+        for index, upload in enumerate(uploads):
+            path = os.path.join(job_dir, f"{index}.pdf")
+            upload.save(path)
+            files.append({
+                "filename": upload.filename,
+                "path": path,
+                "status": "queued",
+                "pages_parsed": 0,
+                "chunks_total": 0,
+                "chunks_embedded": 0,
+                "chunks_stored": 0,
+                "error": None,
+            })
+        job = {"id": job_id, "status": "queued", "created_at": _now(), "files": files, "error": None}
+        self._claim(job_id)
+        self._save(job)
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            job.update(status="failed", error="Ingest queue is full")
+            self._save(job)
+            self._release(job_id)
+            raise
+        return job
+
+    def depth(self):
+        """Number of jobs waiting for a worker in this process."""
+        return self._queue.qsize()
+
+    # -- workers ---------------------------------------------------------
+
+    def start(self):
+        """Start the worker threads and re-queue unfinished jobs from a previous run."""
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.max_concurrent_jobs):
+                worker = threading.Thread(target=self._work, name=f"ingest-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        threading.Thread(target=self._recover, name="ingest-recover", daemon=True).start()
+
+    def _recover(self):
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith(".json"):
+                continue
+            job = self.get(name[:-5])
+            if job and job["status"] in PENDING_STATES and self._claim(job["id"]):
+                logger.info("Recovering ingest job %s", job["id"])
+                job["status"] = "queued"
+                self._save(job)
+                # Blocks while the queue is full rather than dropping recovered work.
+                self._queue.put(job["id"])
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception:
+                logger.exception("Ingest job %s crashed", job_id)
+            finally:
+                self._release(job_id)
+                self._queue.task_done()
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return
+        job["status"] = "running"
+        self._save(job)
+
+        for entry in job["files"]:
+            if entry["status"] == "completed":
+                continue
+            entry["status"] = "running"
+            self._save(job)
+            last_saved = [time.monotonic()]
+
+            def progress(**fields):
+                entry.update(fields)
+                now = time.monotonic()
+                if now - last_saved[0] >= self.progress_interval:
+                    last_saved[0] = now
+                    self._save(job)
+
+            try:
+                stats = self.handler(entry["path"], entry["filename"], progress=progress)
+                entry.update(status="completed", stats=stats)
+            except Exception as e:
+                logger.exception("Ingest of %s failed", entry["filename"])
+                entry.update(status="failed", error=str(e))
+            self._save(job)
+            try:
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                pass
+
+        failed = [f["filename"] for f in job["files"] if f["status"] == "failed"]
+        job["status"] = "failed" if failed else "completed"
+        job["error"] = f"Failed to ingest: {', '.join(failed)}" if failed else None
+        self._save(job)
+        try:
+            os.rmdir(os.path.join(self.upload_dir, job_id))
+        except OSError:
+            pass
+
+_queue_instance = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+def get_ingest_queue():
+    """
+    Return the process-wide ingest job queue (started on first use). A forked worker gets
+    its own: the worker threads of a queue created before the fork do not exist in it.
+    """
+    global _queue_instance, _queue_pid
+    if _queue_instance is None or _queue_pid != os.getpid():
+        with _queue_lock:
+            if _queue_instance is None or _queue_pid != os.getpid():
+                _queue_instance = IngestJobQueue(
+                    jobs_dir=Config.INGEST_JOBS_DIR,
+                    upload_dir=Config.UPLOAD_FOLDER,
+                    max_concurrent_jobs=Config.INGEST_MAX_CONCURRENT_JOBS,
+                    max_queue_depth=Config.INGEST_MAX_QUEUE_DEPTH,
+                )
+                _queue_pid = os.getpid()
+                _queue_instance.start()
+    return _queue_instance
@@ -0,0 +1,97 @@
+from itertools import islice
+from config import Config
+from database.chroma_client import get_chroma_client, add_embeddings, delete_stale_chunks, delete_summaries
+from database.document_registry import get_document_registry
+from database.lexical_index import LexicalIndex, get_lexical_index
+from rag.answer_cache import invalidate_cached_answers
+from utils.embedding import get_embedding_engine
+from utils.chunker import chunk_document
+from utils.metrics import collect_timings, span
+from utils.pdf_processor import iter_pdf_pages_parallel, chunk_pages_with_metadata
+
+def ingest_pdf(filepath, filename, progress=None, collection_name="papers"):
+    """
+    Run the extract -> chunk -> embed -> store pipeline for one PDF.
+    Pages are streamed from the extractor into the chunker, so memory stays bounded
+    for very large PDFs. `progress(**fields)` receives pages_parsed, chunks_embedded
+    and chunks_stored as they advance, and chunks_total once the stream is exhausted.
+    Returns the per-file ingest stats, including the seconds spent in each stage.
+    """
+    with collect_timings() as timings:
+        stats = _ingest_pdf(filepath, filename, report=progress or (lambda **fields: None),
+                            collection_name=collection_name)
+    stats["timings"] = timings.get("stages", {})
+    return stats
+
+def _ingest_pdf(filepath, filename, report, collection_name):
+    client = get_chroma_client()
+    engine = get_embedding_engine()
+
+    def pages():
+        # Pages stream in order from the extractor; report each one as it is consumed.
+        for page_number, text in iter_pdf_pages_parallel(
+                filepath, workers=Config.PDF_EXTRACT_WORKERS,
+                pages_per_task=Config.PDF_PAGES_PER_TASK, min_pages=Config.PDF_PARALLEL_MIN_PAGES):
+            report(pages_parsed=page_number)
+            yield page_number, text
+
+    if Config.CHUNK_STRATEGY == "fixed":
+        chunks = chunk_pages_with_metadata(pages(), filename, Config.DEFAULT_CHUNK_SIZE, Config.DEFAULT_CHUNK_OVERLAP)
+    else:
+        chunks = chunk_document(pages(), filename, Config.CHUNK_MAX_TOKENS, Config.CHUNK_OVERLAP_TOKENS)
+
+    # Embed and store in windows that keep every embedding worker busy. Chunks are
+    # pulled lazily from the page stream, so only one window is held in memory.
+    window = engine.batch_size * engine.concurrency
+    embed_stats = {"cached": 0, "embedded": 0}
+    batch_stats = []
+    stored = 0
+    stored_ids = set()
+    # Postings for this file are built locally and merged into the shared index once at the end.
+    file_index = LexicalIndex() if Config.HYBRID_SEARCH_ENABLED else None
+    while True:
+        # Extraction and chunking run lazily while the window is filled.
+        with span("extract_chunk", pipeline="ingest"):
+            group = list(islice(chunks, window))
+        if not group:
+            break
+        documents = [c["text"] for c in group]
+        group_stats = {}
+        with span("embed", pipeline="ingest"):
+            embeddings = engine.embed(documents, stats=group_stats)
+        for key in embed_stats:
+            embed_stats[key] += group_stats.get(key, 0)
+        report(chunks_embedded=stored + len(group))
+
+        with span("store", pipeline="ingest"):
+            ids, stats = add_embeddings(
+                client, collection_name, embeddings,
+                [c["metadata"] for c in group], documents,
+                batch_size=Config.CHROMA_WRITE_BATCH_SIZE,
+            )
+        batch_stats.extend(stats)
+        stored += len(ids)
+        stored_ids.update(ids)
+        if file_index is not None:
+            file_index.add(ids, documents, [filename] * len(ids))
+        report(chunks_stored=stored)
+    report(chunks_total=stored)
+    # A re-uploaded paper overwrites its chunks by id; chunks the new version no longer has are removed.
+    with span("store", pipeline="ingest"):
+        stale = delete_stale_chunks(client, collection_name, filename, stored_ids)
+    if file_index is not None:
+        with span("lexical_index", pipeline="ingest"), get_lexical_index().writing() as index:
+            # merge() replaces the file's postings, but has nothing to replace them with if no chunks were stored.
+            index.remove_document(filename)
+            index.merge(file_index)
+
+    with span("finalize", pipeline="ingest"):
+        get_document_registry().set(filename, stored)
+        invalidate_cached_answers(filename)
+        if Config.SUMMARY_INDEX_ENABLED:
+            # The old summaries describe the previous upload; questions use the chunks until the new ones are built.
+            from ingest.summaries import get_summary_queue
+            delete_summaries(client, Config.SUMMARY_COLLECTION, filename)
+            get_summary_queue().submit(filename)
+    return {"filename": filename, "chunks": stored, "stale_chunks_deleted": stale, "embeddings": embed_stats,
+            "batches": batch_stats}
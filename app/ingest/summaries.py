@@ -0,0 +1,228 @@
+"""
+Background map-reduce summaries of ingested papers, for document-level questions.
+
+After a paper is ingested its chunks are read back from the vector store, grouped into
+consecutive runs of the same section of at most SUMMARY_SECTION_MAX_TOKENS (map: one
+summary per group), and the section summaries are combined into one summary of the
+paper (reduce, in several levels when they do not fit SUMMARY_REDUCE_MAX_TOKENS).
+Section and document summaries are embedded and stored in SUMMARY_COLLECTION.
+Pending summaries live in memory only: until a paper's summaries exist, questions about
+it are answered from its chunks.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import get_clients
+from config import Config
+from database.chroma_client import get_chroma_client, get_document_chunks, replace_summaries
+from rag.prompt_templates import build_document_summary_prompt, build_section_summary_prompt
+from utils.chunker import count_tokens
+from utils.embedding import get_embedding_engine
+from utils.metrics import collect_timings, record_generation, registry, span
+
+logger = logging.getLogger(__name__)
+
+# Sections that only list other work; summarizing them costs generations and adds nothing.
+SKIPPED_SECTIONS = {"references", "bibliography", "acknowledgments", "acknowledgements"}
+
+def section_groups(documents, metadatas, max_tokens):
+    """
+    Group a paper's chunks (in order) into consecutive runs of the same section of at most
+    `max_tokens`: [{"section", "part", "text", "tokens", "page_start", "page_end"}].
+    Chunks without a section (fixed-size chunking) are grouped by position alone.
+    """
+    groups = []
+    for text, meta in zip(documents, metadatas):
+        section = (meta.get("section") or "").strip()
+        if section.lower().rstrip(":") in SKIPPED_SECTIONS or not (text or "").strip():
+            continue
+        tokens = meta.get("token_count") or count_tokens(text)
+        group = groups[-1] if groups else None
+        if group is None or group["section"] != section or group["tokens"] + tokens > max_tokens:
+            part = group["part"] + 1 if group is not None and group["section"] == section else 1
+            group = {"section": section, "part": part, "texts": [], "tokens": 0,
+                     "page_start": meta.get("page_start"), "page_end": meta.get("page_end")}
+            groups.append(group)
+        group["texts"].append(text.strip())
+        group["tokens"] += tokens
+        group["page_end"] = meta.get("page_end", group["page_end"])
+    for group in groups:
+        group["text"] = " ".join(group.pop("texts"))
+    return groups
+
+def section_label(group):
+    """How a group is named in prompts and citations: its section title, or its pages."""
+    if group["section"]:
+        label = group["section"]
+    elif group["page_start"] is not None:
+        label = f"Pages {group['page_start']}-{group['page_end']}"
+    else:
+        label = f"Part {group['part']}"
+    return f"{label} (continued)" if group["section"] and group["part"] > 1 else label
+
+def _batches(parts, max_tokens):
+    """Split rendered summaries into consecutive batches of at most `max_tokens` (at least one part each)."""
+    batches, tokens = [], 0
+    for part in parts:
+        part_tokens = count_tokens(part)
+        if not batches or tokens + part_tokens > max_tokens:
+            batches.append([])
+            tokens = 0
+        batches[-1].append(part)
+        tokens += part_tokens
+    return batches
+
+class SummaryQueue:
+    """
+    Summarizes papers one at a time in a background thread; each paper's map and reduce
+    generations run up to `concurrency` at once. A paper submitted while it is already
+    pending is summarized once.
+    """
+
+    def __init__(self, collection_name="papers", summary_collection="paper_summaries", section_max_tokens=1200,
+                 reduce_max_tokens=1200, summary_max_tokens=256, concurrency=2):
+        self.collection_name = collection_name
+        self.summary_collection = summary_collection
+        self.section_max_tokens = section_max_tokens
+        self.reduce_max_tokens = reduce_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._running = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._worker = None
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="summarize")
+        self._counters = {"completed": 0, "failed": 0}
+
+    def start(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name="summaries", daemon=True)
+                self._worker.start()
+        return self
+
+    def submit(self, filename):
+        """Queue `filename` to be (re)summarized."""
+        with self._lock:
+            if filename in self._pending:
+                return
+            self._pending.add(filename)
+        self._queue.put(filename)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=len(self._pending) + (self._running is not None))
+
+    def wait_idle(self, timeout=None):
+        """Block until every submitted paper has been summarized; returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and self._running is None, timeout)
+
+    def _work(self):
+        while True:
+            filename = self._queue.get()
+            with self._lock:
+                self._pending.discard(filename)
+                self._running = filename
+            try:
+                stats = self.summarize(filename)
+                logger.info("Summarized %s: %d sections in %.1fs", filename, stats["sections"], stats["seconds"])
+                outcome = "completed"
+            except Exception:
+                logger.exception("Summarizing %s failed", filename)
+                outcome = "failed"
+            with self._idle:
+                self._counters[outcome] += 1
+                self._running = None
+                self._idle.notify_all()
+
+    def summarize(self, filename):
+        """Build and store the section and document summaries of one paper; returns their stats."""
+        started = time.perf_counter()
+        client = get_chroma_client()
+        with collect_timings() as timings:
+            with span("read_chunks", pipeline="summaries"):
+                documents, metadatas = get_document_chunks(client, self.collection_name, filename)
+            groups = section_groups(documents, metadatas, self.section_max_tokens)
+            if not groups:
+                replace_summaries(client, self.summary_collection, filename, [], [], [])
+                return {"filename": filename, "sections": 0, "seconds": round(time.perf_counter() - started, 3)}
+
+            with span("map", pipeline="summaries"):
+                prompts = [build_section_summary_prompt(filename, section_label(group), group["text"]) for group in groups]
+                section_summaries = list(self._executor.map(self._generate, prompts))
+            with span("reduce", pipeline="summaries"):
+                document_summary = self._reduce(filename, [
+                    f"[{section_label(group)}]\n{summary}" for group, summary in zip(groups, section_summaries)])
+
+            texts = [document_summary] + section_summaries
+            metadatas = [{"document_name": filename, "kind": "document", "position": 0, "section": "Summary"}]
+            for position, group in enumerate(groups):
+                meta = {"document_name": filename, "kind": "section", "position": position,
+                        "section": section_label(group)}
+                meta.update({key: group[key] for key in ("page_start", "page_end") if group[key] is not None})
+                metadatas.append(meta)
+            with span("store", pipeline="summaries"):
+                embeddings = get_embedding_engine().embed(texts)
+                replace_summaries(client, self.summary_collection, filename, embeddings, metadatas, texts)
+        return {"filename": filename, "sections": len(groups), "seconds": round(time.perf_counter() - started, 3),
+                "timings": timings.get("stages", {})}
+
+    def _reduce(self, filename, parts):
+        """Combine rendered section summaries, a level at a time, until one summary of the paper is left."""
+        while len(parts) > 1 and sum(count_tokens(part) for part in parts) > self.reduce_max_tokens:
+            batches = _batches(parts, self.reduce_max_tokens)
+            if len(batches) == len(parts):
+                break  # every summary fills the budget alone; the final call gets them all
+            prompts = [build_document_summary_prompt(filename, "\n\n".join(batch), partial=True) for batch in batches]
+            parts = list(self._executor.map(self._generate, prompts))
+        return self._generate(build_document_summary_prompt(filename, "\n\n".join(parts)))
+
+    def _generate(self, prompt):
+        clients = get_clients()
+        payload = {
+            "model": Config.OLLAMA_MODEL,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": Config.OLLAMA_KEEP_ALIVE,
+            "options": {"num_predict": self.summary_max_tokens},
+        }
+        response = clients.http.post(Config.OLLAMA_BASE_URL + "/api/generate", json=payload, timeout=clients.ollama_timeout)
+        response.raise_for_status()
+        result = response.json()
+        record_generation(result)
+        return result.get("response", "").strip()
+
+_summary_queue = None
+_summary_queue_lock = threading.Lock()
+
+def get_summary_queue():
+    """Return the process-wide summary queue (started on first use)."""
+    global _summary_queue
+    if _summary_queue is None:
+        with _summary_queue_lock:
+            if _summary_queue is None:
+                _summary_queue = SummaryQueue(
+                    collection_name="papers",
+                    summary_collection=Config.SUMMARY_COLLECTION,
+                    section_max_tokens=Config.SUMMARY_SECTION_MAX_TOKENS,
+                    reduce_max_tokens=Config.SUMMARY_REDUCE_MAX_TOKENS,
+                    summary_max_tokens=Config.SUMMARY_MAX_TOKENS,
+                    concurrency=Config.SUMMARY_MAX_CONCURRENT_GENERATIONS,
+                ).start()
+    return _summary_queue
+
+@registry.register_collector
+def _summary_gauges():
+    if _summary_queue is None:
+        return []
+    stats = _summary_queue.stats()
+    return [
+        ("rag_summary_queue_depth", "Papers waiting to be summarized in this process", None, stats["pending"]),
+        ("rag_summaries_completed", "Papers summarized by this process", None, stats["completed"]),
+        ("rag_summaries_failed", "Papers whose summarization failed in this process", None, stats["failed"]),
+    ]
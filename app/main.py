@@ -1,15 +1,25 @@
 from flask import Flask
 from api.endpoint import api
+from api.health import health
+from api.metrics import metrics
 from api.swagger import init_swagger
 from config import Config
+from ingest.jobs import get_ingest_queue
+from startup import start_warmup
 
+# Heavy dependencies (chromadb, pymongo, PyPDF2) are imported on first use; models,
+# stores and the log indexes are warmed up in the background (GET /ready reports progress).
 app = Flask(__name__)
 
 app.config.from_object(Config)
 app.json.sort_keys = False
 
 app.register_blueprint(api, url_prefix='/api')  # Register API routes
+app.register_blueprint(metrics)  # Prometheus scrape target at /metrics
+app.register_blueprint(health)  # Liveness at /health, readiness at /ready
 init_swagger(app)  # Initialize Swagger docs (set to /swagger/)
+get_ingest_queue()  # Start ingest workers and resume unfinished jobs
+start_warmup()  # Create log indexes, open stores, load the Ollama models
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
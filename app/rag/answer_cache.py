@@ -0,0 +1,180 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from config import Config
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+class AnswerCache:
+    """
+    LRU + TTL cache of LLM answers.
+    - Exact layer: keyed by the normalized question plus a hash of the retrieved chunks' ids
+      and text, so answers built from an earlier upload of a paper never match again, in any worker.
+    - Similarity layer (optional): reuses an answer whose question embedding is within
+      `similarity_threshold` cosine similarity of a new question with the same target files.
+      Unit question embeddings live in rows of one NumPy matrix, so a lookup is a single
+      matrix-vector product over the entries for those files, computed outside the lock.
+    Entries remember which documents they were built from so re-uploads can invalidate them.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, similarity_threshold: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._by_files = {}         # target files -> keys of entries with an embedding
+        self._matrix = None         # row `entry["slot"]` holds an entry's unit question embedding
+        self._free_slots = []
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(question: str, chunk_ids: Iterable[str], texts: Iterable[str]) -> str:
+        chunks = sorted(f"{chunk_id}\x1e{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+                        for chunk_id, text in zip(chunk_ids, texts))
+        digest = hashlib.sha1("\x1f".join(chunks).encode("utf-8")).hexdigest()
+        return f"{normalize_question(question)}|{digest}"
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds and now - entry["created"] > self.ttl_seconds
+
+    def _drop(self, key):
+        """Remove an entry and release its embedding row; the caller holds the lock."""
+        entry = self._entries.pop(key)
+        if entry["slot"] is not None:
+            self._free_slots.append(entry["slot"])
+            keys = self._by_files[entry["files"]]
+            keys.discard(key)
+            if not keys:
+                del self._by_files[entry["files"]]
+        return entry
+
+    def _store_embedding(self, key, entry, embedding):
+        """Write the unit embedding into a free matrix row; the caller holds the lock."""
+        import numpy as np
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries + 1, len(vector)), dtype=np.float32)
+            self._free_slots = list(range(self.max_entries, -1, -1))
+        if norm == 0.0 or len(vector) != self._matrix.shape[1] or not self._free_slots:
+            return
+        entry["slot"] = self._free_slots.pop()
+        self._matrix[entry["slot"]] = vector / norm
+        self._by_files.setdefault(entry["files"], set()).add(key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Exact lookup; counts a hit or a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._drop(key)
+                self._counters["evictions"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["exact_hits"] += 1
+            return entry["answer"]
+
+    def find_similar(self, embedding: List[float], target_files: Iterable[str]) -> Optional[str]:
+        """Return a cached answer for a near-identical question over the same files, if enabled."""
+        if not self.similarity_threshold or not embedding:
+            return None
+        import numpy as np
+
+        probe = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(probe))
+        files = frozenset(target_files or ())
+        now = time.monotonic()
+        with self._lock:
+            if self._matrix is None or norm == 0.0 or len(probe) != self._matrix.shape[1]:
+                return None
+            keys = [key for key in self._by_files.get(files, ()) if not self._expired(self._entries[key], now)]
+            if not keys:
+                return None
+            # Fancy indexing copies the rows, so the product can run without the lock.
+            vectors = self._matrix[[self._entries[key]["slot"] for key in keys]]
+        scores = vectors @ (probe / norm)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        with self._lock:
+            entry = self._entries.get(keys[best])
+            if entry is None:
+                return None  # evicted meanwhile
+            self._entries.move_to_end(keys[best])
+            self._counters["similar_hits"] += 1
+            return entry["answer"]
+
+    def put(self, key: str, answer: str, embedding: Optional[List[float]] = None,
+            target_files: Iterable[str] = (), documents: Iterable[str] = ()):
+        files = frozenset(target_files or ())
+        entry = {
+            "answer": answer,
+            "created": time.monotonic(),
+            "files": files,
+            "documents": files | frozenset(documents),
+            "slot": None,
+        }
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            if embedding and self.similarity_threshold:
+                self._store_embedding(key, entry, embedding)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def invalidate_document(self, filename: str) -> int:
+        """Drop every entry built from `filename`; returns how many were removed."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if filename in entry["documents"]]
+            for key in stale:
+                self._drop(key)
+            self._counters["invalidations"] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_files.clear()
+            self._matrix = None
+            self._free_slots = []
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, size=len(self._entries))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Return the process-wide answer cache, or None when it is disabled in Config."""
+    global _cache
+    if not Config.ANSWER_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache(
+                    max_entries=Config.ANSWER_CACHE_MAX_ENTRIES,
+                    ttl_seconds=Config.ANSWER_CACHE_TTL_SECONDS,
+                    similarity_threshold=Config.ANSWER_CACHE_SIMILARITY_THRESHOLD or None,
+                )
+    return _cache
+
+def invalidate_cached_answers(filename: str) -> int:
+    """Drop cached answers built from `filename` (after a re-upload or delete)."""
+    cache = get_answer_cache()
+    return cache.invalidate_document(filename) if cache is not None else 0
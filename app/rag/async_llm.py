@@ -0,0 +1,118 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+from utils.embedding import retry_delay
+from utils.metrics import record_generation, span
+
+class GenerationQueueFull(Exception):
+    """Raised when a generation cannot get a slot: too many are already waiting, or the wait timed out."""
+
+class GenerationLimiter:
+    """
+    Caps concurrent LLM generations within one event loop.
+    Requests above `max_concurrent` wait for a slot in FIFO order; once
+    `max_waiting` are waiting (or a wait exceeds `wait_timeout` seconds)
+    further requests are rejected with GenerationQueueFull.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_waiting: int = 256, wait_timeout: Optional[float] = None):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise GenerationQueueFull(f"{self.waiting} generations already waiting")
+        self.waiting += 1
+        try:
+            with span("queue_wait"):
+                await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise GenerationQueueFull(f"no generation slot within {self.wait_timeout}s") from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "waiting": self.waiting, "rejected": self.rejected,
+                "max_concurrent": self.max_concurrent, "max_waiting": self.max_waiting}
+
+class AsyncOllamaClient:
+    """Non-blocking Ollama client (httpx.AsyncClient) for question embeddings and answer generation."""
+
+    def __init__(self, base_url: str, model: str, embedding_model: str, max_connections: int = 16,
+                 connect_timeout: float = 5, read_timeout: float = 300, keep_alive=None,
+                 max_retries: int = 3, backoff: float = 0.5):
+        self.model = model
+        self.embedding_model = embedding_model
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # pool=None: requests above max_connections wait for a free connection instead of failing.
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=None),
+        )
+
+    async def embed(self, text: str) -> List[float]:
+        """
+        Embed one text with /api/embed, like utils.embedding.get_embedding, retrying
+        429/5xx and connection errors with the EmbeddingEngine's backoff policy.
+        """
+        payload = {"model": self.embedding_model, "input": [text], "keep_alive": self.keep_alive}
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.post("/api/embed", json=payload)
+                response.raise_for_status()
+                embeddings = response.json().get("embeddings") or []
+                if len(embeddings) != 1:
+                    raise ValueError(f"Expected 1 embedding, got {len(embeddings)}")
+                return embeddings[0]
+            except (httpx.TransportError, httpx.HTTPStatusError, ValueError) as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                delay = retry_delay(attempt, status, self.max_retries, self.backoff)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yield answer tokens as Ollama streams them (NDJSON, one object per line)."""
+        payload = {"model": self.model, "prompt": prompt, "stream": True, "keep_alive": self.keep_alive}
+        async with self._client.stream("POST", "/api/generate", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                token = chunk.get("response", "")
+                if token:
+                    yield token
+                if chunk.get("done"):
+                    record_generation(chunk)
+                    break
+            else:
+                raise RuntimeError("Ollama stream ended before the answer was done")
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -1,77 +1,242 @@
 from rag.prompt_templates import build_prompt
-from database.chroma_client import get_chroma_client, get_relevant_chunks_and_metadata
+from database.chroma_client import (
+    get_chroma_client, get_chunks_by_ids, get_relevant_chunks_and_metadata, get_relevant_chunks_for_files,
+    get_relevant_chunks_for_queries, get_summaries, make_chunk_id
+)
+from database.lexical_index import get_lexical_index, reciprocal_rank_fusion
+from rag.answer_cache import AnswerCache, get_answer_cache, normalize_question
+from rag.context_packer import pack_context, pack_summaries
 from utils.embedding import get_embedding
-import requests
+from utils.metrics import record_context_packing, record_generation, record_route, span
+from utils.singleflight import SingleFlight
+import json
+import re
+from clients import get_clients
 from flask import current_app
-from typing import Optional
+from typing import Iterator, Optional
+
+# Concurrent identical queries share one retrieval (keyed by normalized question and target
+# files) and one LLM generation (keyed by prompt).
+_query_flight = SingleFlight("query")
+_generation_flight = SingleFlight("generation")
+
+# Questions about a paper as a whole ("what are the main findings in X.pdf"), answered from its summaries.
+_DOCUMENT_QUESTION_RE = re.compile(
+    r"\b(?:summar(?:y|ies|ize|ise|izing|ising)|overview|gist|tl;?dr|in a nutshell"
+    r"|(?:main|key|major|principal|overall|central)\s+(?:findings?|results?|contributions?|ideas?|points?"
+    r"|takeaways?|conclusions?|claims?|arguments?|themes?|messages?)"
+    r"|what\s+(?:is|are)\s+(?:\S+\s+){0,6}?about)\b",
+    re.IGNORECASE,
+)
+
+def is_document_question(question: str) -> bool:
+    """True for broad questions about whole papers rather than specific details in them."""
+    return bool(_DOCUMENT_QUESTION_RE.search(question))
 
 def run_rag_chain(question: str, target_files: Optional[list] = None) -> dict:
     """
     Full RAG pipeline:
-    1. Retrieve relevant context chunks from ChromaDB.
+    1. Retrieve relevant context chunks from ChromaDB (or, for broad questions about
+       whole papers, their precomputed summaries when the summary index is enabled).
     2. Build the prompt for the LLM.
     3. Query the LLM (Ollama) for an answer.
     4. Return the raw LLM response and context.
     """
+    prepared = prepare_rag_context(question, target_files)
+    # Joined from the shared token stream, so streaming and non-streaming duplicates cost one generation.
+    llm_output = "".join(answer_tokens(prepared))
+    return {
+        "llm_output": llm_output,
+        "context": prepared["context"],
+        "cache": prepared["cache"]
+    }
+
+def prepare_rag_context(question: str, target_files: Optional[list] = None, query_embedding: Optional[list] = None,
+                        retrieved: Optional[tuple] = None) -> dict:
+    """
+    Retrieval half of the pipeline: embed the question, fetch the relevant chunks
+    and build the prompt. Returns {"prompt", "context", "cached_answer", "cache", ...};
+    "cached_answer" is set when the answer cache already holds an answer for this query.
+    Pass `query_embedding` when the question has already been embedded (e.g. by the async path),
+    and `retrieved` = (documents, metadatas) when its chunks were already fetched (retrieve_many).
+    Concurrent calls for the same normalized question and target files share one result.
+    """
+    key = (normalize_question(question), tuple(sorted(target_files or [])))
+    return _query_flight.do(key, _prepare_rag_context, question, target_files, query_embedding, retrieved)
+
+def retrieve_many(query_embeddings: list, target_files: list) -> list:
+    """Vector retrieval for a batch of embedded questions, one Chroma query per file: [(documents, metadatas)]."""
+    top_k = current_app.config.get("DEFAULT_TOP_K", 5)
+    return get_relevant_chunks_for_queries(get_chroma_client(), "papers", query_embeddings, target_files, top_k=top_k)
+
+def _prepare_rag_context(question, target_files, query_embedding, retrieved):
+    prepared = {
+        "prompt": None,
+        "context": "",
+        "cached_answer": None,
+        "cache": None,
+        "cache_key": None,
+        "query_embedding": None,
+        "target_files": list(target_files or []),
+        "documents": [],
+    }
+    cache = get_answer_cache()
+
     # 1. Get ChromaDB client and collection name
     client = get_chroma_client()
     collection_name = "papers"  # or use your config if dynamic
 
     # 2. Get embedding for the question
-    query_embedding = get_embedding(question)
+    if query_embedding is None:
+        with span("embed_question"):
+            query_embedding = get_embedding(question)
+    prepared["query_embedding"] = query_embedding
+    if cache is not None:
+        with span("answer_cache"):
+            similar = cache.find_similar(query_embedding, prepared["target_files"])
+        if similar is not None:
+            prepared.update(cached_answer=similar, cache="similar")
+            return prepared
 
-    # 3. Retrieve relevant chunks
+    # 3. Retrieve relevant chunks, each target file filtered inside Chroma with its own top_k;
+    #    broad questions use the papers' summaries instead when every target file has them.
     top_k = current_app.config.get("DEFAULT_TOP_K", 5)
-    documents, metadatas = get_relevant_chunks_and_metadata(client, collection_name, query_embedding, top_k=top_k)
-    # Keep originals for fallback
-    orig_docs, orig_meta = documents, metadatas
-    # If target_files are specified, filter accordingly
-    if target_files:
-        filtered = []
-        # single-file filter or union for multiple
-        for doc, meta in zip(orig_docs, orig_meta):
-            name = meta.get('document_name') or meta.get('filename')
-            if name in target_files:
-                filtered.append((doc, meta))
-        if filtered:
-            documents, metadatas = zip(*filtered)
-        else:
-            documents, metadatas = [], []
-        # fallback: if too few filtered chunks, revert to no filter
-        min_chunks = current_app.config.get('MIN_FILE_CHUNKS', 1)
-        if len(documents) < min_chunks:
-            documents, metadatas = orig_docs, orig_meta
-    
+    summaries = None
+    if target_files and current_app.config.get("SUMMARY_INDEX_ENABLED") and is_document_question(question):
+        with span("summaries"):
+            summaries = _document_summaries(client, target_files)
+    record_route("chunks" if summaries is None else "summaries")
+    if summaries is not None:
+        documents, metadatas = summaries
+    elif retrieved is not None:
+        documents, metadatas = retrieved
+    else:
+        with span("retrieve"):
+            if target_files:
+                documents, metadatas = get_relevant_chunks_for_files(client, collection_name, query_embedding, target_files, top_k=top_k)
+            else:
+                documents, metadatas = get_relevant_chunks_and_metadata(client, collection_name, query_embedding, top_k=top_k)
+    if summaries is None and current_app.config.get("HYBRID_SEARCH_ENABLED"):
+        with span("lexical_fusion"):
+            documents, metadatas = _fuse_lexical_hits(client, collection_name, question, documents, metadatas, target_files, top_k)
+    prepared["documents"] = list(dict.fromkeys(meta.get('document_name') for meta in metadatas if meta))
+
+    if cache is not None:
+        hits = [(doc or "", meta) for doc, meta in zip(documents, metadatas) if meta]
+        chunk_ids = [f"{meta.get('document_name')}:{meta.get('chunk_id')}" if summaries is None
+                     else f"{meta.get('document_name')}:summary:{meta.get('kind')}:{meta.get('position')}"
+                     for _, meta in hits]
+        prepared["cache_key"] = AnswerCache.make_key(question, chunk_ids, [doc for doc, _ in hits])
     # For multi-file queries, prepend hint to question
     if target_files and len(target_files) > 1:
         hint = f"Compare content from {', '.join(target_files)}. Use only these documents.\n"
         question = hint + question
 
-    # Build context entries with metadata labels for accurate citations
-    context_entries = []
+    with span("build_prompt"):
+        # Labelled context entries for accurate citations: overlapping chunks merged, fitted to the token budget
+        if summaries is not None:
+            context, packing = pack_summaries(documents, metadatas, current_app.config.get("SUMMARY_CONTEXT_MAX_TOKENS", 0))
+        else:
+            context, packing = pack_context(documents, metadatas, current_app.config.get("CONTEXT_MAX_TOKENS", 0))
+        record_context_packing(packing)
+
+        # 4. Build prompt
+        prompt = build_prompt(context=context, question=question)
+    prepared.update(prompt=prompt, context=context)
+
+    if cache is not None:
+        with span("answer_cache"):
+            cached = cache.get(prepared["cache_key"])
+        if cached is not None:
+            prepared.update(cached_answer=cached, cache="exact")
+        else:
+            prepared["cache"] = "miss"
+    return prepared
+
+def _document_summaries(client, target_files):
+    """(documents, metadatas) of the target files' summaries, or None unless every file has a document summary."""
+    documents, metadatas = get_summaries(client, current_app.config["SUMMARY_COLLECTION"], list(target_files))
+    summarized = {meta.get("document_name") for meta in metadatas if meta and meta.get("kind") == "document"}
+    if not set(target_files) <= summarized:
+        return None
+    return documents, metadatas
+
+def _fuse_lexical_hits(client, collection_name, question, documents, metadatas, target_files, top_k):
+    """
+    Fuse the vector hits with BM25 hits from the lexical index using reciprocal rank
+    fusion, separately for each target file so every file keeps its own top_k chunks
+    (without target files: one fusion over everything, keeping top_k).
+    """
+    vector_hits, vector_ids_by_file = {}, {}
     for doc, meta in zip(documents, metadatas):
-        if isinstance(doc, str) and doc.strip():
-            label = f"[Document: {meta.get('document_name')}, Chunk: {meta.get('chunk_id')}]"
-            context_entries.append(f"{label}\n{doc}")
-    context = "\n\n".join(context_entries)
+        if meta:
+            chunk_id = make_chunk_id(meta.get('document_name'), meta.get('chunk_id'))
+            vector_hits[chunk_id] = (doc, meta)
+            vector_ids_by_file.setdefault(meta.get('document_name') if target_files else None, []).append(chunk_id)
+    index = get_lexical_index()
+    rrf_k = current_app.config.get("RRF_K", 60)
+    fused_by_file = []
+    for filename in (target_files or [None]):
+        lexical_ids = [chunk_id for chunk_id, _ in index.search(
+            question, top_k=top_k, document_names=[filename] if filename is not None else None)]
+        fused_by_file.append(reciprocal_rank_fusion([vector_ids_by_file.get(filename, []), lexical_ids], k=rrf_k)[:top_k])
+    # Interleave the files' rankings so the context keeps relevance order across files.
+    fused = [ids[rank] for rank in range(top_k) for ids in fused_by_file if rank < len(ids)]
+    # Chunks found only lexically still need their text and metadata from Chroma.
+    missing = [chunk_id for chunk_id in fused if chunk_id not in vector_hits]
+    vector_hits.update(get_chunks_by_ids(client, collection_name, missing))
+    hits = [vector_hits[chunk_id] for chunk_id in fused if chunk_id in vector_hits]
+    return [doc for doc, _ in hits], [meta for _, meta in hits]
 
-    # 4. Build prompt
-    prompt = build_prompt(context=context, question=question)
+def cache_answer(prepared: dict, answer: str):
+    """Store a freshly generated answer for a prepared query in the answer cache."""
+    cache = get_answer_cache()
+    if cache is None or prepared.get("cache_key") is None or not answer:
+        return
+    cache.put(prepared["cache_key"], answer, embedding=prepared["query_embedding"],
+              target_files=prepared["target_files"], documents=prepared["documents"])
 
-    # 5. Query Ollama LLM
+def answer_tokens(prepared: dict) -> Iterator[str]:
+    """Yield the answer for a prepared query: the cached answer in one piece, or streamed from the LLM and then cached."""
+    if prepared["cached_answer"] is not None:
+        yield prepared["cached_answer"]
+        return
+    parts = []
+    with span("generate"):
+        # Identical in-flight prompts share one Ollama stream; late joiners replay the tokens so far.
+        for token in _generation_flight.stream(prepared["prompt"], stream_answer, prepared["prompt"]):
+            parts.append(token)
+            yield token
+    # Reached only when the stream ended with Ollama's "done": a cut-off or abandoned stream raises instead.
+    cache_answer(prepared, "".join(parts))
+
+def stream_answer(prompt: str) -> Iterator[str]:
+    """Query the Ollama LLM in streaming mode, yielding answer tokens as they arrive."""
     ollama_url = current_app.config["OLLAMA_BASE_URL"] + "/api/generate"
     ollama_model = current_app.config["OLLAMA_MODEL"]
     payload = {
         "model": ollama_model,
         "prompt": prompt,
-        "stream": False
+        "stream": True,
+        "keep_alive": current_app.config.get("OLLAMA_KEEP_ALIVE")
     }
-    response = requests.post(ollama_url, json=payload)
-    response.raise_for_status()
-    llm_output = response.json().get("response", "")
-
-    # 6. Return for further parsing
-    return {
-        "llm_output": llm_output,
-        "context": context
-    }
\ No newline at end of file
+    clients = get_clients()
+    with clients.http.post(ollama_url, json=payload, stream=True, timeout=clients.ollama_timeout) as response:
+        response.raise_for_status()
+        # Ollama streams NDJSON: one {"response": "<token>", "done": false} object per line.
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            token = chunk.get("response", "")
+            if token:
+                yield token
+            if chunk.get("done"):
+                # The final object carries eval_count/eval_duration for the whole generation.
+                record_generation(chunk)
+                break
+        else:
+            # A connection cut mid-answer must not pass for a complete (and cacheable) answer.
+            raise RuntimeError("Ollama stream ended before the answer was done")
@@ -0,0 +1,141 @@
+from typing import Dict, List, Tuple
+
+from utils.chunker import count_tokens
+
+# Shorter suffix/prefix matches are coincidences (a shared "the"), not chunk overlap.
+MIN_OVERLAP_CHARS = 16
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b` (KMP prefix function)."""
+    n = min(len(a), len(b))
+    if n < MIN_OVERLAP_CHARS:
+        return 0
+    s = b[:n] + "\x00" + a[-n:]
+    prefix = [0] * len(s)
+    for i in range(1, len(s)):
+        k = prefix[i - 1]
+        while k and s[i] != s[k]:
+            k = prefix[k - 1]
+        if s[i] == s[k]:
+            k += 1
+        prefix[i] = k
+    return prefix[-1] if prefix[-1] >= MIN_OVERLAP_CHARS else 0
+
+def _adjacent(prev: dict, meta: dict) -> bool:
+    """True if `meta` continues or overlaps the chunk described by `prev` in the same document."""
+    prev_id, chunk_id = prev.get("chunk_id"), meta.get("chunk_id")
+    if isinstance(prev_id, int) and isinstance(chunk_id, int) and chunk_id == prev_id + 1:
+        return True
+    prev_end, start = prev.get("char_end"), meta.get("char_start")
+    return isinstance(prev_end, int) and isinstance(start, int) and start <= prev_end
+
+def _merge_document(hits: List[tuple]) -> List[dict]:
+    """Merge one document's hits (rank, text, meta) into blocks of consecutive or overlapping chunks."""
+    hits = sorted(hits, key=lambda hit: (hit[2].get("chunk_id") if isinstance(hit[2].get("chunk_id"), int) else 1 << 62, hit[0]))
+    blocks = []
+    for rank, text, meta in hits:
+        text = text.strip()
+        block = blocks[-1] if blocks else None
+        if block is not None and _adjacent(block["last_meta"], meta):
+            if text not in block["text"]:
+                overlap = _overlap(block["text"], text)
+                block["text"] = block["text"] + text[overlap:] if overlap else f"{block['text']} {text}"
+            block.update(last_meta=meta, last_id=meta.get("chunk_id"), rank=min(block["rank"], rank))
+            continue
+        if any(text in other["text"] for other in blocks):
+            continue  # repeated span, e.g. a chunk returned twice or wholly inside an overlap
+        blocks.append({"document_name": meta.get("document_name"), "first_id": meta.get("chunk_id"),
+                       "last_id": meta.get("chunk_id"), "last_meta": meta, "text": text, "rank": rank})
+    return blocks
+
+def _render(block: dict) -> str:
+    chunk = block["first_id"] if block["first_id"] == block["last_id"] else f"{block['first_id']}-{block['last_id']}"
+    return f"[Document: {block['document_name']}, Chunk: {chunk}]\n{block['text']}"
+
+def _truncate(text: str, max_tokens: int) -> str:
+    words, tokens = [], 0
+    for word in text.split():
+        tokens += count_tokens(word)
+        if tokens > max_tokens:
+            break
+        words.append(word)
+    return " ".join(words)
+
+def pack_context(documents: List[str], metadatas: List[dict], max_tokens: int = 0) -> Tuple[str, Dict[str, int]]:
+    """
+    Build the prompt context from retrieved chunks, given in relevance order.
+    - Consecutive (chunk_id) or overlapping (char offsets) chunks of a document are merged
+      into one block under a single label, with the overlapping text kept once.
+    - Chunks whose text is already contained in a selected block are dropped.
+    - Chunks are admitted most relevant first while the context fits `max_tokens`
+      (0 = no limit); blocks are ordered by their most relevant chunk.
+    Returns (context, stats) where stats holds chunk counts and tokens before/after packing.
+    """
+    hits = [(rank, doc, meta or {}) for rank, (doc, meta) in enumerate(zip(documents, metadatas))
+            if isinstance(doc, str) and doc.strip()]
+    naive = "\n\n".join(f"[Document: {meta.get('document_name')}, Chunk: {meta.get('chunk_id')}]\n{doc}"
+                        for _, doc, meta in hits)
+
+    by_document: Dict[str, list] = {}
+    blocks_by_document: Dict[str, list] = {}
+    tokens_by_document: Dict[str, int] = {}
+    total, used = 0, 0
+    for hit in hits:
+        name = hit[2].get("document_name")
+        candidate = by_document.get(name, []) + [hit]
+        blocks = _merge_document(candidate)
+        tokens = sum(count_tokens(_render(block)) for block in blocks)
+        if max_tokens and total - tokens_by_document.get(name, 0) + tokens > max_tokens:
+            continue
+        total += tokens - tokens_by_document.get(name, 0)
+        by_document[name], blocks_by_document[name], tokens_by_document[name] = candidate, blocks, tokens
+        used += 1
+
+    if not used and hits:
+        # Even the most relevant chunk is over budget: keep as much of it as fits.
+        rank, text, meta = hits[0]
+        label_tokens = count_tokens(_render({"document_name": meta.get("document_name"), "first_id": meta.get("chunk_id"),
+                                             "last_id": meta.get("chunk_id"), "text": ""}))
+        blocks_by_document = {meta.get("document_name"): _merge_document([(rank, _truncate(text, max_tokens - label_tokens), meta)])}
+        used = 1
+
+    blocks = sorted((block for blocks in blocks_by_document.values() for block in blocks), key=lambda block: block["rank"])
+    context = "\n\n".join(_render(block) for block in blocks)
+    tokens_retrieved, tokens_packed = count_tokens(naive), count_tokens(context)
+    return context, {
+        "chunks_retrieved": len(hits),
+        "chunks_used": used,
+        "blocks": len(blocks),
+        "tokens_retrieved": tokens_retrieved,
+        "tokens_packed": tokens_packed,
+        "tokens_saved": tokens_retrieved - tokens_packed,
+    }
+
+def pack_summaries(documents: List[str], metadatas: List[dict], max_tokens: int = 0) -> Tuple[str, Dict[str, int]]:
+    """
+    Build the prompt context from stored paper summaries (see ingest.summaries).
+    Every paper's document summary is admitted first, then section summaries in paper order,
+    while the context fits `max_tokens` (0 = no limit). Entries are labelled with their
+    section so answers can cite them. Returns (context, stats) like pack_context.
+    """
+    entries = sorted(
+        ((meta or {}, doc.strip()) for doc, meta in zip(documents, metadatas) if isinstance(doc, str) and doc.strip()),
+        key=lambda entry: (entry[0].get("kind") != "document", entry[0].get("position", 0), entry[0].get("document_name") or ""))
+    rendered = [f"[Document: {meta.get('document_name')}, Section: {meta.get('section')}]\n{text}" for meta, text in entries]
+    selected, total = [], 0
+    for block in rendered:
+        tokens = count_tokens(block)
+        if max_tokens and total + tokens > max_tokens:
+            continue
+        selected.append(block)
+        total += tokens
+    context = "\n\n".join(selected)
+    tokens_retrieved, tokens_packed = count_tokens("\n\n".join(rendered)), count_tokens(context)
+    return context, {
+        "chunks_retrieved": len(rendered),
+        "chunks_used": len(selected),
+        "blocks": len(selected),
+        "tokens_retrieved": tokens_retrieved,
+        "tokens_packed": tokens_packed,
+        "tokens_saved": tokens_retrieved - tokens_packed,
+    }
@@ -18,4 +18,41 @@ def parse_llm_output(llm_output: str) -> dict:
     return {
         "answer": cleaned,
         "citations": citations
-    }
\ No newline at end of file
+    }
+
+CITATION_PREFIX = "[Document:"
+
+class StreamingCitationParser:
+    """
+    Incrementally extract citations from a token stream.
+    Each call to feed() returns the citations completed by that token; a citation
+    split across several tokens is reported once its closing bracket arrives.
+    """
+
+    def __init__(self, max_pending: int = 500):
+        self._parts: List[str] = []
+        self._pending = ""
+        self._max_pending = max_pending
+
+    def feed(self, token: str) -> List[str]:
+        self._parts.append(token)
+        text = self._pending + token
+        citations = []
+        end = 0
+        for match in re.finditer(r"\[Document:.*?\]", text):
+            citations.append(match.group())
+            end = match.end()
+        # Keep only a trailing "[..." that could still grow into a citation.
+        rest = text[end:]
+        start = rest.rfind("[")
+        pending = rest[start:] if start != -1 else ""
+        if pending and not (pending.startswith(CITATION_PREFIX) or CITATION_PREFIX.startswith(pending)):
+            pending = ""
+        if "\n" in pending or len(pending) > self._max_pending:
+            pending = ""
+        self._pending = pending
+        return citations
+
+    def finish(self) -> dict:
+        """Parse the complete streamed output, as parse_llm_output does for a full response."""
+        return parse_llm_output("".join(self._parts))
@@ -28,4 +28,36 @@ def build_prompt(context: str, question: str) -> str:
     """
     Combine the system prompt, context, and user question into a single prompt for the LLM.
     """
-    return SYSTEM_PROMPT + USER_PROMPT_TEMPLATE.format(context=context, question=question)
\ No newline at end of file
+    return SYSTEM_PROMPT + USER_PROMPT_TEMPLATE.format(context=context, question=question)
+
+SECTION_SUMMARY_TEMPLATE = """
+Summarize the following part of the paper {document} ({section}).
+State its purpose, methods, results and conclusions, keeping concrete numbers and names.
+Use at most five sentences and only information from the text.
+
+Text:
+{text}
+
+Summary:
+"""
+
+DOCUMENT_SUMMARY_TEMPLATE = """
+Below are summaries of consecutive parts of the paper {document}.
+Combine them into one summary of {scope}: its research question, approach, main findings
+and conclusions, keeping concrete numbers and names. Use at most eight sentences and only
+information from the summaries.
+
+Summaries:
+{summaries}
+
+Summary:
+"""
+
+def build_section_summary_prompt(document: str, section: str, text: str) -> str:
+    """Map step of the summary index: summarize one section (or part of one) of a paper."""
+    return SECTION_SUMMARY_TEMPLATE.format(document=document, section=section, text=text)
+
+def build_document_summary_prompt(document: str, summaries: str, partial: bool = False) -> str:
+    """Reduce step of the summary index: combine section summaries into one (`partial` for an intermediate level)."""
+    scope = "these parts of the paper" if partial else "the whole paper"
+    return DOCUMENT_SUMMARY_TEMPLATE.format(document=document, summaries=summaries, scope=scope)
@@ -0,0 +1,152 @@
+"""
+Worker warm-up and readiness.
+
+start_warmup() runs once per process, in a background thread, so importing the app
+stays fast:
+- log_indexes: create the query log indexes in MongoDB;
+- stores: open the vector store, load the document registry and the lexical index;
+- embedding_model / generation_model: load EMBEDDING_MODEL and OLLAMA_MODEL into
+  Ollama with keep_alive=OLLAMA_KEEP_ALIVE, so the first query does not wait for
+  model loading and the models stay resident.
+The model steps are retried with backoff until they succeed; the others are best
+effort. The worker is ready (GET /ready) once both models are loaded.
+"""
+import logging
+import os
+import threading
+import time
+
+from clients import get_clients
+from config import Config
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+class Warmup:
+    """Runs the warm-up steps once and reports their progress."""
+
+    STEPS = ("log_indexes", "stores", "embedding_model", "generation_model")
+
+    def __init__(self, config=Config):
+        self.config = config
+        self._steps = {name: {"status": "pending", "attempts": 0} for name in self.STEPS}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._started = None
+        self._ready_after = None
+
+    def start(self):
+        """Start warming up in the background (no-op if already started)."""
+        with self._lock:
+            if self._thread is not None or self._ready.is_set():
+                return self
+            self._started = time.monotonic()
+            if not self.config.WARMUP_ENABLED:
+                for step in self._steps.values():
+                    step["status"] = "skipped"
+                self._finish()
+                return self
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        self._step("log_indexes", self._create_log_indexes)
+        self._step("stores", self._open_stores)
+        self._step("embedding_model", self._load_embedding_model, retry=True)
+        self._step("generation_model", self._load_generation_model, retry=True)
+        with self._lock:
+            self._finish()
+        logger.info("Warm-up finished in %.1fs", self._ready_after)
+
+    def _finish(self):
+        self._ready_after = round(time.monotonic() - self._started, 3)
+        self._ready.set()
+
+    def _update(self, name, **fields):
+        with self._lock:
+            self._steps[name].update(fields)
+
+    def _step(self, name, fn, retry=False):
+        delay = self.config.WARMUP_RETRY_INTERVAL
+        while True:
+            with self._lock:
+                self._steps[name]["attempts"] += 1
+                self._steps[name]["status"] = "running"
+            started = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                if not retry:
+                    logger.warning("Warm-up step %s failed", name, exc_info=True)
+                    self._update(name, status="failed", error=str(e))
+                    return
+                logger.warning("Warm-up step %s failed, retrying in %.0fs: %s", name, delay, e)
+                self._update(name, status="retrying", error=str(e))
+                time.sleep(delay)
+                delay = min(delay * 2, self.config.WARMUP_MAX_RETRY_INTERVAL)
+                continue
+            self._update(name, status="done", error=None, seconds=round(time.perf_counter() - started, 3))
+            return
+
+    def _create_log_indexes(self):
+        from database.mongo_client import get_mongo_client, init_log_indexes
+        init_log_indexes(get_mongo_client()[self.config.MONGO_DB_NAME], self.config.LOGS_COLLECTION)
+
+    def _open_stores(self):
+        from database.chroma_client import get_chroma_client
+        from database.document_registry import get_document_registry
+        get_chroma_client()
+        get_document_registry().filenames()
+        if self.config.HYBRID_SEARCH_ENABLED:
+            from database.lexical_index import get_lexical_index
+            get_lexical_index()
+
+    def _ollama(self, path, payload):
+        clients = get_clients()
+        response = clients.http.post(self.config.OLLAMA_BASE_URL + path, json=payload, timeout=clients.ollama_timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _load_embedding_model(self):
+        self._ollama("/api/embed", {"model": self.config.EMBEDDING_MODEL, "input": ["warm-up"],
+                                    "keep_alive": self.config.OLLAMA_KEEP_ALIVE})
+
+    def _load_generation_model(self):
+        # An empty prompt only loads the model; Ollama answers with done_reason "load".
+        self._ollama("/api/generate", {"model": self.config.OLLAMA_MODEL, "prompt": "", "stream": False,
+                                       "keep_alive": self.config.OLLAMA_KEEP_ALIVE})
+
+    def ready(self):
+        return self._ready.is_set()
+
+    def status(self):
+        with self._lock:
+            return {
+                "ready": self._ready.is_set(),
+                "ready_after_seconds": self._ready_after,
+                "steps": {name: dict(step) for name, step in self._steps.items()},
+            }
+
+_warmup = None
+_warmup_pid = None
+_warmup_lock = threading.Lock()
+
+def get_warmup():
+    """Return this process's warm-up (a forked worker gets its own)."""
+    global _warmup, _warmup_pid
+    if _warmup is None or _warmup_pid != os.getpid():
+        with _warmup_lock:
+            if _warmup is None or _warmup_pid != os.getpid():
+                _warmup = Warmup()
+                _warmup_pid = os.getpid()
+    return _warmup
+
+def start_warmup():
+    """Start this process's warm-up if it is not running yet."""
+    return get_warmup().start()
+
+@registry.register_collector
+def _readiness_gauge():
+    return [("rag_worker_ready", "1 once this worker has finished warming up", None, 1 if get_warmup().ready() else 0)]
@@ -0,0 +1,230 @@
+import re
+
+# Approximate tokenizer: words and individual punctuation marks. Close enough to
+# WordPiece/BPE counts for sizing chunks, and linear in the input length.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_RE = re.compile(r"\S+")
+# A sentence ends at . ! or ? (optionally followed by closing quotes/brackets) before whitespace or end of line.
+_SENTENCE_END_RE = re.compile(r"[.!?][\"')\]]*(?=\s|$)")
+_NUMBERED_HEADING_RE = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+[A-Z][^.!?]*$")
+_CAPS_HEADING_RE = re.compile(r"^[A-Z][A-Z0-9 &\-]{2,60}$")
+_NAMED_HEADINGS = {
+    "abstract", "introduction", "background", "related work", "method", "methods",
+    "methodology", "approach", "experiments", "experimental setup", "evaluation",
+    "results", "discussion", "conclusion", "conclusions", "future work", "limitations",
+    "references", "bibliography", "acknowledgments", "acknowledgements", "appendix",
+}
+_ABBREVIATIONS = {"al", "fig", "figs", "eq", "eqs", "e.g", "i.e", "etc", "vs", "no", "ref", "refs", "sec", "cf", "approx", "resp"}
+
+def count_tokens(text):
+    """Approximate the number of model tokens in `text`."""
+    return len(_TOKEN_RE.findall(text))
+
+def is_heading(line):
+    """Heuristically decide whether a stripped line is a section heading."""
+    if not line or len(line) > 100 or len(line.split()) > 12:
+        return False
+    if line.lower().rstrip(":") in _NAMED_HEADINGS:
+        return True
+    if _NUMBERED_HEADING_RE.match(line):
+        return True
+    return bool(_CAPS_HEADING_RE.match(line)) and any(c.isalpha() for c in line)
+
+def _is_abbreviation(text, end):
+    """True if the period ending at text[end - 1] closes a known abbreviation such as "et al."."""
+    start = end - 1
+    while start > 0 and not text[start - 1].isspace():
+        start -= 1
+    word = text[start:end - 1].lower().lstrip("([")
+    return word in _ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+def iter_units(pages):
+    """
+    Split a (page_number, text) stream into structural units, in a single pass:
+    ("heading", text, start, end, page, page), ("break", ...) at paragraph breaks and
+    ("sentence", text, start, end, page_start, page_end). Offsets refer to the pages
+    joined with newlines, as produced by extract_text_from_pdf. Sentences may span
+    lines and pages.
+    """
+    offset = 0
+    pending = []            # pieces of the sentence being assembled
+    pending_start = pending_page = None
+    first = True
+
+    def flush_pending(end, page):
+        nonlocal pending, pending_start, pending_page
+        unit = ("sentence", " ".join(pending), pending_start, end, pending_page, page)
+        pending, pending_start, pending_page = [], None, None
+        return unit
+
+    for page_number, page_text in pages:
+        if not first:
+            offset += 1  # the newline that joins pages
+        first = False
+        for line in page_text.split("\n"):
+            line_start = offset
+            offset += len(line) + 1
+            stripped = line.strip()
+            if not stripped:
+                if pending:
+                    yield flush_pending(line_start, page_number)
+                yield ("break", "", line_start, line_start, page_number, page_number)
+                continue
+            lead = len(line) - len(line.lstrip())
+            if is_heading(stripped):
+                if pending:
+                    yield flush_pending(line_start, page_number)
+                yield ("heading", stripped, line_start + lead, line_start + lead + len(stripped), page_number, page_number)
+                continue
+            # Emit every sentence completed inside this line; keep the remainder pending.
+            cursor = lead
+            for match in _SENTENCE_END_RE.finditer(line, lead):
+                end = match.end()
+                if line[match.start()] == "." and _is_abbreviation(line, match.start() + 1):
+                    continue
+                piece = line[cursor:end].strip()
+                if piece:
+                    if pending_start is None:
+                        pending_start = line_start + cursor + (len(line[cursor:end]) - len(line[cursor:end].lstrip()))
+                        pending_page = page_number
+                    pending.append(piece)
+                if pending:
+                    yield flush_pending(line_start + end, page_number)
+                cursor = end
+            rest = line[cursor:].strip()
+            if rest:
+                if pending_start is None:
+                    pending_start = line_start + cursor + (len(line[cursor:]) - len(line[cursor:].lstrip()))
+                    pending_page = page_number
+                pending.append(rest)
+        offset -= 1  # no newline after the page's last line
+    if pending:
+        yield flush_pending(offset, pending_page)
+
+class _ChunkBuilder:
+    """Greedy packer of units into token-budgeted chunks."""
+
+    def __init__(self, filename, max_tokens, overlap_tokens):
+        self.filename = filename
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.section = ""
+        self.units = []      # (text, start, end, page_start, page_end, tokens)
+        self.tokens = 0
+        self.fresh = 0       # units added since the last emitted chunk (excludes carried overlap)
+        self.chunk_id = 0
+
+    def add(self, unit):
+        self.units.append(unit)
+        self.tokens += unit[5]
+        self.fresh += 1
+
+    def emit(self, carry=True):
+        """Return the current chunk (or None) and start the next one, keeping overlap if requested."""
+        if not self.fresh:
+            self.units, self.tokens = [], 0
+            return None
+        units = self.units
+        chunk = {
+            "text": " ".join(u[0] for u in units),
+            "metadata": {
+                "document_name": self.filename,
+                "chunk_id": self.chunk_id,
+                "section": self.section,
+                "char_start": units[0][1],
+                "char_end": units[-1][2],
+                "page_start": units[0][3],
+                "page_end": units[-1][4],
+                "token_count": self.tokens,
+            }
+        }
+        self.chunk_id += 1
+        kept, kept_tokens = [], 0
+        if carry and self.overlap_tokens:
+            for unit in reversed(units):
+                if kept_tokens + unit[5] > self.overlap_tokens:
+                    break
+                kept.insert(0, unit)
+                kept_tokens += unit[5]
+        self.units, self.tokens, self.fresh = kept, kept_tokens, 0
+        return chunk
+
+def chunk_document(pages, filename, max_tokens=256, overlap_tokens=0, min_paragraph_fill=0.5):
+    """
+    Section-, paragraph- and sentence-aware chunker over a (page_number, text) stream.
+    - A section heading always starts a new chunk; its title is kept in metadata["section"].
+      A heading is never a chunk on its own: it shares a chunk with the start of its section
+      (or with a directly following subsection heading).
+    - A paragraph break ends the chunk once it is at least `min_paragraph_fill` of the budget.
+    - Otherwise sentences are packed until the next one would exceed `max_tokens`;
+      sentences longer than the budget are split on word boundaries.
+    - `overlap_tokens` carries trailing whole sentences into the next chunk of the same section.
+    Yields {"text", "metadata"} dicts with char and page offsets. Runs in linear time.
+    """
+    builder = _ChunkBuilder(filename, max_tokens, overlap_tokens)
+    heading_only = False    # the builder holds only heading(s) of a section with no text yet
+    for kind, text, start, end, page_start, page_end in iter_units(pages):
+        if kind == "break":
+            if builder.tokens >= max_tokens * min_paragraph_fill and not heading_only:
+                chunk = builder.emit()
+                if chunk:
+                    yield chunk
+            continue
+        tokens = count_tokens(text)
+        if kind == "heading":
+            if not heading_only:
+                chunk = builder.emit(carry=False)
+                if chunk:
+                    yield chunk
+            builder.section = text
+            builder.add((text, start, end, page_start, page_end, tokens))
+            heading_only = True
+            continue
+        if tokens > max_tokens or (heading_only and builder.tokens + tokens > max_tokens):
+            # Over-budget sentences are split; the first piece fills the chunk of a pending heading.
+            if heading_only:
+                first_budget = max(1, max_tokens - builder.tokens)
+            else:
+                first_budget = max_tokens
+                chunk = builder.emit(carry=False)
+                if chunk:
+                    yield chunk
+            for piece in _split_long_sentence(text, start, end, page_start, page_end, max_tokens, first_budget):
+                builder.add(piece)
+                chunk = builder.emit(carry=False)
+                if chunk:
+                    yield chunk
+            heading_only = False
+            continue
+        heading_only = False
+        if builder.tokens + tokens > max_tokens:
+            chunk = builder.emit()
+            if chunk:
+                yield chunk
+            if builder.tokens + tokens > max_tokens:
+                builder.units, builder.tokens = [], 0
+        builder.add((text, start, end, page_start, page_end, tokens))
+    chunk = builder.emit(carry=False)
+    if chunk:
+        yield chunk
+
+def _split_long_sentence(text, start, end, page_start, page_end, max_tokens, first_budget=None):
+    """
+    Split an over-budget sentence into word-aligned pieces of at most `max_tokens`
+    (the first piece at most `first_budget`, when given).
+    """
+    budget = first_budget or max_tokens
+    words, tokens, piece_start, piece_end = [], 0, start, start
+    for match in _WORD_RE.finditer(text):
+        word_tokens = count_tokens(match.group())
+        if words and tokens + word_tokens > budget:
+            yield (" ".join(words), piece_start, piece_end, page_start, page_end, tokens)
+            words, tokens, budget = [], 0, max_tokens
+        if not words:
+            piece_start = min(start + match.start(), end)
+        words.append(match.group())
+        tokens += word_tokens
+        # Offsets are approximate: sentence text joins wrapped lines with single spaces.
+        piece_end = min(start + match.end(), end)
+    if words:
+        yield (" ".join(words), piece_start, end, page_start, page_end, tokens)
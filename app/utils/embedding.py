@@ -1,20 +1,164 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from clients import get_clients
+from config import Config
+from utils.embedding_cache import EmbeddingCache
+from utils.singleflight import SingleFlight
+
+# Status codes worth retrying: rate limiting and transient server errors.
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
-def get_embedding(text, api_url="http://ollama:11434/api/embeddings", model="nomic-embed-text"):
+def retry_delay(attempt, status, max_retries, backoff):
     """
-    Get embedding for a single text chunk from Ollama or another embedding service.
+    Seconds to wait before retrying a failed Ollama request (attempt counts from 0), or None
+    to give up: after `max_retries`, or at once on a status that retrying will not fix.
+    """
+    if attempt >= max_retries or (status is not None and status not in RETRYABLE_STATUS):
+        return None
+    return backoff * (2 ** attempt)
+
+# Identical concurrent embedding requests share one call to Ollama.
+_embedding_flight = SingleFlight("embedding")
+
+def get_embedding(text):
     """
-    payload = {
-        "model": model,
-        "prompt": text
-    }
-    response = requests.post(api_url, json=payload)
-    response.raise_for_status()
-    data = response.json()
-    return data.get("embedding")
-
-def get_embeddings(chunks, api_url="http://ollama:11434/api/embeddings", model="nomic-embed-text"):
+    Embed one question through the process-wide engine (/api/embed, the endpoint chunks
+    are embedded with, so questions and chunks share one vector space). Question text
+    bypasses the chunk embedding cache.
     """
-    Get embeddings for a list of text chunks.
+    return _embedding_flight.do((Config.EMBEDDING_MODEL, text), _fetch_embedding, text)
+
+def _fetch_embedding(text):
+    return get_query_embeddings([text])[0]
+
+def get_query_embeddings(texts):
+    """Embed a list of questions in /api/embed batches, bypassing the chunk embedding cache."""
+    return get_embedding_engine().embed(texts, use_cache=False)
+
+def _pooled_session(pool_size):
+    """Return a keep-alive session whose connection pool fits `pool_size` parallel requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class EmbeddingEngine:
     """
-    return [get_embedding(chunk, api_url, model) for chunk in chunks]
+    Embed many texts through Ollama's batch endpoint (/api/embed).
+    Texts are split into batches of `batch_size`, at most `concurrency` batches are
+    in flight at once over a shared pooled session, failed batches are retried with
+    exponential backoff, and results come back in input order.
+    With an EmbeddingCache, only texts missing from the cache are sent to Ollama.
+    """
+
+    def __init__(self, base_url="http://ollama:11434", model="nomic-embed-text", batch_size=64,
+                 concurrency=4, max_retries=3, backoff=0.5, timeout=120, session=None, cache=None, keep_alive=None):
+        if batch_size < 1 or concurrency < 1:
+            raise ValueError("batch_size and concurrency must be positive")
+        self.url = base_url.rstrip("/") + "/api/embed"
+        self.model = model
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._owns_session = session is None
+        self.session = session or _pooled_session(concurrency)
+        self.cache = cache
+        self.keep_alive = keep_alive
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+
+    def embed(self, texts, stats=None, use_cache=True):
+        """
+        Return one embedding per text, in the same order as `texts`.
+        If a `stats` dict is given, it is filled with counts of cached and embedded texts.
+        use_cache=False skips the cache in both directions (e.g. for one-off question text).
+        """
+        texts = list(texts)
+        if self.cache is None or not use_cache:
+            if stats is not None:
+                stats.update(cached=0, embedded=len(texts))
+            return self._embed_all(texts)
+
+        keys = [EmbeddingCache.make_key(self.model, text) for text in texts]
+        found = self.cache.get_many(keys)
+        # Identical texts share a key, so each distinct miss is embedded once.
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            vectors = self._embed_all(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        if stats is not None:
+            stats.update(cached=len(texts) - len(missing), embedded=len(missing))
+        return [found[key] for key in keys]
+
+    def _embed_all(self, texts):
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            results = [self._embed_batch(batches[0])]
+        else:
+            # Executor.map yields in submission order, so output order matches input order.
+            results = self._executor.map(self._embed_batch, batches)
+        return [vector for batch in results for vector in batch]
+
+    def _embed_batch(self, batch):
+        payload = {"model": self.model, "input": batch, "keep_alive": self.keep_alive}
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                embeddings = response.json().get("embeddings") or []
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+                return embeddings
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError, ValueError) as e:
+                delay = retry_delay(attempt, getattr(getattr(e, "response", None), "status_code", None),
+                                    self.max_retries, self.backoff)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    def close(self):
+        """Stop the worker threads and release pooled connections."""
+        self._executor.shutdown(wait=True)
+        if self._owns_session:
+            self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+def get_embedding_engine():
+    """Return the process-wide embedding engine, configured from Config (a forked worker gets its own thread pool)."""
+    global _engine, _engine_pid
+    if _engine is None or _engine_pid != os.getpid():
+        with _engine_lock:
+            if _engine is None or _engine_pid != os.getpid():
+                _engine = EmbeddingEngine(
+                    base_url=Config.OLLAMA_BASE_URL,
+                    model=Config.EMBEDDING_MODEL,
+                    batch_size=Config.EMBEDDING_BATCH_SIZE,
+                    concurrency=Config.EMBEDDING_CONCURRENCY,
+                    max_retries=Config.EMBEDDING_MAX_RETRIES,
+                    backoff=Config.EMBEDDING_RETRY_BACKOFF,
+                    timeout=Config.EMBEDDING_TIMEOUT,
+                    session=get_clients().http,
+                    cache=EmbeddingCache(Config.EMBEDDING_CACHE_PATH) if Config.EMBEDDING_CACHE_ENABLED else None,
+                    keep_alive=Config.OLLAMA_KEEP_ALIVE,
+                )
+                _engine_pid = os.getpid()
+    return _engine
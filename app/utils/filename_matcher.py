@@ -0,0 +1,57 @@
+from collections import deque
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher (Aho-Corasick automaton).
+    Build once from a {pattern: value} mapping, then scan any text in
+    O(len(text) + matches), independent of how many patterns there are.
+    """
+
+    def __init__(self, patterns):
+        # Trie stored as parallel lists indexed by state number; state 0 is the root.
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern, value in patterns.items():
+            if pattern:
+                self._insert(pattern, value)
+        self._build_failure_links()
+
+    def _insert(self, pattern, value):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(value)
+
+    def _build_failure_links(self):
+        # Depth-1 states fail back to the root; deeper states are resolved breadth-first.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0) if state else 0
+                # Inherit matches that end at the failure state (suffix patterns).
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text):
+        """Return matched values in order of first occurrence in `text`, without duplicates."""
+        found = {}
+        state = 0
+        for ch in text:
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for value in self._out[state]:
+                found.setdefault(value, None)
+        return list(found)
@@ -0,0 +1,212 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}   # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        lines = []
+        for key, state in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """Holds metrics and gauge collectors for this process and renders the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """`collector()` returns [(name, help, {labels} or None, value)] gauge samples at scrape time."""
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                samples = collector()
+            except Exception:
+                # A failing dependency (e.g. Chroma down) must not break the scrape.
+                logger.warning("Metrics collector %s failed", getattr(collector, "__name__", collector), exc_info=True)
+                continue
+            seen = set()
+            for name, documentation, labels, value in samples:
+                if name not in seen:
+                    seen.add(name)
+                    lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge"])
+                labels = labels or {}
+                lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.register(Histogram(
+    "rag_stage_duration_seconds", "Duration of each pipeline stage", ("pipeline", "stage")))
+REQUEST_DURATION = registry.register(Histogram(
+    "rag_request_duration_seconds", "End-to-end duration of API requests", ("endpoint",)))
+LLM_TOKENS = registry.register(Counter(
+    "ollama_tokens_total", "Tokens processed by Ollama generations", ("kind",)))
+COALESCED = registry.register(Counter(
+    "rag_coalesced_requests_total", "Requests that joined an identical in-flight computation", ("group",)))
+CONTEXT_TOKENS = registry.register(Counter(
+    "rag_context_tokens_total", "Context tokens retrieved, and left in the prompt after packing", ("kind",)))
+QUERY_ROUTES = registry.register(Counter(
+    "rag_query_routes_total", "Queries answered from retrieved chunks or from the paper summaries", ("route",)))
+LLM_TOKENS_PER_SECOND = registry.register(Histogram(
+    "ollama_generation_tokens_per_second", "Generation speed reported by Ollama (eval_count / eval_duration)",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250)))
+
+_timings = contextvars.ContextVar("rag_timings", default=None)
+
+@contextmanager
+def collect_timings(timings=None):
+    """Collect span durations (and generation stats) into `timings` for the code in this block."""
+    timings = {} if timings is None else timings
+    previous = _timings.get()
+    _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        # set() rather than reset(token): a streaming generator may resume in another context.
+        _timings.set(previous)
+
+@contextmanager
+def span(stage, pipeline="query"):
+    """Time a pipeline stage: observed in the stage histogram and added to the active timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, pipeline=pipeline, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            stages = timings.setdefault("stages", {})
+            stages[stage] = round(stages.get(stage, 0.0) + elapsed, 6)
+
+def record_generation(stats):
+    """Record Ollama's eval_count/eval_duration (ns) and prompt_eval_count from a final generate response."""
+    eval_count = stats.get("eval_count") or 0
+    eval_duration = stats.get("eval_duration") or 0
+    prompt_count = stats.get("prompt_eval_count") or 0
+    LLM_TOKENS.inc(eval_count, kind="generated")
+    LLM_TOKENS.inc(prompt_count, kind="prompt")
+    tokens_per_second = eval_count / (eval_duration / 1e9) if eval_duration else None
+    if tokens_per_second is not None:
+        LLM_TOKENS_PER_SECOND.observe(tokens_per_second)
+    timings = _timings.get()
+    if timings is not None:
+        timings["tokens"] = {
+            "prompt": prompt_count,
+            "generated": eval_count,
+            "tokens_per_second": round(tokens_per_second, 2) if tokens_per_second is not None else None,
+        }
+
+def record_coalesced(group):
+    """Count a request that shared another request's in-flight `group` computation."""
+    COALESCED.inc(group=group)
+    timings = _timings.get()
+    if timings is not None:
+        timings.setdefault("coalesced", []).append(group)
+
+def record_context_packing(stats):
+    """Record the token counts of a packed prompt context (see rag.context_packer.pack_context)."""
+    CONTEXT_TOKENS.inc(stats["tokens_retrieved"], kind="retrieved")
+    CONTEXT_TOKENS.inc(stats["tokens_packed"], kind="packed")
+    timings = _timings.get()
+    if timings is not None:
+        timings["context"] = stats
+
+def record_route(route):
+    """Count how a query's context was built: "chunks" (retrieval) or "summaries" (the summary index)."""
+    QUERY_ROUTES.inc(route=route)
+    timings = _timings.get()
+    if timings is not None:
+        timings["route"] = route
@@ -1,14 +1,69 @@
-import PyPDF2
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_text_from_pdf(pdf_path):
-    """Extract all text from a PDF file."""
-    text = ""
+def count_pdf_pages(pdf_path):
+    """Return the number of pages in a PDF file."""
+    import PyPDF2  # imported by the ingest workers, not at app startup
+    with open(pdf_path, "rb") as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def iter_pdf_pages(pdf_path, start=0, stop=None):
+    """Yield (page_number, text) for pages [start, stop) of a PDF; page numbers are 1-based."""
+    import PyPDF2
     with open(pdf_path, "rb") as file:
         reader = PyPDF2.PdfReader(file)
-        
-        for page in reader.pages:
-            text += page.extract_text() or ""
-    return text
+        stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+        for index in range(start, stop):
+            yield index + 1, reader.pages[index].extract_text() or ""
+
+def _extract_page_range(pdf_path, start, stop):
+    return list(iter_pdf_pages(pdf_path, start, stop))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool(workers):
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # "spawn" keeps child processes independent of the parent's threads.
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def iter_pdf_pages_parallel(pdf_path, workers=None, pages_per_task=32, min_pages=64):
+    """
+    Yield (page_number, text) in page order, extracting page ranges across a
+    process pool. Small PDFs (fewer than `min_pages` pages) or workers=1 are read
+    in-process. At most 2 * workers ranges are in flight, bounding memory.
+    """
+    workers = workers or os.cpu_count() or 1
+    total = count_pdf_pages(pdf_path)
+    if workers <= 1 or total < min_pages:
+        yield from iter_pdf_pages(pdf_path)
+        return
+
+    pool = _get_pool(workers)
+    ranges = deque((start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task))
+    pending = deque()
+    while ranges or pending:
+        while ranges and len(pending) < 2 * workers:
+            start, stop = ranges.popleft()
+            pending.append(pool.submit(_extract_page_range, pdf_path, start, stop))
+        yield from pending.popleft().result()
+
+def extract_text_from_pdf(pdf_path, on_page=None):
+    """Extract all text from a PDF file. `on_page(n)` is called after each parsed page."""
+    texts = []
+    for page_number, text in iter_pdf_pages(pdf_path):
+        texts.append(text)
+        if on_page:
+            on_page(page_number)
+    # Newline between pages so the last word of a page is not glued to the next page's first word.
+    return "\n".join(texts)
 
 def chunk_text(text, chunk_size=1000, overlap=200):
     """Split text into overlapping chunks."""
@@ -42,3 +97,67 @@ def chunk_text_with_metadata(text, filename, chunk_size=1000, overlap=200):
         start += chunk_size - overlap
         chunk_id += 1
     return chunks
+
+
+def chunk_pages_with_metadata(pages, filename, chunk_size=1000, overlap=200):
+    """
+    Streaming version of chunk_text_with_metadata over (page_number, text) pairs.
+    Produces the same chunks as chunking the newline-joined pages, but only holds
+    about one chunk of text at a time, and records page_start/page_end for each chunk.
+    """
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError("chunk_size must be greater than overlap")
+    buffer = ""
+    buffer_offset = 0        # global offset of buffer[0]
+    page_marks = deque()     # (global offset where a page starts, page number)
+    start = 0
+    chunk_id = 0
+    total = 0
+
+    def page_at(offset):
+        page = page_marks[0][1]
+        for mark_offset, mark_page in page_marks:
+            if mark_offset > offset:
+                break
+            page = mark_page
+        return page
+
+    def make_chunk(text, start):
+        end = start + len(text)
+        return {
+            "text": text,
+            "metadata": {
+                "document_name": filename,
+                "chunk_id": chunk_id,
+                "page_start": page_at(start),
+                "page_end": page_at(max(start, end - 1)),
+            }
+        }
+
+    first = True
+    for page_number, page_text in pages:
+        if not first:
+            page_text = "\n" + page_text
+        # The joining newline belongs to the new page.
+        page_marks.append((total, page_number))
+        first = False
+        buffer += page_text
+        total += len(page_text)
+        while start + chunk_size <= total:
+            text = buffer[start - buffer_offset:start + chunk_size - buffer_offset]
+            if text.strip():
+                yield make_chunk(text, start)
+            start += step
+            chunk_id += 1
+            buffer = buffer[start - buffer_offset:]
+            buffer_offset = start
+            while len(page_marks) > 1 and page_marks[1][0] <= start:
+                page_marks.popleft()
+
+    while start < total:
+        text = buffer[start - buffer_offset:start + chunk_size - buffer_offset]
+        if text.strip():
+            yield make_chunk(text, start)
+        start += step
+        chunk_id += 1
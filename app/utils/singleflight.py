@@ -0,0 +1,241 @@
+"""
+Single-flight request coalescing: concurrent callers with the same key share one
+in-flight computation instead of each running their own.
+
+SingleFlight (threads) and AsyncSingleFlight (asyncio) offer
+- do(key, fn, *args): the first caller runs fn, callers arriving while it runs
+  wait for and share its result (or exception);
+- stream(key, fn, *args): fn returns an iterator (async iterator) whose items are
+  broadcast; callers that join late first replay what was already produced.
+Keys are only shared while a computation is in flight; nothing is cached afterwards.
+A stream whose every subscriber leaves is stopped and fails with StreamAborted for
+anyone still holding it; it is never mistaken for a finished one.
+"""
+import asyncio
+import threading
+
+from utils.metrics import record_coalesced
+
+class StreamAborted(Exception):
+    """Raised by a shared stream that was stopped because every subscriber left before it finished."""
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class _Broadcast:
+    """Fan one iterator out to several subscribers; whichever subscriber needs the next item pulls it."""
+
+    def __init__(self, iterator, on_done):
+        self._iterator = iterator
+        self._on_done = on_done
+        self._items = []
+        self._done = False
+        self._error = None
+        self._producing = False
+        self._subscribers = 0
+        self._cond = threading.Condition()
+
+    def _finish(self, error=None):
+        with self._cond:
+            self._done, self._error, self._producing = True, error, False
+            self._cond.notify_all()
+        self._on_done()
+
+    def join(self):
+        """Count a new subscriber; False if the stream was already abandoned (start a new one instead)."""
+        with self._cond:
+            if self._done and isinstance(self._error, StreamAborted):
+                return False
+            self._subscribers += 1
+            return True
+
+    def subscribe(self):
+        """Iterate the shared items; call join() first."""
+        index = 0
+        try:
+            while True:
+                with self._cond:
+                    while index >= len(self._items) and not self._done and self._producing:
+                        self._cond.wait()
+                    if index < len(self._items):
+                        item, pull = self._items[index], False
+                    elif self._done:
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    else:
+                        self._producing, pull = True, True
+                if pull:
+                    try:
+                        value = next(self._iterator)
+                    except StopIteration:
+                        self._finish()
+                        continue
+                    except Exception as e:
+                        self._finish(e)
+                        raise
+                    with self._cond:
+                        self._items.append(value)
+                        self._producing = False
+                        self._cond.notify_all()
+                    continue
+                index += 1
+                yield item
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+                abandoned = not self._subscribers and not self._done
+                if abandoned:
+                    self._done, self._error, self._producing = True, StreamAborted("every subscriber left"), False
+                    self._cond.notify_all()
+            if abandoned:
+                # Every subscriber went away: forget the stream, then stop the underlying iterator.
+                self._on_done()
+                close = getattr(self._iterator, "close", None)
+                if close is not None:
+                    close()
+
+class SingleFlight:
+    """Thread-based single-flight group; `name` labels the coalesced-requests metric."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            record_coalesced(self.name)
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+    def stream(self, key, fn, *args, **kwargs):
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is not None and broadcast.join():
+                record_coalesced(self.name)
+            else:
+                def done():
+                    with self._lock:
+                        if self._streams.get(key) is broadcast:
+                            del self._streams[key]
+
+                broadcast = self._streams[key] = _Broadcast(fn(*args, **kwargs), done)
+                broadcast.join()
+        return broadcast.subscribe()
+
+class _AsyncBroadcast:
+    """Run one async iterator in a task and fan its items out to subscribers."""
+
+    def __init__(self, aiterator, on_done):
+        self._items = []
+        self._done = False
+        self._error = None
+        self._changed = asyncio.Condition()
+        self._subscribers = 0
+        self._on_done = on_done
+        self._task = asyncio.ensure_future(self._pump(aiterator))
+
+    async def _pump(self, aiterator):
+        try:
+            async for item in aiterator:
+                async with self._changed:
+                    self._items.append(item)
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self._error = self._error or StreamAborted("every subscriber left")
+        except Exception as e:
+            self._error = e
+        finally:
+            self._on_done()
+            async with self._changed:
+                self._done = True
+                self._changed.notify_all()
+
+    def join(self):
+        """Count a new subscriber; False if the stream was already abandoned (start a new one instead)."""
+        if self._done and isinstance(self._error, StreamAborted):
+            return False
+        self._subscribers += 1
+        return True
+
+    async def subscribe(self):
+        """Iterate the shared items; call join() first."""
+        index = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: index < len(self._items) or self._done)
+                    batch = self._items[index:]
+                    done, error = self._done, self._error
+                for item in batch:
+                    index += 1
+                    yield item
+                if done and index >= len(self._items):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self._subscribers -= 1
+            if not self._subscribers and not self._done:
+                # Forget the stream before cancelling it, so no one joins a cut-off answer.
+                self._done, self._error = True, StreamAborted("every subscriber left")
+                self._on_done()
+                self._task.cancel()
+
+class AsyncSingleFlight:
+    """asyncio single-flight group. The shared computation runs in its own task, so a
+    caller that is cancelled (e.g. its client disconnected) does not cancel it for the others."""
+
+    def __init__(self, name):
+        self.name = name
+        self._tasks = {}
+        self._streams = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn(*args, **kwargs))
+
+            def done(_):
+                if self._tasks.get(key) is task:
+                    del self._tasks[key]
+
+            task.add_done_callback(done)
+        else:
+            record_coalesced(self.name)
+        return await asyncio.shield(task)
+
+    def stream(self, key, fn, *args, **kwargs):
+        broadcast = self._streams.get(key)
+        if broadcast is not None and broadcast.join():
+            record_coalesced(self.name)
+        else:
+            def done():
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+
+            broadcast = self._streams[key] = _AsyncBroadcast(fn(*args, **kwargs), done)
+            broadcast.join()
+        return broadcast.subscribe()
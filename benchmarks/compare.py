@@ -0,0 +1,50 @@
+"""
+Compare two run_benchmark.py result files (e.g. from two commits).
+
+    python benchmarks/compare.py before.json after.json [--metric p95]
+
+Prints, per corpus size, the request latencies and per-stage timings of both
+runs and the relative change; positive changes are slower.
+"""
+import argparse
+import json
+
+def _rows(result, metric):
+    rows = {}
+    for phase in ("ingest", "query"):
+        section = result.get(phase) or {}
+        rows[f"{phase} latency"] = (section.get("latency") or {}).get(metric)
+        for stage, summary in (section.get("stages") or {}).items():
+            rows[f"{phase} {stage}"] = summary.get(metric)
+    rows["query throughput_qps"] = (result.get("query") or {}).get("throughput_qps")
+    return rows
+
+def compare(before, after, metric="p50"):
+    lines = [f"before: {before.get('commit')}", f"after:  {after.get('commit')}", f"metric: {metric}"]
+    previous = {r["corpus_papers"]: r for r in before["results"]}
+    for result in after["results"]:
+        size = result["corpus_papers"]
+        if size not in previous:
+            continue
+        lines.append(f"\ncorpus_papers={size}")
+        old_rows, new_rows = _rows(previous[size], metric), _rows(result, metric)
+        for name in sorted(set(old_rows) | set(new_rows)):
+            old, new = old_rows.get(name), new_rows.get(name)
+            change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else "n/a"
+            lines.append(f"  {name:<32} {old!s:>12} {new!s:>12} {change:>9}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--metric", default="p50", choices=["mean", "p50", "p95", "p99", "max"])
+    args = parser.parse_args(argv)
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(compare(before, after, args.metric))
+
+if __name__ == "__main__":
+    main()
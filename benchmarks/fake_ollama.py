@@ -0,0 +1,186 @@
+"""
+Stand-in for the Ollama HTTP API used by the app: /api/embed (batch),
+/api/embeddings (single) and /api/generate (streaming and non-streaming).
+
+Embeddings are deterministic hashed bag-of-words vectors, so retrieval over the
+synthetic corpus behaves like a (weak) real embedding model. Latency is
+simulated with sleeps and is configurable per request, per embedded text and
+per generated token; the first request for a model also waits for the model to
+"load" (load_latency), until unload() is called.
+"""
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORD_RE = re.compile(r"\w+")
+_LABEL_RE = re.compile(r"\[Document: ([^,\]]+), Chunk: ([^\]]+)\]")
+
+def hashed_embedding(text, dim=256):
+    """L2-normalised signed feature hashing of the lowercased words of `text`."""
+    vector = [0.0] * dim
+    for word in _WORD_RE.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+class FakeOllama:
+    """
+    Threaded HTTP server imitating Ollama. Latencies are in seconds:
+    - embed_latency per embedding request plus embed_item_latency per text,
+    - first_token_latency plus prompt_token_latency per prompt word before the first
+      generated token (prompt evaluation), then token_latency per token for answer_tokens
+      tokens (or options.num_predict, if smaller),
+    - load_latency the first time a model is used (concurrent requests wait for the same load).
+    A generate request with an empty prompt only loads the model, as in Ollama.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, dim=256, embed_latency=0.005, embed_item_latency=0.0005,
+                 first_token_latency=0.05, token_latency=0.005, answer_tokens=64, load_latency=0.0,
+                 prompt_token_latency=0.0):
+        self.dim = dim
+        self.load_latency = load_latency
+        self.embed_latency = embed_latency
+        self.embed_item_latency = embed_item_latency
+        self.first_token_latency = first_token_latency
+        self.prompt_token_latency = prompt_token_latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.counters = {"embed_requests": 0, "embedded_texts": 0, "generate_requests": 0, "model_loads": 0}
+        self._lock = threading.Lock()
+        self._loaded = set()
+        self._model_locks = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def ensure_loaded(self, model):
+        with self._lock:
+            model_lock = self._model_locks.setdefault(model, threading.Lock())
+        with model_lock:
+            if model not in self._loaded:
+                time.sleep(self.load_latency)
+                self._loaded.add(model)
+                self._count("model_loads")
+
+    def unload(self):
+        """Forget every loaded model, as if Ollama had restarted."""
+        with self._lock:
+            self._loaded.clear()
+
+    def embed(self, texts):
+        self._count("embed_requests")
+        self._count("embedded_texts", len(texts))
+        time.sleep(self.embed_latency + self.embed_item_latency * len(texts))
+        return [hashed_embedding(text, self.dim) for text in texts]
+
+    def answer(self, prompt):
+        """Token list for a deterministic answer citing the first chunk label in the prompt."""
+        labels = _LABEL_RE.findall(prompt)
+        tokens = [f"word{i % 17} " for i in range(max(0, self.answer_tokens - 1))]
+        if labels:
+            name, chunk = labels[0]
+            tokens.append(f"[Document: {name}, Section: chunk {chunk}]")
+        return tokens, len(_WORD_RE.findall(prompt))
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without this, delayed ACKs add ~40ms per response.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path in ("/api/embed", "/api/embeddings", "/api/generate"):
+                    fake.ensure_loaded(payload.get("model"))
+                if self.path == "/api/embed":
+                    texts = payload.get("input") or []
+                    if isinstance(texts, str):
+                        texts = [texts]
+                    self._send_json({"model": payload.get("model"), "embeddings": fake.embed(texts)})
+                elif self.path == "/api/embeddings":
+                    self._send_json({"embedding": fake.embed([payload.get("prompt", "")])[0]})
+                elif self.path == "/api/generate":
+                    self._generate(payload)
+                else:
+                    self._send_json({"error": f"unknown path {self.path}"}, status=404)
+
+            def _generate(self, payload):
+                if not payload.get("prompt"):
+                    self._send_json({"model": payload.get("model"), "response": "", "done": True, "done_reason": "load"})
+                    return
+                fake._count("generate_requests")
+                tokens, prompt_tokens = fake.answer(payload.get("prompt", ""))
+                num_predict = (payload.get("options") or {}).get("num_predict")
+                if num_predict and num_predict > 0:
+                    tokens = tokens[:num_predict]
+                started = time.perf_counter()
+                time.sleep(fake.first_token_latency + fake.prompt_token_latency * prompt_tokens)
+                prompt_done = time.perf_counter()
+                final = {
+                    "model": payload.get("model"),
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int((prompt_done - started) * 1e9),
+                    "eval_count": len(tokens),
+                }
+                if not payload.get("stream", True):
+                    time.sleep(fake.token_latency * len(tokens))
+                    final.update(response="".join(tokens),
+                                 eval_duration=int((time.perf_counter() - prompt_done) * 1e9))
+                    self._send_json(final)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens:
+                    time.sleep(fake.token_latency)
+                    self._write_chunk({"model": payload.get("model"), "response": token, "done": False})
+                final.update(response="", eval_duration=int((time.perf_counter() - prompt_done) * 1e9))
+                self._write_chunk(final)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, obj):
+                data = json.dumps(obj).encode() + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
@@ -0,0 +1,293 @@
+"""
+Offline end-to-end benchmark of the Flask app.
+
+Runs the real app (ingest jobs, retrieval, hybrid search, prompt building,
+logging) against local stand-ins: FakeOllama over HTTP, an in-process Chroma
+(chromadb.EphemeralClient, or the local vector index with --vector-backend local)
+and mongomock. The corpus grows through the given
+sizes; at each size new synthetic papers are uploaded through POST /api/papers
+(polling the job until it finishes) and then queries are sent to POST /api/query.
+Per-request latency and the per-stage timings the app records (job stats for
+ingest, the query log's performance document for queries) are summarised as
+p50/p95/p99 and written as JSON.
+
+    python benchmarks/run_benchmark.py --sizes 1,5,20 --pages 8 --queries 50 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(HERE), "app")
+sys.path.insert(0, HERE)
+
+from fake_ollama import FakeOllama  # noqa: E402
+from synthetic_pdf import make_corpus  # noqa: E402
+
+def percentiles(values):
+    """{"count", "mean", "p50", "p95", "p99", "max"} of `values` (nearest-rank), in seconds."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 6),
+        "p50": round(rank(50), 6),
+        "p95": round(rank(95), 6),
+        "p99": round(rank(99), 6),
+        "max": round(ordered[-1], 6),
+    }
+
+def stage_percentiles(stage_runs):
+    """Summarise a list of {stage: seconds} dicts per stage."""
+    by_stage = {}
+    for stages in stage_runs:
+        for stage, seconds in (stages or {}).items():
+            by_stage.setdefault(stage, []).append(seconds)
+    return {stage: percentiles(values) for stage, values in sorted(by_stage.items())}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def configure_environment(workdir, ollama_url, args):
+    """Point every on-disk path and service URL at the sandbox before the app reads Config."""
+    os.environ.update({
+        "OLLAMA_BASE_URL": ollama_url,
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical_index.pkl"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite3"),
+        "EMBEDDING_CACHE_ENABLED": "true" if args.embedding_cache else "false",
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "INGEST_JOBS_DIR": os.path.join(workdir, "jobs"),
+        "UPLOAD_FOLDER": os.path.join(workdir, "uploads"),
+        "LOG_SPILL_DIR": os.path.join(workdir, "log_spill"),
+        "LOG_FLUSH_INTERVAL": "0.1",
+        "VECTOR_BACKEND": args.vector_backend,
+        "LOCAL_INDEX_PATH": os.path.join(workdir, "vector_index"),
+        "SUMMARY_INDEX_ENABLED": "true" if getattr(args, "summary_index", False) else "false",
+    })
+
+def load_app(vector_backend="chroma"):
+    """
+    Import the app with mongomock and, for the chroma backend, an in-process Chroma injected
+    into the client registry (the local backend is created by the registry itself).
+    """
+    import mongomock
+
+    sys.path.insert(0, APP_DIR)
+    from clients import ClientRegistry, set_clients
+
+    chroma = None
+    if vector_backend == "chroma":
+        import chromadb
+        chroma = chromadb.EphemeralClient()
+    set_clients(ClientRegistry(chroma=chroma, mongo=mongomock.MongoClient()))
+    from main import app
+    return app
+
+def upload(client, paper, poll_interval):
+    """Upload one paper and wait for its ingest job; returns (seconds, file entry of the finished job)."""
+    started = time.perf_counter()
+    with open(paper["path"], "rb") as f:
+        response = client.post("/api/papers", data={"files": [(f, paper["filename"])]},
+                               content_type="multipart/form-data")
+    if response.status_code != 202:
+        raise RuntimeError(f"upload of {paper['filename']} failed: {response.status_code} {response.get_json()}")
+    job_id = response.get_json()["job_id"]
+    while True:
+        job = client.get(f"/api/papers/jobs/{job_id}").get_json()["data"]
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(poll_interval)
+    elapsed = time.perf_counter() - started
+    entry = job["files"][0]
+    if entry["status"] != "completed":
+        raise RuntimeError(f"ingest of {paper['filename']} failed: {entry.get('error')}")
+    return elapsed, entry
+
+def ingest_round(app, papers, args):
+    latencies, stage_runs, pages = [], [], 0
+    started = time.perf_counter()
+
+    def one(paper):
+        return upload(app.test_client(), paper, args.poll_interval)
+
+    with ThreadPoolExecutor(max_workers=args.upload_concurrency) as pool:
+        for paper, (elapsed, entry) in zip(papers, pool.map(one, papers)):
+            latencies.append(elapsed)
+            stage_runs.append((entry.get("stats") or {}).get("timings"))
+            pages += paper["pages"]
+    wall = time.perf_counter() - started
+    return {
+        "papers": len(papers),
+        "pages": pages,
+        "wall_seconds": round(wall, 6),
+        "papers_per_second": round(len(papers) / wall, 3) if wall else None,
+        "pages_per_second": round(pages / wall, 3) if wall else None,
+        "latency": percentiles(latencies),
+        "stages": stage_percentiles(stage_runs),
+    }
+
+def make_questions(corpus, count, rng, style="specific"):
+    """Questions naming a random paper: about one of its topic terms ("specific") or about the whole paper ("broad")."""
+    questions = []
+    for _ in range(count):
+        paper = rng.choice(corpus)
+        base = paper["filename"][:-len(".pdf")]
+        term = rng.choice(paper["topic_terms"])
+        if style == "broad":
+            questions.append(f"What are the main findings of {base}, especially on {term}?")
+        else:
+            questions.append(f"What does {base} report about {term} and retrieval latency?")
+    return questions
+
+def wait_for_summaries(timeout=600.0):
+    """Block until the background summary index has summarized every ingested paper; returns the seconds waited."""
+    from ingest.summaries import get_summary_queue
+
+    started = time.perf_counter()
+    if not get_summary_queue().wait_idle(timeout):
+        raise RuntimeError("summaries were not built in time")
+    return round(time.perf_counter() - started, 6)
+
+def wait_for_log_sink(timeout=30.0):
+    """Block until the buffered query log sink has written everything submitted so far."""
+    from database.log_sink import get_log_sink
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = get_log_sink().stats()
+        if stats["written"] + stats["dropped"] + stats["spilled"] >= stats["submitted"]:
+            return
+        time.sleep(0.05)
+
+def query_round(app, questions, args):
+    from config import Config
+    from clients import get_clients
+
+    logs = get_clients().mongo[Config.MONGO_DB_NAME][Config.LOGS_COLLECTION]
+    logs.delete_many({})
+    latencies, errors = [], 0
+
+    def one(question):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post("/api/query", json={"question": question, "stream": args.stream})
+        if args.stream:
+            response.get_data()  # drain the SSE stream
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for elapsed, status in pool.map(one, questions):
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+    wall = time.perf_counter() - started
+    wait_for_log_sink()
+    performance = [entry.get("performance") or {} for entry in logs.find({}, {"performance": 1})]
+    return {
+        "queries": len(questions),
+        "errors": errors,
+        "concurrency": args.concurrency,
+        "stream": args.stream,
+        "wall_seconds": round(wall, 6),
+        "throughput_qps": round(len(latencies) / wall, 3) if wall else None,
+        "latency": percentiles(latencies),
+        "stages": stage_percentiles(p.get("stages") for p in performance),
+        "routes": {route: sum(1 for p in performance if p.get("route") == route)
+                   for route in sorted({p["route"] for p in performance if p.get("route")})},
+        "context_tokens_packed": percentiles([p["context"]["tokens_packed"] for p in performance if p.get("context")]),
+        "context_tokens_saved": percentiles([p["context"]["tokens_saved"] for p in performance if p.get("context")]),
+        "tokens_per_second": percentiles([p["tokens"]["tokens_per_second"] for p in performance
+                                          if p.get("tokens") and p["tokens"].get("tokens_per_second")]),
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,5,20", help="comma-separated corpus sizes (papers), ascending")
+    parser.add_argument("--pages", type=int, default=8, help="pages per synthetic paper")
+    parser.add_argument("--queries", type=int, default=50, help="queries per corpus size")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent query clients")
+    parser.add_argument("--upload-concurrency", type=int, default=2, help="concurrent uploads")
+    parser.add_argument("--vector-backend", choices=("chroma", "local"), default="chroma",
+                        help="in-process Chroma, or the app's local quantized index (VECTOR_BACKEND=local)")
+    parser.add_argument("--stream", action="store_true", help="query with stream=true (SSE)")
+    parser.add_argument("--question-style", choices=("specific", "broad"), default="specific",
+                        help="ask about topic terms, or about whole papers (main findings)")
+    parser.add_argument("--summary-index", action="store_true",
+                        help="build the per-paper summary index after ingest (SUMMARY_INDEX_ENABLED=true)")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the answer cache enabled")
+    parser.add_argument("--embedding-cache", action="store_true", help="leave the embedding cache enabled")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="fake Ollama seconds per embed request")
+    parser.add_argument("--embed-item-latency", type=float, default=0.0005, help="fake Ollama seconds per embedded text")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="fake Ollama prompt evaluation seconds")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0,
+                        help="fake Ollama prompt evaluation seconds per prompt word")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="fake Ollama seconds per generated token")
+    parser.add_argument("--answer-tokens", type=int, default=64, help="tokens per generated answer")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="seconds between job status polls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s.strip())
+    rng = random.Random(args.seed)
+    fake = FakeOllama(embed_latency=args.embed_latency, embed_item_latency=args.embed_item_latency,
+                      first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                      answer_tokens=args.answer_tokens, prompt_token_latency=args.prompt_token_latency).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="academic_rag_bench_") as workdir:
+            configure_environment(workdir, fake.base_url, args)
+            app = load_app(args.vector_backend)
+            papers = make_corpus(os.path.join(workdir, "corpus"), sizes[-1], args.pages, seed=args.seed)
+            results, corpus = [], []
+            for size in sizes:
+                new = papers[len(corpus):size]
+                ingest = ingest_round(app, new, args)
+                if args.summary_index:
+                    ingest["summaries_wait_seconds"] = wait_for_summaries()
+                corpus.extend(new)
+                query = query_round(app, make_questions(corpus, args.queries, rng, args.question_style), args)
+                results.append({"corpus_papers": len(corpus), "corpus_pages": len(corpus) * args.pages,
+                                "ingest": ingest, "query": query})
+                print(f"papers={len(corpus)} ingest p50={ingest['latency'].get('p50')}s "
+                      f"query p50={query['latency'].get('p50')}s p99={query['latency'].get('p99')}s "
+                      f"qps={query['throughput_qps']} errors={query['errors']}", file=sys.stderr)
+    finally:
+        fake.stop()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "fake_ollama": dict(fake.counters),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+if __name__ == "__main__":
+    main()
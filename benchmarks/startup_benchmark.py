@@ -0,0 +1,162 @@
+"""
+Offline cold-start benchmark of the Flask app.
+
+A corpus is ingested once into the local vector index (VECTOR_BACKEND=local, so it
+persists on disk), then each run starts a fresh Python process that imports the
+app and answers one query, against a FakeOllama whose models are unloaded before
+every run and take --load-latency seconds to load on first use:
+
+- cold: WARMUP_ENABLED=false, the first query pays for opening the stores and
+  loading both models;
+- warm: the background warm-up runs and the query is sent once GET /ready is 200.
+
+Reported per scenario (median over --runs): seconds to import the app, seconds
+until ready, first and second query latency, and which heavy modules importing
+the app pulled in.
+
+    python benchmarks/startup_benchmark.py --runs 3 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from fake_ollama import FakeOllama  # noqa: E402
+from synthetic_pdf import make_corpus  # noqa: E402
+import run_benchmark  # noqa: E402
+
+HEAVY_MODULES = ("chromadb", "pymongo", "bson", "PyPDF2", "httpx", "numpy", "flasgger")
+SCENARIOS = {"cold": {"WARMUP_ENABLED": "false"}, "warm": {"WARMUP_ENABLED": "true"}}
+
+def child(args):
+    """Runs in the fresh process: import the app, optionally wait for /ready, answer two queries."""
+    import mongomock
+
+    sys.path.insert(0, run_benchmark.APP_DIR)
+    from clients import ClientRegistry, set_clients
+
+    set_clients(ClientRegistry(mongo=mongomock.MongoClient()))
+    preloaded = {name for name in HEAVY_MODULES if name in sys.modules}
+    started = time.perf_counter()
+    from main import app
+    imported = time.perf_counter() - started
+    loaded = sorted(name for name in HEAVY_MODULES if name in sys.modules and name not in preloaded)
+
+    client = app.test_client()
+    ready = None
+    if args.wait_ready:
+        while client.get("/ready").status_code != 200:
+            time.sleep(0.01)
+        ready = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(2):
+        sent = time.perf_counter()
+        response = client.post("/api/query", json={"question": args.question})
+        if response.status_code != 200:
+            raise RuntimeError(f"query failed: {response.status_code} {response.get_json()}")
+        latencies.append(time.perf_counter() - sent)
+    print(json.dumps({
+        "import_seconds": round(imported, 6),
+        "ready_seconds": round(ready, 6) if ready is not None else None,
+        "first_query_seconds": round(latencies[0], 6),
+        "second_query_seconds": round(latencies[1], 6),
+        "first_answer_seconds": round(time.perf_counter() - started - latencies[1], 6),
+        "heavy_modules_loaded": loaded,
+    }))
+
+def run_child(scenario, question, env):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--question", question]
+    if scenario == "warm":
+        command.append("--wait-ready")
+    started = time.perf_counter()
+    output = subprocess.run(command, env={**env, **SCENARIOS[scenario]}, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"{scenario} run failed:\n{output.stderr}")
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result["process_seconds"] = round(time.perf_counter() - started, 6)
+    return result
+
+def summarise(runs):
+    summary = {}
+    for key, value in runs[0].items():
+        if isinstance(value, (int, float)):
+            summary[key] = round(statistics.median(run[key] for run in runs), 6)
+        elif value is not None:
+            summary[key] = value
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per scenario")
+    parser.add_argument("--papers", type=int, default=5, help="papers in the corpus")
+    parser.add_argument("--pages", type=int, default=8, help="pages per synthetic paper")
+    parser.add_argument("--load-latency", type=float, default=1.0, help="fake Ollama seconds to load a model")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="fake Ollama prompt evaluation seconds")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="fake Ollama seconds per generated token")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--wait-ready", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--question", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        return child(args)
+
+    fake = FakeOllama(first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                      load_latency=args.load_latency).start()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix="academic_rag_startup_") as workdir:
+            settings = run_benchmark.parse_args(["--vector-backend", "local"])
+            run_benchmark.configure_environment(workdir, fake.base_url, settings)
+            os.environ["WARMUP_ENABLED"] = "false"
+            env = dict(os.environ)
+            # Ingest once in this process; the children find the corpus on disk.
+            app = run_benchmark.load_app("local")
+            papers = make_corpus(os.path.join(workdir, "corpus"), args.papers, args.pages, seed=args.seed)
+            run_benchmark.ingest_round(app, papers, settings)
+            question = f"What does {papers[0]['filename'][:-len('.pdf')]} report about {papers[0]['topic_terms'][0]}?"
+
+            for scenario in SCENARIOS:
+                runs = []
+                for _ in range(args.runs):
+                    fake.unload()
+                    runs.append(run_child(scenario, question, env))
+                results[scenario] = {"summary": summarise(runs), "runs": runs}
+                summary = results[scenario]["summary"]
+                print(f"{scenario}: import={summary['import_seconds']}s ready={summary.get('ready_seconds', '-')}s "
+                      f"first query={summary['first_query_seconds']}s "
+                      f"second query={summary['second_query_seconds']}s", file=sys.stderr)
+    finally:
+        fake.stop()
+
+    report = {
+        "commit": run_benchmark.git_commit(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "child", "wait_ready", "question")},
+        "fake_ollama": dict(fake.counters),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Deterministic synthetic "papers" written as minimal PDF files (Helvetica text,
+one content stream per page), so benchmark corpora need no external fixtures.
+Each paper has numbered section headings, paragraphs of sentences drawn from a
+shared vocabulary, and a few topic terms of its own that queries can target.
+"""
+import os
+import random
+
+_VOCABULARY = (
+    "model training data retrieval attention transformer layer embedding vector corpus query answer "
+    "baseline dataset evaluation metric accuracy precision recall latency throughput memory gradient "
+    "optimizer parameter network encoder decoder token sequence context window benchmark ablation "
+    "experiment result analysis method approach system architecture inference scaling distribution"
+).split()
+_SECTIONS = ["Introduction", "Related Work", "Method", "Experiments", "Results", "Discussion", "Conclusion"]
+_LINE_CHARS = 90
+_LINES_PER_PAGE = 60
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _sentence(rng, topic_terms):
+    words = [rng.choice(_VOCABULARY) for _ in range(rng.randint(8, 20))]
+    if rng.random() < 0.3:
+        words[rng.randrange(len(words))] = rng.choice(topic_terms)
+    return " ".join(words).capitalize() + "."
+
+def _wrap(text, width=_LINE_CHARS):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+def paper_lines(pages, seed, topic_terms):
+    """Lines of text for a paper of `pages` pages, split into one list per page."""
+    rng = random.Random(seed)
+    body = []
+    section = 0
+    while len(body) < pages * _LINES_PER_PAGE:
+        if section < len(_SECTIONS) and (not body or rng.random() < 0.08):
+            body.append(f"{section + 1} {_SECTIONS[section]}")
+            section += 1
+        paragraph = " ".join(_sentence(rng, topic_terms) for _ in range(rng.randint(3, 7)))
+        body.extend(_wrap(paragraph))
+        body.append("")
+    body = body[:pages * _LINES_PER_PAGE]
+    return [body[i:i + _LINES_PER_PAGE] for i in range(0, len(body), _LINES_PER_PAGE)]
+
+def write_pdf(path, page_lines):
+    """Write a minimal, valid PDF with one text page per entry of `page_lines`."""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    next_id = 4
+    for lines in page_lines:
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in lines:
+            ops.append(f"({_escape(line)}) Tj T*" if line else "T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        page_id, content_id = next_id, next_id + 1
+        next_id += 2
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        objects[page_id] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{kid} 0 R" for kid in kids).encode(), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n" % obj_id + objects[obj_id] + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for obj_id in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[obj_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def make_corpus(directory, num_papers, pages_per_paper, seed=0):
+    """
+    Write `num_papers` synthetic PDFs into `directory`.
+    Returns [{"filename", "path", "pages", "topic_terms"}] in creation order.
+    """
+    os.makedirs(directory, exist_ok=True)
+    papers = []
+    for i in range(num_papers):
+        filename = f"paper_{seed}_{i:04d}.pdf"
+        topic_terms = [f"topic{seed}x{i}a", f"topic{seed}x{i}b", f"topic{seed}x{i}c"]
+        path = os.path.join(directory, filename)
+        write_pdf(path, paper_lines(pages_per_paper, seed * 100003 + i, topic_terms))
+        papers.append({"filename": filename, "path": path, "pages": pages_per_paper, "topic_terms": topic_terms})
+    return papers
@@ -0,0 +1,53 @@
+import time
+
+from rag.answer_cache import AnswerCache, normalize_question
+
+def test_make_key_normalizes_question_and_ignores_chunk_order():
+    a = AnswerCache.make_key("What is X?", ["x:1", "x:2"], ["one", "two"])
+    b = AnswerCache.make_key("  what is x ", ["x:2", "x:1"], ["two", "one"])
+    assert a == b
+    assert normalize_question("  What  is X?! ") == "what is x"
+
+def test_make_key_changes_with_chunk_text():
+    before = AnswerCache.make_key("q", ["x:1"], ["old text"])
+    after = AnswerCache.make_key("q", ["x:1"], ["new text"])
+    assert before != after
+
+def test_exact_hit_miss_and_invalidation():
+    cache = AnswerCache(max_entries=4)
+    cache.put("k", "answer", target_files=["x.pdf"], documents=["x.pdf"])
+    assert cache.get("k") == "answer"
+    assert cache.get("other") is None
+    assert cache.invalidate_document("x.pdf") == 1
+    assert cache.get("k") is None
+    assert cache.stats()["exact_hits"] == 1
+
+def test_lru_eviction_releases_similarity_rows():
+    cache = AnswerCache(max_entries=2, similarity_threshold=0.9)
+    for i in range(5):
+        cache.put(f"k{i}", f"a{i}", embedding=[1.0, float(i)], target_files=["x.pdf"])
+    assert cache.stats()["size"] == 2
+    assert cache.get("k0") is None and cache.get("k4") == "a4"
+    assert cache.find_similar([1.0, 4.0], ["x.pdf"]) == "a4"
+
+def test_find_similar_matches_close_questions_over_the_same_files():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.put("a", "answer a", embedding=[1.0, 0.0, 0.0], target_files=["x.pdf"])
+    cache.put("b", "answer b", embedding=[0.0, 1.0, 0.0], target_files=["x.pdf"])
+    assert cache.find_similar([0.99, 0.05, 0.0], ["x.pdf"]) == "answer a"
+    assert cache.find_similar([0.05, 2.0, 0.0], ["x.pdf"]) == "answer b"
+    assert cache.find_similar([0.99, 0.05, 0.0], ["y.pdf"]) is None
+    assert cache.find_similar([0.6, 0.6, 0.5], ["x.pdf"]) is None
+    assert cache.stats()["similar_hits"] == 2
+
+def test_find_similar_disabled_without_threshold():
+    cache = AnswerCache()
+    cache.put("a", "answer a", embedding=[1.0, 0.0], target_files=["x.pdf"])
+    assert cache.find_similar([1.0, 0.0], ["x.pdf"]) is None
+
+def test_expired_entries_are_not_returned():
+    cache = AnswerCache(ttl_seconds=0.01, similarity_threshold=0.9)
+    cache.put("a", "answer a", embedding=[1.0, 0.0], target_files=["x.pdf"])
+    time.sleep(0.02)
+    assert cache.find_similar([1.0, 0.0], ["x.pdf"]) is None
+    assert cache.get("a") is None
@@ -0,0 +1,42 @@
+import asyncio
+
+import httpx
+
+from rag.async_llm import AsyncOllamaClient
+
+def run_embed(responses, **options):
+    """Embed one text against a mock Ollama answering with `responses` in turn; returns (result or error, requests)."""
+    requests = []
+
+    def handle(request):
+        requests.append(request)
+        status = responses[min(len(requests), len(responses)) - 1]
+        if status == 200:
+            return httpx.Response(200, json={"embeddings": [[0.1, 0.2]]})
+        return httpx.Response(status, json={"error": "busy"})
+
+    async def main():
+        client = AsyncOllamaClient("http://ollama", "llm", "embedder", backoff=0, **options)
+        await client.aclose()
+        client._client = httpx.AsyncClient(base_url="http://ollama", transport=httpx.MockTransport(handle))
+        try:
+            return await client.embed("question")
+        finally:
+            await client.aclose()
+
+    try:
+        return asyncio.run(main()), requests
+    except httpx.HTTPStatusError as e:
+        return e, requests
+
+def test_embed_retries_rate_limits_and_server_errors():
+    result, requests = run_embed([429, 503, 200])
+    assert result == [0.1, 0.2] and len(requests) == 3
+
+def test_embed_gives_up_after_max_retries():
+    result, requests = run_embed([500], max_retries=2)
+    assert isinstance(result, httpx.HTTPStatusError) and len(requests) == 3
+
+def test_embed_does_not_retry_client_errors():
+    result, requests = run_embed([404, 200])
+    assert isinstance(result, httpx.HTTPStatusError) and len(requests) == 1
@@ -0,0 +1,59 @@
+import pytest
+
+from rag import chain
+
+@pytest.fixture
+def cached(monkeypatch):
+    answers = []
+    monkeypatch.setattr(chain, "cache_answer", lambda prepared, answer: answers.append(answer))
+    return answers
+
+def prepared(prompt):
+    return {"cached_answer": None, "prompt": prompt}
+
+def test_a_complete_answer_is_cached(monkeypatch, cached):
+    monkeypatch.setattr(chain, "stream_answer", lambda prompt: iter(["An ", "answer."]))
+    assert "".join(chain.answer_tokens(prepared("complete"))) == "An answer."
+    assert cached == ["An answer."]
+
+def test_a_cut_off_answer_is_not_cached(monkeypatch, cached):
+    def stream_answer(prompt):
+        yield "An "
+        raise RuntimeError("Ollama stream ended before the answer was done")
+
+    monkeypatch.setattr(chain, "stream_answer", stream_answer)
+    with pytest.raises(RuntimeError):
+        "".join(chain.answer_tokens(prepared("cut off")))
+    assert cached == []
+
+def test_an_abandoned_answer_is_not_cached(monkeypatch, cached):
+    monkeypatch.setattr(chain, "stream_answer", lambda prompt: iter(["An ", "answer."]))
+    tokens = chain.answer_tokens(prepared("abandoned"))
+    assert next(tokens) == "An "
+    tokens.close()
+    assert cached == []
+
+def test_lexical_fusion_keeps_top_k_chunks_of_every_target_file(monkeypatch):
+    from flask import Flask
+
+    from database.lexical_index import LexicalIndex
+
+    # a.pdf repeats the query terms everywhere, b.pdf barely mentions them: a global BM25 cut would keep only a.pdf.
+    texts = {f"a.pdf:{i}": "attention attention heads attention" for i in range(6)}
+    texts.update({f"b.pdf:{i}": f"convolution filters {i} and one attention" for i in range(6)})
+    index = LexicalIndex()
+    index.add(list(texts), list(texts.values()), [chunk_id.split(":")[0] for chunk_id in texts])
+    stored = {chunk_id: (text, {"document_name": chunk_id.split(":")[0], "chunk_id": int(chunk_id.split(":")[1])})
+              for chunk_id, text in texts.items()}
+    monkeypatch.setattr(chain, "get_lexical_index", lambda: index)
+    monkeypatch.setattr(chain, "make_chunk_id", lambda name, chunk_id: f"{name}:{chunk_id}")
+    monkeypatch.setattr(chain, "get_chunks_by_ids", lambda client, collection, ids: {i: stored[i] for i in ids})
+
+    vector = [stored["a.pdf:0"], stored["a.pdf:1"], stored["b.pdf:5"]]
+    with Flask(__name__).app_context():
+        documents, metadatas = chain._fuse_lexical_hits(
+            None, "papers", "attention heads", [doc for doc, _ in vector], [meta for _, meta in vector],
+            ["a.pdf", "b.pdf"], top_k=3)
+    names = [meta["document_name"] for meta in metadatas]
+    assert names.count("a.pdf") == 3 and names.count("b.pdf") == 3
+    assert len(documents) == 6
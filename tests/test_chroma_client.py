@@ -0,0 +1,48 @@
+import mongomock
+import pytest
+
+from database import chroma_client
+from database.chroma_client import (
+    ShardRouter, add_embeddings, delete_document, get_chunks_by_ids, get_document_chunks,
+    get_relevant_chunks_and_metadata, get_summaries
+)
+from database.local_index import LocalVectorClient
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    routes = mongomock.MongoClient().db.routes
+    monkeypatch.setitem(chroma_client._routers, "papers", ShardRouter("papers", num_shards=4, routes=lambda: routes))
+    return LocalVectorClient(str(tmp_path))
+
+def test_an_unavailable_routing_table_is_retried_after_a_backoff():
+    calls = []
+
+    def routes():
+        calls.append(1)
+        raise ConnectionError("MongoDB unavailable")
+
+    router = ShardRouter("papers", num_shards=4, routes=routes, retry_after=3600)
+    assert [router.shard_of(name) for name in ("a.pdf", "b.pdf", "a.pdf")] == [router._place("a.pdf"), router._place("b.pdf"), router._place("a.pdf")]
+    assert len(calls) == 1
+    router.retry_after = 0
+    router.shard_of("a.pdf")
+    assert len(calls) == 2
+
+def test_read_paths_do_not_create_shard_collections(client):
+    assert get_chunks_by_ids(client, "papers", ["missing"]) == {}
+    assert get_relevant_chunks_and_metadata(client, "papers", [0.0] * 4, top_k=3) == ([], [])
+    assert get_document_chunks(client, "papers", "a.pdf") == ([], [])
+    assert get_summaries(client, "summaries", ["a.pdf"]) == ([], [])
+    delete_document(client, "papers", "a.pdf")
+    assert client.list_collections() == []
+
+def test_reads_skip_shards_that_do_not_exist(client):
+    metadatas = [{"document_name": "a.pdf", "chunk_id": i} for i in range(3)]
+    ids, _ = add_embeddings(client, "papers", [[float(i), 1.0, 0.0, 0.0] for i in range(3)], metadatas,
+                            [f"chunk {i}" for i in range(3)])
+    assert len(client.list_collections()) == 1
+    documents, found = get_relevant_chunks_and_metadata(client, "papers", [0.0, 1.0, 0.0, 0.0], top_k=2)
+    assert documents == ["chunk 0", "chunk 1"]
+    assert set(get_chunks_by_ids(client, "papers", ids)) == set(ids)
+    assert get_document_chunks(client, "papers", "a.pdf")[0] == ["chunk 0", "chunk 1", "chunk 2"]
+    assert len(client.list_collections()) == 1
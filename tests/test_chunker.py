@@ -0,0 +1,49 @@
+from utils.chunker import chunk_document, count_tokens, is_heading
+
+def chunks_of(text, **kwargs):
+    return list(chunk_document([(1, text)], "paper.pdf", **kwargs))
+
+def test_heading_starts_a_chunk_and_names_the_section():
+    text = "1 Introduction\nWe study retrieval. It is fast.\n\n2 Methods\nWe embed chunks. We fuse rankings."
+    chunks = chunks_of(text, max_tokens=64)
+    assert [c["metadata"]["section"] for c in chunks] == ["1 Introduction", "2 Methods"]
+    assert chunks[1]["text"] == "2 Methods We embed chunks. We fuse rankings."
+    assert [c["metadata"]["chunk_id"] for c in chunks] == [0, 1]
+
+def test_heading_followed_by_long_sentence_is_not_a_chunk_on_its_own():
+    long_sentence = " ".join(f"word{i}" for i in range(50)) + "."
+    chunks = chunks_of(f"2 Methods\n{long_sentence}", max_tokens=16)
+    assert chunks[0]["text"].startswith("2 Methods word0")
+    assert all(count_tokens(c["text"]) <= 16 for c in chunks)
+    assert " ".join(c["text"] for c in chunks).split() == ["2", "Methods"] + long_sentence.split()
+
+def test_heading_followed_by_sentence_over_the_remaining_budget():
+    sentence = " ".join(f"w{i}" for i in range(14)) + "."
+    chunks = chunks_of(f"Introduction\n{sentence}", max_tokens=15)
+    assert count_tokens(chunks[0]["text"]) > count_tokens("Introduction")
+    assert all(count_tokens(c["text"]) <= 15 for c in chunks)
+
+def test_consecutive_headings_share_a_chunk():
+    chunks = chunks_of("3 Experiments\n3.1 Setup\nWe use eight GPUs.", max_tokens=64)
+    assert len(chunks) == 1
+    assert chunks[0]["text"] == "3 Experiments 3.1 Setup We use eight GPUs."
+    assert chunks[0]["metadata"]["section"] == "3.1 Setup"
+
+def test_sentences_span_lines_and_pages_with_offsets():
+    pages = [(1, "Results\nThe model reaches 91.2 BLEU on the"), (2, "test set. Latency drops by half.")]
+    chunks = list(chunk_document(pages, "paper.pdf", max_tokens=64))
+    assert len(chunks) == 1
+    meta = chunks[0]["metadata"]
+    assert (meta["page_start"], meta["page_end"]) == (1, 2)
+    joined = "\n".join(text for _, text in pages)
+    assert joined[meta["char_start"]:meta["char_end"]].startswith("Results")
+
+def test_abbreviations_do_not_end_sentences():
+    chunks = chunks_of("As shown by Smith et al. in 2020 the gain holds. A second sentence.", max_tokens=12)
+    assert chunks[0]["text"].startswith("As shown by Smith et al. in 2020")
+
+def test_is_heading():
+    assert is_heading("2.1 Training Details")
+    assert is_heading("RELATED WORK")
+    assert is_heading("Conclusion:")
+    assert not is_heading("We train for 10 epochs on the full dataset with a batch size of 32.")
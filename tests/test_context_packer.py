@@ -0,0 +1,55 @@
+from rag.context_packer import pack_context, pack_summaries
+from utils.chunker import count_tokens
+
+def meta(name, chunk_id, **extra):
+    return dict(document_name=name, chunk_id=chunk_id, **extra)
+
+def test_consecutive_chunks_merge_and_overlap_is_kept_once():
+    shared = "the overlapping sentence of both chunks"
+    documents = [f"First chunk ends with {shared}", f"{shared} and the second chunk goes on."]
+    context, stats = pack_context(documents, [meta("a.pdf", 0), meta("a.pdf", 1)])
+    assert context == f"[Document: a.pdf, Chunk: 0-1]\nFirst chunk ends with {shared} and the second chunk goes on."
+    assert stats["chunks_used"] == 2 and stats["blocks"] == 1
+    assert stats["tokens_saved"] > 0
+
+def test_duplicate_and_contained_chunks_are_dropped():
+    documents = ["A long passage about retrieval augmented generation.", "retrieval augmented generation",
+                 "A long passage about retrieval augmented generation."]
+    context, stats = pack_context(documents, [meta("a.pdf", 0), meta("a.pdf", 5), meta("a.pdf", 0)])
+    assert context == "[Document: a.pdf, Chunk: 0]\nA long passage about retrieval augmented generation."
+    assert stats["chunks_retrieved"] == 3 and stats["blocks"] == 1
+
+def test_blocks_follow_relevance_across_documents():
+    documents = ["Second paper's best chunk.", "First paper's chunk.", "Second paper, next chunk."]
+    context, _ = pack_context(documents, [meta("b.pdf", 3), meta("a.pdf", 9), meta("b.pdf", 4)])
+    labels = [line for line in context.splitlines() if line.startswith("[Document")]
+    assert labels == ["[Document: b.pdf, Chunk: 3-4]", "[Document: a.pdf, Chunk: 9]"]
+
+def test_token_budget_admits_the_most_relevant_chunks_that_fit():
+    documents = [" ".join(["relevant"] * 40), " ".join(["filler"] * 400), " ".join(["small"] * 10)]
+    metadatas = [meta("a.pdf", 0), meta("b.pdf", 0), meta("c.pdf", 0)]
+    context, stats = pack_context(documents, metadatas, max_tokens=120)
+    assert "relevant" in context and "small" in context and "filler" not in context
+    assert count_tokens(context) <= 120 and stats["chunks_used"] == 2
+
+def test_a_single_chunk_over_budget_is_truncated():
+    context, stats = pack_context([" ".join(["word"] * 500)], [meta("a.pdf", 0)], max_tokens=50)
+    assert context.startswith("[Document: a.pdf, Chunk: 0]\nword")
+    assert count_tokens(context) <= 50 and stats["chunks_used"] == 1
+
+def test_empty_chunks_are_ignored():
+    context, stats = pack_context(["", "   ", None], [meta("a.pdf", 0), meta("a.pdf", 1), meta("a.pdf", 2)])
+    assert context == "" and stats["chunks_retrieved"] == 0
+
+def test_summaries_put_document_summaries_first_then_sections_in_order():
+    documents = ["Methods summary.", "Paper summary.", "Intro summary."]
+    metadatas = [{"document_name": "a.pdf", "kind": "section", "position": 1, "section": "Methods"},
+                 {"document_name": "a.pdf", "kind": "document", "position": 0, "section": "Summary"},
+                 {"document_name": "a.pdf", "kind": "section", "position": 0, "section": "Introduction"}]
+    context, stats = pack_summaries(documents, metadatas)
+    assert [line for line in context.splitlines() if line.startswith("[")] == [
+        "[Document: a.pdf, Section: Summary]", "[Document: a.pdf, Section: Introduction]",
+        "[Document: a.pdf, Section: Methods]"]
+    budget = count_tokens("[Document: a.pdf, Section: Summary]\nPaper summary.")
+    context, stats = pack_summaries(documents, metadatas, max_tokens=budget)
+    assert context == "[Document: a.pdf, Section: Summary]\nPaper summary." and stats["chunks_used"] == 1
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from database import document_registry
+from database.document_registry import DocumentRegistry
+
+class FakeStore:
+    """Stands in for iter_metadatas: the chunks' metadata, or an outage."""
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.down = False
+        self.scanning = None
+
+    def __call__(self, client, collection_name, page_size):
+        if self.down:
+            raise ConnectionError("Chroma unavailable")
+        names = list(self.names)
+        if self.scanning is not None:
+            self.scanning()
+        return ({"document_name": name} for name in names)
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(document_registry, "iter_metadatas", store)
+    return store
+
+def test_a_failed_refresh_keeps_the_known_papers(store):
+    store.names = ["a.pdf", "a.pdf", "b.pdf"]
+    registry = DocumentRegistry(lambda: None)
+    assert registry.chunk_counts() == {"a.pdf": 2, "b.pdf": 1}
+    store.down = True
+    registry.refresh()
+    assert registry.match("what does a.pdf say?") == ["a.pdf"]
+
+def test_papers_deleted_elsewhere_stop_matching_after_max_age(store):
+    store.names = ["a.pdf"]
+    registry = DocumentRegistry(lambda: None, max_age=0.05)
+    assert registry.match("summarize a.pdf") == ["a.pdf"]
+    store.names = []  # deleted through another worker
+    time.sleep(0.1)
+    assert registry.match("summarize a.pdf") == []
+
+def test_uploads_during_a_refresh_are_not_lost(store):
+    store.names = ["a.pdf"]
+    registry = DocumentRegistry(lambda: None, max_age=3600)
+    registry.filenames()
+    # The scan started before these writes finished, so it does not see them.
+    store.scanning = lambda: (registry.set("new.pdf", 4), registry.remove("a.pdf"))
+    registry.refresh()
+    assert registry.chunk_counts() == {"new.pdf": 4}
+
+def test_setting_zero_chunks_forgets_the_paper(store):
+    store.names = ["a.pdf"]
+    registry = DocumentRegistry(lambda: None)
+    registry.set("a.pdf", 0)
+    assert registry.filenames() == [] and registry.match("a.pdf") == []
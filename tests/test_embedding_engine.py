@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import utils.embedding
+from config import Config
+from utils.embedding import EmbeddingEngine, get_embedding_engine
+from utils.embedding_cache import EmbeddingCache
+
+def vector_for(text):
+    return [float(len(text)), float(sum(map(ord, text)) % 97)]
+
+class StubOllama:
+    """Serves /api/embed with deterministic vectors; the first `fail_first` requests get `fail_status`."""
+
+    def __init__(self, fail_first=0, fail_status=503):
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests.append(payload)
+                    failing = len(stub.requests) <= stub.fail_first
+                if failing:
+                    body, status = b'{"error": "busy"}', stub.fail_status
+                else:
+                    body, status = json.dumps({"embeddings": [vector_for(t) for t in payload["input"]]}).encode(), 200
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def make_stub():
+    stubs = []
+
+    def make(**kwargs):
+        stubs.append(StubOllama(**kwargs))
+        return stubs[-1]
+
+    yield make
+    for stub in stubs:
+        stub.close()
+
+def test_batches_in_parallel_and_keeps_input_order(make_stub):
+    stub = make_stub()
+    texts = [f"chunk {i}" * (i % 5 + 1) for i in range(23)]
+    engine = EmbeddingEngine(base_url=stub.url, model="m", batch_size=5, concurrency=3, keep_alive=-1)
+    try:
+        assert engine.embed(texts) == [vector_for(t) for t in texts]
+    finally:
+        engine.close()
+    assert sorted(len(r["input"]) for r in stub.requests) == [3, 5, 5, 5, 5]
+    assert all(r["model"] == "m" and r["keep_alive"] == -1 for r in stub.requests)
+
+def test_retries_transient_errors(make_stub):
+    stub = make_stub(fail_first=2)
+    engine = EmbeddingEngine(base_url=stub.url, batch_size=10, max_retries=3, backoff=0.001)
+    try:
+        assert engine.embed(["a", "b"]) == [vector_for("a"), vector_for("b")]
+    finally:
+        engine.close()
+    assert len(stub.requests) == 3
+
+def test_gives_up_after_max_retries_and_on_client_errors(make_stub):
+    stub = make_stub(fail_first=10)
+    engine = EmbeddingEngine(base_url=stub.url, max_retries=2, backoff=0.001)
+    try:
+        with pytest.raises(requests.HTTPError):
+            engine.embed(["a"])
+    finally:
+        engine.close()
+    assert len(stub.requests) == 3
+
+    stub = make_stub(fail_first=10, fail_status=400)
+    engine = EmbeddingEngine(base_url=stub.url, max_retries=2, backoff=0.001)
+    try:
+        with pytest.raises(requests.HTTPError):
+            engine.embed(["a"])
+    finally:
+        engine.close()
+    assert len(stub.requests) == 1
+
+def test_cache_hits_skip_ollama(make_stub, tmp_path):
+    stub = make_stub()
+    path = str(tmp_path / "cache.sqlite3")
+    engine = EmbeddingEngine(base_url=stub.url, model="m", batch_size=4, cache=EmbeddingCache(path))
+    try:
+        stats = {}
+        assert engine.embed(["a", "b", "a"], stats=stats) == [vector_for("a"), vector_for("b"), vector_for("a")]
+        # The repeated "a" is embedded once and served like a cache hit.
+        assert stats == {"cached": 1, "embedded": 2}
+        assert stub.requests[-1]["input"] == ["a", "b"]
+
+        stats = {}
+        assert engine.embed(["b", "c"], stats=stats) == [vector_for("b"), vector_for("c")]
+        assert stats == {"cached": 1, "embedded": 1}
+        assert stub.requests[-1]["input"] == ["c"]
+    finally:
+        engine.close()
+
+    # The cache persists across engines; a fully cached call sends nothing.
+    requests_before = len(stub.requests)
+    engine = EmbeddingEngine(base_url=stub.url, model="m", cache=EmbeddingCache(path))
+    try:
+        assert engine.embed(["a", "c"]) == [vector_for("a"), vector_for("c")]
+    finally:
+        engine.close()
+    assert len(stub.requests) == requests_before
+
+def test_use_cache_false_bypasses_the_cache(make_stub, tmp_path):
+    stub = make_stub()
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    engine = EmbeddingEngine(base_url=stub.url, model="m", cache=cache)
+    try:
+        engine.embed(["question"], use_cache=False)
+        assert cache.get_many([EmbeddingCache.make_key("m", "question")]) == {}
+        engine.embed(["chunk"])
+        engine.embed(["chunk"], use_cache=False)
+    finally:
+        engine.close()
+    assert [r["input"] for r in stub.requests] == [["question"], ["chunk"], ["chunk"]]
+
+def test_a_forked_worker_builds_its_own_engine(monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(utils.embedding, "_engine", None)
+    parent = get_embedding_engine()
+    assert get_embedding_engine() is parent
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    child = get_embedding_engine()
+    assert child is not parent and get_embedding_engine() is child
+    parent.close()
+    child.close()
@@ -0,0 +1,40 @@
+import random
+
+from database.document_registry import DocumentRegistry
+from utils.filename_matcher import AhoCorasick
+
+def naive_find_all(patterns, text):
+    return {value for pattern, value in patterns.items() if pattern and pattern in text}
+
+def test_finds_overlapping_and_nested_patterns():
+    matcher = AhoCorasick({"he": "he", "she": "she", "his": "his", "hers": "hers"})
+    assert matcher.find_all("ushers") == ["she", "he", "hers"]
+    assert matcher.find_all("nothing here") == ["he"]
+    assert matcher.find_all("xyz") == []
+
+def test_reports_each_value_once_in_order_of_first_match():
+    matcher = AhoCorasick({"bert": "bert", "roberta": "roberta"})
+    assert matcher.find_all("roberta beats bert and roberta") == ["bert", "roberta"]
+
+def test_empty_patterns_are_ignored():
+    assert AhoCorasick({"": "empty", "a": "a"}).find_all("banana") == ["a"]
+    assert AhoCorasick({}).find_all("anything") == []
+
+def test_agrees_with_a_naive_scan_on_random_text():
+    rng = random.Random(0)
+    for _ in range(200):
+        patterns = {"".join(rng.choice("ab") for _ in range(rng.randint(1, 4))): i for i in range(5)}
+        text = "".join(rng.choice("abc") for _ in range(30))
+        found = AhoCorasick(patterns).find_all(text)
+        assert len(found) == len(set(found)) and set(found) == naive_find_all(patterns, text)
+
+def test_registry_matches_names_with_and_without_extension():
+    registry = DocumentRegistry(lambda: None, refresh_interval=3600)
+    registry.set("Attention.pdf", 3)
+    registry.set("attention.PDF", 2)
+    registry.set("BERT-paper.pdf", 4)
+    assert registry._match("what does attention say?") == ["Attention.pdf", "attention.PDF"]
+    assert registry._match("Compare bert-paper.pdf and ATTENTION") == ["BERT-paper.pdf", "Attention.pdf", "attention.PDF"]
+    assert registry.match_many(["bert-paper", "nothing"]) == [["BERT-paper.pdf"], []]
+    registry.remove("BERT-paper.pdf")
+    assert registry._match("bert-paper") == []
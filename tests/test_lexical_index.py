@@ -0,0 +1,123 @@
+import os
+import threading
+
+from database.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+def paper(name, texts):
+    index = LexicalIndex()
+    index.add([f"{name}:{i}" for i in range(len(texts))], texts, [name] * len(texts))
+    return index
+
+def ids(results):
+    return [chunk_id for chunk_id, _ in results]
+
+def test_tokenize_drops_stopwords_and_case():
+    assert tokenize("The Transformer is an attention model") == ["transformer", "attention", "model"]
+
+def test_search_ranks_matching_chunks_and_filters_documents():
+    index = LexicalIndex()
+    index.merge(paper("a.pdf", ["attention heads in transformers", "convolutional networks"]))
+    index.merge(paper("b.pdf", ["attention attention everywhere"]))
+    assert ids(index.search("attention"))[0] == "b.pdf:0"
+    assert set(ids(index.search("attention"))) == {"a.pdf:0", "b.pdf:0"}
+    assert ids(index.search("attention", document_names=["a.pdf"])) == ["a.pdf:0"]
+    assert index.search("") == []
+
+def test_merge_replaces_a_documents_chunks_and_remove_drops_them():
+    index = LexicalIndex()
+    index.merge(paper("a.pdf", ["old text about graphs", "more graphs"]))
+    index.merge(paper("a.pdf", ["new text about trees"]))
+    assert ids(index.search("graphs")) == []
+    assert ids(index.search("trees")) == ["a.pdf:0"]
+    assert len(index) == 1
+    assert index.remove_document("a.pdf") == 1
+    assert len(index) == 0 and index.search("trees") == []
+
+def test_reciprocal_rank_fusion_prefers_ids_ranked_by_both():
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "x"]])
+    assert fused[:2] in (["x", "y"], ["y", "x"]) and fused[-1] == "z"
+
+def test_writes_append_deltas_that_other_processes_replay(tmp_path):
+    path = str(tmp_path / "lexical.pkl")
+    writer, reader = LexicalIndex(path), LexicalIndex(path)
+    writer.load()
+    reader.load()
+    with writer.writing() as index:
+        index.merge(paper("a.pdf", ["attention heads"] * 50))
+    journal = writer._journal_path()
+    first_write = os.path.getsize(journal)
+    with writer.writing() as index:
+        index.merge(paper("b.pdf", ["graph kernels"]))
+    # The second write appends only b.pdf, not the whole index again.
+    assert os.path.getsize(journal) - first_write < first_write / 5
+    assert not os.path.exists(path)
+
+    reader.maybe_reload()
+    assert ids(reader.search("graph")) == ["b.pdf:0"]
+    with writer.writing() as index:
+        index.remove_document("a.pdf")
+    reader.maybe_reload()
+    assert reader.search("attention") == [] and len(reader) == 1
+
+def test_compaction_folds_the_journal_into_a_new_snapshot(tmp_path):
+    path = str(tmp_path / "lexical.pkl")
+    writer, reader = LexicalIndex(path), LexicalIndex(path)
+    writer.load()
+    reader.load()
+    with writer.writing() as index:
+        index.merge(paper("a.pdf", ["attention heads", "graph kernels"]))
+        index.merge(paper("b.pdf", ["graph kernels"]))
+    old_journal = writer._journal_path()
+    writer.compact_journal()
+    assert os.path.exists(path) and not os.path.exists(old_journal)
+
+    reader.maybe_reload()
+    assert sorted(ids(reader.search("graph"))) == ["a.pdf:1", "b.pdf:0"]
+    with reader.writing() as index:
+        index.remove_document("b.pdf")
+    fresh = LexicalIndex(path)
+    fresh.load()
+    assert ids(fresh.search("graph")) == ["a.pdf:1"]
+
+def test_large_journal_is_compacted_in_the_background(tmp_path):
+    path = str(tmp_path / "lexical.pkl")
+    index = LexicalIndex(path, compact_min_bytes=0)
+    index.load()
+    with index.writing() as writer:
+        writer.merge(paper("a.pdf", ["attention heads"]))
+    for thread in threading.enumerate():
+        if thread.name == "lexical-compact":
+            thread.join()
+    assert os.path.exists(path) and not os.path.exists(f"{path}.0.journal")
+    fresh = LexicalIndex(path)
+    fresh.load()
+    assert ids(fresh.search("attention")) == ["a.pdf:0"]
+
+def test_a_torn_record_is_ignored_and_overwritten(tmp_path):
+    path = str(tmp_path / "lexical.pkl")
+    index = LexicalIndex(path)
+    index.load()
+    with index.writing() as writer:
+        writer.merge(paper("a.pdf", ["attention heads"]))
+    with open(index._journal_path(), "ab") as f:
+        f.write(b"\xff\x00\x00\x00partial")  # a writer died mid-record
+
+    reader = LexicalIndex(path)
+    reader.load()
+    assert ids(reader.search("attention")) == ["a.pdf:0"]
+    with reader.writing() as writer:
+        writer.merge(paper("b.pdf", ["graph kernels"]))
+    fresh = LexicalIndex(path)
+    fresh.load()
+    assert ids(fresh.search("graph")) == ["b.pdf:0"] and len(fresh) == 2
+
+def test_a_failed_write_is_not_kept_in_memory(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.pkl"))
+    index.load()
+    try:
+        with index.writing() as writer:
+            writer.merge(paper("a.pdf", ["attention heads"]))
+            raise RuntimeError("ingest failed")
+    except RuntimeError:
+        pass
+    assert len(index) == 0
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from database.local_index import LocalVectorClient
+
+DIM = 16
+
+def rows(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+def fill(collection, name, vectors, start=0):
+    ids = [f"{name}:{start + i}" for i in range(len(vectors))]
+    collection.upsert(ids=ids, embeddings=vectors.tolist(), documents=[f"text {i}" for i in ids],
+                      metadatas=[{"document_name": name, "chunk_id": start + i} for i in range(len(vectors))])
+    return ids
+
+def brute_force(vectors, ids, query, k):
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    return [ids[i] for i in np.argsort(distances)[:k]]
+
+@pytest.fixture
+def client(tmp_path):
+    return LocalVectorClient(str(tmp_path), ivf_min_rows=1 << 30)
+
+def test_query_matches_brute_force_and_reports_squared_l2(client):
+    collection = client.get_or_create_collection("papers")
+    vectors = rows(300)
+    ids = fill(collection, "a.pdf", vectors)
+    query = rows(1, seed=1)[0]
+    result = collection.query(query_embeddings=[query.tolist()], n_results=5)
+    assert result["ids"][0] == brute_force(vectors, ids, query, 5)
+    expected = ((vectors[ids.index(result["ids"][0][0])] - query) ** 2).sum()
+    assert result["distances"][0][0] == pytest.approx(expected, rel=1e-5)
+    assert result["documents"][0][0] == f"text {result['ids'][0][0]}"
+
+def test_ivf_segments_find_the_nearest_rows(tmp_path):
+    collection = LocalVectorClient(str(tmp_path), ivf_min_rows=100, nprobe=64).get_or_create_collection("papers")
+    vectors = rows(400)
+    ids = fill(collection, "a.pdf", vectors)
+    assert collection._segments[0][1].ivf is not None
+    for query in vectors[:10]:
+        assert collection.query(query_embeddings=[query.tolist()], n_results=1)["ids"][0][0] == brute_force(vectors, ids, query, 1)[0]
+
+def test_upsert_replaces_ids_and_get_filters_by_document(client):
+    collection = client.get_or_create_collection("papers")
+    fill(collection, "a.pdf", rows(5))
+    fill(collection, "b.pdf", rows(3, seed=2))
+    collection.upsert(ids=["a.pdf:0"], embeddings=rows(1, seed=3).tolist(), documents=["new text"],
+                      metadatas=[{"document_name": "a.pdf", "chunk_id": 0}])
+    assert collection.count() == 8
+    assert collection.get(ids=["a.pdf:0", "missing"])["documents"] == ["new text"]
+    assert sorted(collection.get(where={"document_name": "b.pdf"})["ids"]) == ["b.pdf:0", "b.pdf:1", "b.pdf:2"]
+    assert len(collection.get(where={"document_name": {"$in": ["a.pdf", "b.pdf"]}}, limit=4, offset=2)["ids"]) == 4
+    with pytest.raises(ValueError):
+        collection.get(where={"section": "Methods"})
+
+def test_add_keeps_existing_ids(client):
+    collection = client.get_or_create_collection("papers")
+    fill(collection, "a.pdf", rows(2))
+    collection.add(ids=["a.pdf:0", "a.pdf:9"], embeddings=rows(2, seed=4).tolist(), documents=["changed", "added"],
+                   metadatas=[{"document_name": "a.pdf"}] * 2)
+    assert collection.get(ids=["a.pdf:0", "a.pdf:9"])["documents"] == ["text a.pdf:0", "added"]
+
+def test_delete_by_document_and_filtered_query(client):
+    collection = client.get_or_create_collection("papers")
+    fill(collection, "a.pdf", rows(20))
+    fill(collection, "b.pdf", rows(20, seed=5))
+    collection.delete(where={"document_name": "a.pdf"})
+    assert collection.count() == 20
+    query = rows(1, seed=6)[0].tolist()
+    assert all(i.startswith("b.pdf") for i in collection.query(query_embeddings=[query], n_results=5)["ids"][0])
+    collection.delete(ids=["b.pdf:0"])
+    assert collection.get(ids=["b.pdf:0"])["ids"] == []
+    filtered = collection.query(query_embeddings=[query], n_results=50, where={"document_name": "b.pdf"})
+    assert len(filtered["ids"][0]) == 19
+
+def test_small_segments_are_compacted(tmp_path):
+    collection = LocalVectorClient(str(tmp_path), max_segments=3).get_or_create_collection("papers")
+    for batch in range(10):
+        fill(collection, f"p{batch}.pdf", rows(4, seed=batch))
+    assert len(collection._segments) <= 3
+    assert collection.count() == 40
+    collection.delete(where={"document_name": {"$in": [f"p{batch}.pdf" for batch in range(8)]}})
+    assert collection.count() == 8
+    assert all(segment.alive_count * 3 >= len(segment) * 2 for _, segment in collection._segments)
+
+def test_collections_persist_and_other_clients_see_writes(tmp_path):
+    writer = LocalVectorClient(str(tmp_path)).get_or_create_collection("papers")
+    fill(writer, "a.pdf", rows(5))
+    reader_client = LocalVectorClient(str(tmp_path))
+    reader = reader_client.get_collection("papers")
+    assert reader.count() == 5
+    fill(writer, "b.pdf", rows(2, seed=7))
+    assert reader.count() == 7
+    assert reader_client.list_collections() == ["papers"]
+    reader_client.delete_collection("papers")
+    with pytest.raises(ValueError):
+        reader_client.get_collection("papers")
+
+def test_writers_never_commit_from_a_stale_view(tmp_path, monkeypatch):
+    from database import local_index
+
+    # A filesystem whose timestamps (and reused inodes) make every manifest version look alike.
+    monkeypatch.setattr(local_index, "_file_id", lambda stat: (0, 0, 0))
+    first = LocalVectorClient(str(tmp_path), max_segments=1).get_or_create_collection("papers")
+    second = LocalVectorClient(str(tmp_path), max_segments=1).get_or_create_collection("papers")
+    fill(first, "a.pdf", rows(3))
+    fill(second, "b.pdf", rows(3, seed=1))
+    fill(first, "c.pdf", rows(3, seed=2))
+    monkeypatch.undo()
+    fresh = LocalVectorClient(str(tmp_path)).get_collection("papers")
+    assert sorted({meta["document_name"] for meta in fresh.get()["metadatas"]}) == ["a.pdf", "b.pdf", "c.pdf"]
+
+def test_commit_refuses_a_manifest_changed_by_another_writer(client):
+    collection = client.get_or_create_collection("papers")
+    fill(collection, "a.pdf", rows(3))
+    collection._generation -= 1
+    with pytest.raises(RuntimeError):
+        collection._commit(collection._segments)
@@ -0,0 +1,41 @@
+import pytest
+from flask import Flask
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+
+from api import endpoint
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(endpoint, "_logs_db", lambda: None)
+    app = Flask(__name__)
+    app.register_blueprint(endpoint.api, url_prefix="/api")
+    return app.test_client()
+
+def fail_with(error):
+    def fail(*args, **kwargs):
+        raise error
+    return fail
+
+def test_stats_report_an_unavailable_mongodb_as_json(client, monkeypatch):
+    monkeypatch.setattr(endpoint, "aggregate_log_stats", fail_with(ServerSelectionTimeoutError("no servers")))
+    response = client.get("/api/logs/stats")
+    assert response.status_code == 503
+    assert response.get_json()["success"] is False
+
+def test_stats_report_a_server_without_percentile(client, monkeypatch):
+    error = OperationFailure("Unknown group operator '$percentile'", code=15952)
+    monkeypatch.setattr(endpoint, "aggregate_log_stats", fail_with(error))
+    response = client.get("/api/logs/stats?bucket=day")
+    assert response.status_code == 501
+    assert "7.0" in response.get_json()["msg"]
+
+def test_logs_report_an_unavailable_mongodb_as_json(client, monkeypatch):
+    class FailingCursor:
+        def __iter__(self):
+            raise ServerSelectionTimeoutError("no servers")
+
+    monkeypatch.setattr(endpoint, "iter_logs", lambda *args, **kwargs: FailingCursor())
+    response = client.get("/api/logs")
+    assert response.status_code == 503 and response.get_json()["success"] is False
+    lines = client.get("/api/logs?format=ndjson").get_data(as_text=True).splitlines()
+    assert '"success": false' in lines[-1]
@@ -0,0 +1,128 @@
+import glob
+import os
+import threading
+import time
+
+import mongomock
+
+from database.log_sink import BufferedLogSink
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+class FlakyCollection:
+    """A mongomock collection whose writes fail while `down` is set."""
+
+    def __init__(self):
+        self.collection = mongomock.MongoClient().db.logs
+        self.down = threading.Event()
+
+    def __call__(self):
+        if self.down.is_set():
+            raise ConnectionError("MongoDB unavailable")
+        return self.collection
+
+def test_entries_are_written_in_batches(tmp_path):
+    target = FlakyCollection()
+    sink = BufferedLogSink(target, batch_size=10, flush_interval=0.05, spill_dir=str(tmp_path))
+    for i in range(25):
+        assert sink.submit({"question": f"q{i}"})
+    wait_for(lambda: sink.stats()["written"] == 25)
+    sink.close()
+    assert sorted(doc["question"] for doc in target.collection.find()) == sorted(f"q{i}" for i in range(25))
+    assert sink.stats()["write_errors"] == 0
+
+def test_a_full_queue_drops_instead_of_blocking(tmp_path):
+    release = threading.Event()
+
+    def blocked():
+        release.wait(5)
+        return mongomock.MongoClient().db.logs
+
+    sink = BufferedLogSink(blocked, max_queue=2, batch_size=1, flush_interval=0.01, spill_dir=str(tmp_path))
+    results = [sink.submit({"n": i}) for i in range(10)]
+    release.set()
+    sink.close()
+    assert results.count(False) == sink.stats()["dropped"] > 0
+
+def test_failed_writes_spill_and_are_replayed_when_mongodb_is_back(tmp_path):
+    target = FlakyCollection()
+    target.down.set()
+    sink = BufferedLogSink(target, batch_size=5, flush_interval=0.02, spill_dir=str(tmp_path), replay_interval=0.05)
+    for i in range(7):
+        sink.submit({"question": f"q{i}"})
+    wait_for(lambda: sink.stats()["spilled"] == 7)
+    assert glob.glob(os.path.join(str(tmp_path), "spill-*.jsonl"))
+    assert target.collection.count_documents({}) == 0
+
+    target.down.clear()
+    wait_for(lambda: sink.stats()["replayed"] == 7)
+    sink.close()
+    assert sorted(doc["question"] for doc in target.collection.find()) == sorted(f"q{i}" for i in range(7))
+    assert not os.listdir(str(tmp_path))
+
+def test_close_flushes_queued_entries(tmp_path):
+    target = FlakyCollection()
+    sink = BufferedLogSink(target, batch_size=100, flush_interval=0.5, spill_dir=str(tmp_path))
+    sink.submit({"question": "last words"})
+    sink.close()
+    assert target.collection.count_documents({"question": "last words"}) == 1
+
+class PartlyFailingCollection:
+    """Stores every entry but those whose question is in `reject`, then raises a BulkWriteError like MongoDB."""
+
+    def __init__(self):
+        self.collection = mongomock.MongoClient().db.logs
+        self.reject = set()
+
+    def __call__(self):
+        return self
+
+    def insert_many(self, batch, ordered=True):
+        from pymongo.errors import BulkWriteError
+
+        errors = []
+        for i, entry in enumerate(batch):
+            if entry["question"] in self.reject:
+                errors.append({"index": i, "code": 121, "errmsg": "Document failed validation"})
+            elif self.collection.count_documents({"_id": entry["_id"]}):
+                errors.append({"index": i, "code": 11000, "errmsg": "E11000 duplicate key error"})
+            else:
+                self.collection.insert_one(dict(entry))
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(batch) - len(errors)})
+
+def test_only_the_failed_entries_of_a_partial_write_are_spilled_and_replayed_once(tmp_path):
+    target = PartlyFailingCollection()
+    target.reject = {"q1"}
+    sink = BufferedLogSink(target, batch_size=3, flush_interval=0.02, spill_dir=str(tmp_path), replay_interval=3600)
+    sink._last_replay = time.monotonic()
+    for i in range(3):
+        sink.submit({"question": f"q{i}"})
+    wait_for(lambda: sink.stats()["spilled"] == 1)
+    assert sink.stats()["written"] == 2
+
+    target.reject = set()
+    sink._replay_spills()
+    sink.close()
+    assert sorted(doc["question"] for doc in target.collection.find()) == ["q0", "q1", "q2"]
+    assert sink.stats()["replayed"] == 1 and not os.listdir(str(tmp_path))
+
+def test_replay_skips_entries_that_were_already_stored(tmp_path):
+    from bson import ObjectId, json_util
+
+    target = PartlyFailingCollection()
+    stored = {"_id": ObjectId(), "question": "landed before the error"}
+    target.collection.insert_one(dict(stored))
+    with open(os.path.join(str(tmp_path), "spill-1.jsonl"), "w") as f:
+        for entry in (stored, {"_id": ObjectId(), "question": "never stored"}):
+            f.write(json_util.dumps(entry) + "\n")
+    sink = BufferedLogSink(target, spill_dir=str(tmp_path), replay_interval=3600)
+    sink._replay_spills()
+    sink.close()
+    assert sorted(doc["question"] for doc in target.collection.find()) == ["landed before the error", "never stored"]
+    assert not os.listdir(str(tmp_path))
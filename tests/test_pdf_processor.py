@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from utils.pdf_processor import chunk_pages_with_metadata, chunk_text_with_metadata
+
+def random_pages(rng, count):
+    words = ["alpha", "beta", "gamma", "delta", "  ", "\n"]
+    return [(number, "".join(rng.choice(words) + " " for _ in range(rng.randint(0, 120)))) for number in range(1, count + 1)]
+
+@pytest.mark.parametrize("chunk_size,overlap", [(1000, 200), (50, 0), (64, 63), (7, 3)])
+def test_streaming_chunks_equal_chunking_the_joined_text(chunk_size, overlap):
+    rng = random.Random(chunk_size)
+    for _ in range(20):
+        pages = random_pages(rng, rng.randint(1, 6))
+        expected = chunk_text_with_metadata("\n".join(text for _, text in pages), "p.pdf", chunk_size, overlap)
+        streamed = list(chunk_pages_with_metadata(iter(pages), "p.pdf", chunk_size, overlap))
+        assert [c["text"] for c in streamed] == [c["text"] for c in expected]
+        assert [c["metadata"]["chunk_id"] for c in streamed] == [c["metadata"]["chunk_id"] for c in expected]
+
+def test_chunks_record_the_pages_they_span():
+    pages = [(1, "a" * 10), (2, "b" * 10), (3, "c" * 10)]
+    chunks = list(chunk_pages_with_metadata(pages, "p.pdf", chunk_size=8, overlap=0))
+    # Joined text: 10 a's, "\n" + 10 b's, "\n" + 10 c's; the newline belongs to the next page.
+    spans = [(c["metadata"]["page_start"], c["metadata"]["page_end"]) for c in chunks]
+    assert spans == [(1, 1), (1, 2), (2, 3), (3, 3)]
+    assert chunks[1]["text"] == "aa\nbbbbb"
+
+def test_whitespace_only_chunks_are_skipped_but_keep_their_ids():
+    chunks = list(chunk_pages_with_metadata([(1, "x" * 4 + " " * 8 + "y" * 4)], "p.pdf", chunk_size=4, overlap=0))
+    assert [(c["metadata"]["chunk_id"], c["text"]) for c in chunks] == [(0, "xxxx"), (3, "yyyy")]
+
+def test_overlap_must_be_smaller_than_chunk_size():
+    with pytest.raises(ValueError):
+        list(chunk_pages_with_metadata([(1, "text")], "p.pdf", chunk_size=10, overlap=10))
@@ -0,0 +1,178 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import singleflight
+from utils.singleflight import AsyncSingleFlight, SingleFlight
+
+def test_concurrent_callers_share_one_call(monkeypatch):
+    group, release, calls, coalesced = SingleFlight("test"), threading.Event(), [], []
+    monkeypatch.setattr(singleflight, "record_coalesced", coalesced.append)
+
+    def compute(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(group.do, "k", compute, 21)
+        while not calls:
+            pass
+        followers = [pool.submit(group.do, "k", compute, 21) for _ in range(3)]
+        while len(coalesced) < 3:  # every follower has joined the leader's call
+            pass
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+    assert results == [42] * 4
+    assert calls == [21]
+    assert coalesced == ["test"] * 3
+
+def test_errors_are_shared_and_keys_are_not_cached():
+    group = SingleFlight("test")
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        group.do("k", fail)
+    assert group.do("k", lambda: "fresh") == "fresh"
+    assert group.do("k", lambda: "again") == "again"
+
+def test_late_stream_subscribers_replay_earlier_items():
+    group, pulled = SingleFlight("test"), []
+
+    def produce():
+        for i in range(4):
+            pulled.append(i)
+            yield i
+
+    first = group.stream("k", produce)
+    assert [next(first), next(first)] == [0, 1]
+    second = group.stream("k", produce)
+    assert list(second) == [0, 1, 2, 3]
+    assert list(first) == [2, 3]
+    assert pulled == [0, 1, 2, 3]
+    # Finished streams are forgotten: the next caller starts a new one.
+    assert list(group.stream("k", produce)) == [0, 1, 2, 3]
+
+def test_stream_stops_when_every_subscriber_leaves():
+    group, closed = SingleFlight("test"), []
+
+    def produce():
+        try:
+            for i in range(100):
+                yield i
+        finally:
+            closed.append(True)
+
+    stream = group.stream("k", produce)
+    assert next(stream) == 0
+    stream.close()
+    assert closed == [True]
+    assert next(group.stream("k", produce)) == 0
+
+def test_async_do_shares_one_task_and_survives_a_cancelled_caller():
+    group, calls = AsyncSingleFlight("test"), []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(group.do("k", compute))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(group.do("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "done"
+    assert calls == [1]
+
+def test_async_stream_broadcasts_items():
+    group = AsyncSingleFlight("test")
+
+    async def produce():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield i
+
+    async def collect(stream):
+        return [item async for item in stream]
+
+    async def main():
+        return await asyncio.gather(collect(group.stream("k", produce)), collect(group.stream("k", produce)))
+
+    assert asyncio.run(main()) == [[0, 1, 2], [0, 1, 2]]
+
+def test_a_subscriber_that_joined_keeps_the_stream_alive_when_the_first_leaves():
+    group, closed = SingleFlight("test"), []
+
+    def produce():
+        try:
+            yield from range(4)
+        finally:
+            closed.append(True)
+
+    first = group.stream("k", produce)
+    assert next(first) == 0
+    second = group.stream("k", produce)
+    first.close()
+    assert list(second) == [0, 1, 2, 3]
+    assert closed == [True]
+
+def test_joining_during_abandonment_starts_a_new_stream():
+    group, late = SingleFlight("test"), []
+
+    def produce():
+        try:
+            yield from range(4)
+        finally:
+            if not late:
+                # Runs while the abandoned stream is being stopped.
+                late.append(group.stream("k", produce))
+
+    first = group.stream("k", produce)
+    assert [next(first), next(first)] == [0, 1]
+    first.close()
+    assert list(late[0]) == [0, 1, 2, 3]
+
+def test_async_stream_joined_during_abandonment_is_not_cut_off():
+    group = AsyncSingleFlight("test")
+
+    async def produce():
+        for i in range(4):
+            await asyncio.sleep(0.001)
+            yield f"t{i} "
+
+    async def main():
+        first = group.stream("k", produce)
+        head = [await anext(first), await anext(first)]
+        await first.aclose()
+        # The cancelled task has not finished yet: the joiner must get a new stream, not the partial one.
+        late = [token async for token in group.stream("k", produce)]
+        return head, late
+
+    head, late = asyncio.run(main())
+    assert head == ["t0 ", "t1 "]
+    assert late == ["t0 ", "t1 ", "t2 ", "t3 "]
+
+def test_async_subscriber_that_joined_keeps_the_stream_alive():
+    group = AsyncSingleFlight("test")
+
+    async def produce():
+        for i in range(3):
+            await asyncio.sleep(0.001)
+            yield i
+
+    async def main():
+        first = group.stream("k", produce)
+        await anext(first)
+        second = group.stream("k", produce)
+        await first.aclose()
+        return [item async for item in second]
+
+    assert asyncio.run(main()) == [0, 1, 2]